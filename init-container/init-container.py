@@ -1,40 +1,122 @@
 import argparse
-from time import sleep
+import fcntl
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from time import monotonic, sleep, time
 import git
 import logging
 import os
 import sys
+import tarfile
 from urllib.parse import urlparse
+from urllib.request import urlopen
 from git.util import rmtree
 
 from vcl_utils.logging import configure_logging
 
-
 try:
     WS_PUID = int(os.environ["WS_PUID"])
     WS_PGID = int(os.environ["WS_PGID"])
 except (TypeError, KeyError):
     raise Exception("WS_PUID and WS_PGID env variables must be defined.")
 
+CHOWN_WORKERS = int(os.environ.get("CHOWN_WORKERS", 8))
+# Read by the kubelet once the container terminates, see `write_telemetry`.
+TERMINATION_MESSAGE_PATH = os.environ.get("TERMINATION_MESSAGE_PATH", "/dev/termination-log")
+
 configure_logging(app_name="init-container")
 logger = logging.getLogger(__name__)
 
+# Phase durations (seconds) and sizes of this run, to tell where slow launches spend their time.
+telemetry = {"source": None, "phases": {}, "bytes": 0, "files": 0, "chowned": 0}
+
+
+@contextmanager
+def phase(name):
+    started_at = monotonic()
+    try:
+        yield
+    finally:
+        telemetry["phases"][name] = round(telemetry["phases"].get(name, 0) + monotonic() - started_at, 3)
+
+
+def write_telemetry():
+    """
+    Write the telemetry as the termination message of the container, the k8s-watcher
+    forwards it to the web service once the workspace starts.
+    """
+    record = json.dumps(telemetry, separators=(",", ":"))
+    logger.info(f"Telemetry: {record}")
+    try:
+        with open(TERMINATION_MESSAGE_PATH, "w") as f:
+            f.write(record)
+    except OSError as exc:
+        logger.warning(f"Failed to write the termination message: {exc}")
+
+
+def _chown_entry(entry, puid, pgid):
+    # Entries already owned by the workspace user, e.g. on returning learner volumes, are left alone.
+    stat = entry.stat(follow_symlinks=False)
+    if stat.st_uid == puid and stat.st_gid == pgid:
+        return 0
+    os.chown(entry.path, puid, pgid, follow_symlinks=False)
+    return 1
+
+
+def _chown_tree(path, puid, pgid):
+    """
+    Returns the number of entries under the path and of entries whose owner changed.
+    """
+    count = changed = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            count += 1
+            changed += _chown_entry(entry, puid, pgid)
+            if entry.is_dir(follow_symlinks=False):
+                subtree_count, subtree_changed = _chown_tree(entry.path, puid, pgid)
+                count += subtree_count
+                changed += subtree_changed
+    return count, changed
+
 
 def chown(path, puid=WS_PUID, pgid=WS_PGID, recursive=True):
-    os.chown(path, puid, pgid)
-    if not recursive:
-        return
-    for root, dirs, files in os.walk(path):
-        for dir in dirs:
-            os.chown(os.path.join(root, dir), puid, pgid)
-        for file in files:
-            os.chown(os.path.join(root, file), puid, pgid)
+    started_at = monotonic()
+    stat = os.stat(path)
+    count, changed = 1, 0
+    if stat.st_uid != puid or stat.st_gid != pgid:
+        os.chown(path, puid, pgid)
+        changed += 1
+
+    if recursive:
+        subtrees = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                count += 1
+                changed += _chown_entry(entry, puid, pgid)
+                if entry.is_dir(follow_symlinks=False):
+                    subtrees.append(entry.path)
+        # Chown is bound by filesystem calls, the top level subtrees are walked in parallel.
+        with ThreadPoolExecutor(max_workers=CHOWN_WORKERS) as executor:
+            for subtree_count, subtree_changed in executor.map(
+                lambda subtree: _chown_tree(subtree, puid, pgid), subtrees
+            ):
+                count += subtree_count
+                changed += subtree_changed
+
+    duration = monotonic() - started_at
+    telemetry["phases"]["chown"] = round(telemetry["phases"].get("chown", 0) + duration, 3)
+    telemetry["chowned"] += changed
+    logger.info(f"Changed the owner of {changed} out of {count} entries of {path} in {duration:.2f}s.")
+    return count
 
 
 def create_directory(path, user_accessible=False):
     logger.info(f"Creating directory {path}.")
     if not os.path.exists(path):
-        os.makedirs(path)
+        with phase("create_directories"):
+            os.makedirs(path)
         logger.info(f"{path} directory created.")
     else:
         logger.info(f"Directory {path} already exist. Skipping.")
@@ -59,19 +141,124 @@ def reset_repo(folder):
     local_repo.git.commit("-m", "Happy coding!")
 
 
-def checkout_repo(repo_url, folder, gh_token=None):
+class CountingReader:
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.count = 0
 
-    if os.path.exists(folder):
-        # skip the checkout if directory is non-empty
-        if os.path.isdir(folder) and len(os.listdir(folder)) > 0:
-            logger.info(f"Skipping checkout as the folder '{folder}' is not empty.")
-            return
-    else:
-        create_directory(folder, user_accessible=True)
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.count += len(data)
+        return data
 
-    logger.info(f"Cloning repo {repo_url} into {folder}.")
+
+def extract_artifact(artifact_url, folder):
+    """
+    Stream the assignment artifact into the folder, it's already reset to a single commit
+    and owned by the workspace user.
+    """
+    with urlopen(artifact_url, timeout=60) as response:
+        reader = CountingReader(response)
+        with tarfile.open(fileobj=reader, mode="r|gz") as tar:
+            files = 0
+            for member in tar:
+                tar.extract(member, folder, numeric_owner=True)
+                files += 1
+    telemetry["bytes"] = reader.count
+    telemetry["files"] = files
+
+
+def get_repo_size(folder):
+    # Bytes of git objects cloned, mostly a few pack files.
+    size = 0
+    for root, dirs, files in os.walk(os.path.join(folder, ".git", "objects")):
+        size += sum(os.path.getsize(os.path.join(root, file)) for file in files)
+    return size
+
+
+def empty_directory(path):
+    for name in os.listdir(path):
+        child = os.path.join(path, name)
+        if os.path.isdir(child) and not os.path.islink(child):
+            rmtree(child)
+        else:
+            os.remove(child)
+
+
+def fetch_mirror(mirror, repo_url):
+    head = mirror.git.ls_remote("--symref", repo_url, "HEAD")
+    mirror.git.fetch("--prune", repo_url, "+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*")
+    # Clones from the mirror checkout its HEAD, keep it on the default branch of the repo.
+    if head.startswith("ref: "):
+        mirror.git.symbolic_ref("HEAD", head.split()[1])
+
+
+def update_mirror(repo_url, cache_folder, max_age, gh_token=None):
+    """
+    Bare mirror of the repo in the node cache, fetched when older than `max_age` seconds.
+    Mirrors are fetched by URL and keep no remote, so the access token is never stored.
+    """
+    path = os.path.join(cache_folder, hashlib.sha256(repo_url.encode()).hexdigest() + ".git")
+    # Init containers of the node share the cache, only one of them updates a mirror at a time.
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        fetched_at = os.path.join(path, "FETCH_HEAD")
+        if os.path.exists(fetched_at) and time() - os.path.getmtime(fetched_at) < max_age:
+            logger.info(f"Using mirror {path} of repo {repo_url}.")
+            return path
+
+        logger.info(f"Fetching repo {repo_url} into mirror {path}.")
+        mirror = git.Repo.init(path, bare=True)
+        try:
+            fetch_mirror(mirror, repo_url)
+        except git.exc.GitCommandError:
+            if not gh_token:
+                raise
+            fetch_mirror(mirror, make_private_repo_url(repo_url, gh_token))
+    return path
+
+
+def get_clone_options(ref=None, subdirectory=None, shallow=True, blob_filter=None):
+    options = []
+    if shallow:
+        # The history is dropped by `reset_repo` anyway.
+        options += ["--depth=1", "--single-branch"]
+    if ref:
+        options.append(f"--branch={ref}")
+    if blob_filter:
+        options.append(f"--filter={blob_filter}")
+    if subdirectory:
+        options.append("--no-checkout")
+    return options
+
+
+def sparse_checkout(folder, subdirectory):
+    """
+    Checkout only the subdirectory of the cloned repo, its content becomes the content of the folder.
+    """
+    subdirectory = subdirectory.strip("/")
+    repo = git.Repo(folder)
+    repo.git.config("core.sparseCheckout", "true")
+    with open(os.path.join(folder, ".git", "info", "sparse-checkout"), "w") as f:
+        f.write(f"/{subdirectory}/\n")
+    repo.git.read_tree("-mu", "HEAD")
+
+    top, _, rest = subdirectory.partition("/")
+    if not os.path.isdir(os.path.join(folder, subdirectory)):
+        logger.error(f"No folder '{subdirectory}' in the repo, cannot checkout it.")
+        sys.exit(1)
+    # Moved aside first, the subdirectory may contain an entry with the same name as its top folder.
+    sparse_folder = os.path.join(folder, ".sparse-checkout")
+    os.rename(os.path.join(folder, top), sparse_folder)
+    source = os.path.join(sparse_folder, rest)
+    for name in os.listdir(source):
+        os.rename(os.path.join(source, name), os.path.join(folder, name))
+    rmtree(sparse_folder)
+
+
+def clone_repo(repo_url, folder, gh_token=None, options=None):
     try:
-        git.Repo.clone_from(repo_url, folder)
+        git.Repo.clone_from(repo_url, folder, multi_options=options)
     except git.exc.GitCommandError:
         logger.info("Detected private repo")
         # Might be a private repo
@@ -79,12 +266,79 @@ def checkout_repo(repo_url, folder, gh_token=None):
             logger.error("Missing GitHub access token, cannot checkout private repo.")
             sys.exit(1)
         private_url = make_private_repo_url(repo_url, gh_token)
-        git.Repo.clone_from(private_url, folder)
+        git.Repo.clone_from(private_url, folder, multi_options=options)
+
+
+def checkout_repo(
+    repo_url,
+    folder,
+    gh_token=None,
+    mirror_cache_folder=None,
+    mirror_max_age=0,
+    artifact_url=None,
+    ref=None,
+    subdirectory=None,
+    shallow=True,
+    blob_filter=None,
+):
+
+    if os.path.exists(folder):
+        # skip the checkout if directory is non-empty
+        if os.path.isdir(folder) and len(os.listdir(folder)) > 0:
+            logger.info(f"Skipping checkout as the folder '{folder}' is not empty.")
+            telemetry["source"] = "existing"
+            return
+    else:
+        create_directory(folder, user_accessible=True)
+
+    started_at = monotonic()
+    if artifact_url:
+        # The URL is presigned, don't log it.
+        logger.info(f"Extracting the artifact of repo {repo_url} into {folder}.")
+        try:
+            with phase("download"):
+                extract_artifact(artifact_url, folder)
+        except (OSError, tarfile.TarError) as exc:
+            logger.warning(f"Failed to extract the artifact of repo {repo_url}, cloning it: {exc}")
+            empty_directory(folder)
+        else:
+            telemetry["source"] = "artifact"
+            logger.info(f"Extracted repo {repo_url} into {folder} in {monotonic() - started_at:.1f}s.")
+            return
+
+    # Folders seeded from a golden snapshot skip the checkout, this one is the slow fallback.
+    logger.info(f"Cloning repo {repo_url} into {folder}.")
+    mirror = None
+    if mirror_cache_folder:
+        try:
+            with phase("mirror"):
+                mirror = update_mirror(repo_url, mirror_cache_folder, mirror_max_age, gh_token=gh_token)
+        except (OSError, git.exc.GitCommandError) as exc:
+            logger.warning(f"Failed to update the mirror of repo {repo_url}, cloning it directly: {exc}")
+
+    options = get_clone_options(ref=ref, subdirectory=subdirectory, shallow=shallow, blob_filter=blob_filter)
+    with phase("clone"):
+        if mirror:
+            try:
+                # A local copy, through file:// since git ignores --depth for plain paths.
+                git.Repo.clone_from(f"file://{mirror}", folder, multi_options=options)
+            except git.exc.GitCommandError as exc:
+                logger.warning(f"Failed to clone the mirror of repo {repo_url}, cloning it directly: {exc}")
+                empty_directory(folder)
+                mirror = None
+        if not mirror:
+            clone_repo(repo_url, folder, gh_token=gh_token, options=options)
+        if subdirectory:
+            sparse_checkout(folder, subdirectory)
+    telemetry["source"] = "mirror" if mirror else "clone"
+    telemetry["bytes"] = get_repo_size(folder)
 
     # Sharing .git folder would share the git auth token
     # and would allow workspace users to push to private folders
-    reset_repo(folder)
-    chown(folder)
+    with phase("reset"):
+        reset_repo(folder)
+    telemetry["files"] = chown(folder)
+    logger.info(f"Checked out repo {repo_url} into {folder} in {monotonic() - started_at:.1f}s.")
 
 
 if __name__ == "__main__":
@@ -107,6 +361,43 @@ if __name__ == "__main__":
         default=os.environ.get("GH_ACCESS_TOKEN"),
         help="GitHub access token for the private repo",
     )
+    parser.add_argument(
+        "--mirror-cache",
+        default=os.environ.get("GIT_MIRROR_CACHE"),
+        help="Folder shared by the init containers of the node to keep repo mirrors in",
+    )
+    parser.add_argument(
+        "--mirror-max-age",
+        type=int,
+        default=int(os.environ.get("GIT_MIRROR_MAX_AGE", 300)),
+        help="Seconds after which a repo mirror is fetched again",
+    )
+    parser.add_argument(
+        "--ref",
+        default=os.environ.get("ASSIGNMENT_REF"),
+        help="Branch or tag to checkout, the default branch of the repo if not set",
+    )
+    parser.add_argument(
+        "--subdirectory",
+        default=os.environ.get("ASSIGNMENT_SUBDIRECTORY"),
+        help="Only checkout this folder of the repo, as the assignment folder",
+    )
+    parser.add_argument(
+        "--shallow",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Only clone the latest commit of the repo",
+    )
+    parser.add_argument(
+        "--blob-filter",
+        default=os.environ.get("GIT_BLOB_FILTER"),
+        help="Partial clone filter, e.g. 'blob:limit=1m'",
+    )
+    parser.add_argument(
+        "--artifact-url",
+        default=os.environ.get("ASSIGNMENT_ARTIFACT_URL"),
+        help="URL of the pre-built tarball of the repo, extracted instead of cloning it",
+    )
 
     args = parser.parse_args()
 
@@ -121,10 +412,21 @@ if __name__ == "__main__":
         "coder_configs": {"path": os.environ.get("CODER_CONFIG_FOLDER", "/home/coder/.config")},
     }
 
-    create_directory(folders["home"]["path"], user_accessible=True)
+    try:
+        with phase("total"):
+            create_directory(folders["home"]["path"], user_accessible=True)
 
-    checkout_repo(
-        args.repo,
-        folders["assignment"]["path"],
-        gh_token=args.gh_token,
-    )
+            checkout_repo(
+                args.repo,
+                folders["assignment"]["path"],
+                gh_token=args.gh_token,
+                mirror_cache_folder=args.mirror_cache,
+                mirror_max_age=args.mirror_max_age,
+                artifact_url=args.artifact_url,
+                ref=args.ref,
+                subdirectory=args.subdirectory,
+                shallow=args.shallow,
+                blob_filter=args.blob_filter,
+            )
+    finally:
+        write_telemetry()
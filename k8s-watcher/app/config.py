@@ -1,3 +1,4 @@
+import socket
 from dataclasses import dataclass
 
 from vcl_utils.env import Env
@@ -10,4 +11,24 @@ class Settings:
     APP_ENV = Env.str("ENVIRONMENT", default="DEV")
     WORKSPACES_CLUSTER_NAME = Env.str("WORKSPACES_CLUSTER_NAME")
     WORKSPACES_NAMESPACE_PREFIX = Env.str("WORKSPACES_NAMESPACE_PREFIX", default="wa-")
+    # Seconds between two logs of the pod cache (size, events, relists and staleness) and publisher
+    # (queue depth and publish latency) stats.
+    STATS_INTERVAL = int(Env.str("STATS_INTERVAL", default="60"))
+    # Messages waiting to be published, and what to do with new ones once full: "block" the
+    # watch for a while, "drop" them or "spill" them to PUBLISHER_SPILL_PATH.
+    PUBLISHER_QUEUE_SIZE = int(Env.str("PUBLISHER_QUEUE_SIZE", default="10000"))
+    PUBLISHER_BATCH_SIZE = int(Env.str("PUBLISHER_BATCH_SIZE", default="100"))
+    PUBLISHER_OVERFLOW = Env.str("PUBLISHER_OVERFLOW", default="block")
+    PUBLISHER_SPILL_PATH = Env.str("PUBLISHER_SPILL_PATH")
+    # Times a message the broker rejects is published before it is dropped.
+    PUBLISHER_MAX_ATTEMPTS = int(Env.str("PUBLISHER_MAX_ATTEMPTS", default="5"))
+    # Replicas split the workspace pods by shard when SHARDING is "on", WORKSPACES_SHARDS has
+    # to match the one of vcl. Shards are handed over with Leases of SHARD_LEASE_NAMESPACE,
+    # valid for SHARD_LEASE_DURATION seconds and held on behalf of the replica POD_NAME. Pods
+    # without a shard label, created before sharding, are labelled by vcl's backfill_shard_labels.
+    SHARDING = Env.str("SHARDING", default="off") == "on"
+    WORKSPACES_SHARDS = int(Env.str("WORKSPACES_SHARDS", default="32"))
+    SHARD_LEASE_NAMESPACE = Env.str("SHARD_LEASE_NAMESPACE", default="default")
+    SHARD_LEASE_DURATION = int(Env.str("SHARD_LEASE_DURATION", default="15"))
+    POD_NAME = Env.str("POD_NAME", default=socket.gethostname())
     APP_NAME = "k8s-watcher"
@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+
+from kubernetes import client, watch
+
+logger = logging.getLogger(__name__)
+
+
+class PodCache:
+    """
+    Local copy of the workspace pods, kept up to date by a list+watch of the pods
+    with the `pod=workspace` label, or any narrower selector, like client-go informers do.
+
+    `on_change(event_type, old_pod, pod)` is called for every change once the cache is
+    synced, `old_pod` being None for new pods. Changes missed while the watch was
+    expired are found by comparing the pods listed again with the cached ones.
+    """
+
+    LABEL_SELECTOR = "pod=workspace"
+    WATCH_TIMEOUT = 300
+    RETRY_DELAY = 5
+
+    def __init__(self, k8s_api, on_change=None, label_selector=LABEL_SELECTOR, resource_version=None):
+        self._k8s_api = k8s_api
+        self._on_change = on_change
+        self.label_selector = label_selector
+        # Version of the pods the last change was handled at, the cache resumes from there.
+        self.resource_version = resource_version
+        self._pods = {}
+        self._lock = threading.Lock()
+        self._notify_lock = threading.Lock()
+        self._stopped = False
+        self._synced_at = None
+        # Changes received from the watch, pods listed again and the changes found doing so.
+        self.events = 0
+        self.relists = 0
+        self.relist_changes = 0
+
+    def start(self):
+        threading.Thread(target=self.run, name="pod-cache", daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        Stop handling changes, returns the resource version they were handled up to.
+
+        Waits for the change being handled, if any: no change is handled once it returns.
+        """
+        with self._notify_lock:
+            self._stopped = True
+            return self.resource_version
+
+    def _notify(self, changes, resource_version):
+        with self._notify_lock:
+            if self._stopped:
+                return
+            if self._on_change:
+                for event_type, old_pod, pod in changes:
+                    self._on_change(event_type, old_pod, pod)
+            self.resource_version = resource_version
+
+    def _list(self, initial):
+        if initial and self.resource_version:
+            # The pods as they were when the last change was handled, e.g. by another watcher.
+            try:
+                return self._k8s_api.list_pod_for_all_namespaces(
+                    label_selector=self.label_selector,
+                    resource_version=self.resource_version,
+                    resource_version_match="Exact",
+                )
+            except client.ApiException as exc:
+                if exc.status != 410:
+                    raise
+                logger.warning(
+                    "Pods '%s' changed since version %s may not be handled, it has expired",
+                    self.label_selector,
+                    self.resource_version,
+                )
+        return self._k8s_api.list_pod_for_all_namespaces(label_selector=self.label_selector)
+
+    def _sync(self, initial=False):
+        pods = self._list(initial)
+        listed = {(pod.metadata.namespace, pod.metadata.name): pod for pod in pods.items}
+        with self._lock:
+            cached, self._pods = self._pods, listed
+            self._synced_at = time.monotonic()
+
+        # Pods already there when the cache starts are its baseline, not changes.
+        changes = []
+        if not initial:
+            for key, pod in listed.items():
+                old_pod = cached.get(key)
+                if old_pod is None or old_pod.metadata.resource_version != pod.metadata.resource_version:
+                    changes.append(("MODIFIED" if old_pod else "ADDED", old_pod, pod))
+            for key in cached.keys() - listed.keys():
+                changes.append(("DELETED", cached[key], cached[key]))
+            self.relists += 1
+            self.relist_changes += len(changes)
+        self._notify(changes, pods.metadata.resource_version)
+        return pods.metadata.resource_version
+
+    def _watch(self, resource_version):
+        stream = watch.Watch().stream(
+            self._k8s_api.list_pod_for_all_namespaces,
+            label_selector=self.label_selector,
+            resource_version=resource_version,
+            allow_watch_bookmarks=True,
+            timeout_seconds=self.WATCH_TIMEOUT,
+        )
+        for event in stream:
+            if event["type"] == "BOOKMARK":
+                resource_version = event["raw_object"]["metadata"]["resourceVersion"]
+                self._notify([], resource_version)
+                continue
+
+            pod = event["object"]
+            key = (pod.metadata.namespace, pod.metadata.name)
+            with self._lock:
+                if event["type"] == "DELETED":
+                    old_pod = self._pods.pop(key, None)
+                else:
+                    old_pod = self._pods.get(key)
+                    self._pods[key] = pod
+                self._synced_at = time.monotonic()
+            resource_version = pod.metadata.resource_version
+            self.events += 1
+            self._notify([(event["type"], old_pod, pod)], resource_version)
+            if self._stopped:
+                break
+        return resource_version
+
+    def run(self):
+        """
+        List and watch the pods, until stopped.
+        """
+        resource_version = None
+        while not self._stopped:
+            try:
+                if resource_version is None:
+                    resource_version = self._sync(initial=self._synced_at is None)
+                resource_version = self._watch(resource_version)
+                # The watch timed out without errors, the cache is still in sync.
+                with self._lock:
+                    self._synced_at = time.monotonic()
+            except client.ApiException as exc:
+                # 410: the resource version is too old, list the pods again.
+                if exc.status != 410:
+                    logger.warning("Pod cache watch failed: %s", exc.reason)
+                    time.sleep(self.RETRY_DELAY)
+                resource_version = None
+            except Exception:
+                logger.exception("Pod cache watch failed")
+                time.sleep(self.RETRY_DELAY)
+                resource_version = None
+
+    @property
+    def stats(self):
+        """
+        Cache size, changes received from the watch, relists and the changes they found, and
+        staleness: seconds since the cache was last known to be in sync.
+        """
+        with self._lock:
+            return {
+                "size": len(self._pods),
+                "events": self.events,
+                "relists": self.relists,
+                "relist_changes": self.relist_changes,
+                "staleness": round(time.monotonic() - self._synced_at, 1) if self._synced_at else None,
+            }
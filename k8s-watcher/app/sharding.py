@@ -0,0 +1,230 @@
+import bisect
+import hashlib
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from kubernetes import client
+
+logger = logging.getLogger(__name__)
+
+
+class HashRing:
+    """
+    Consistent hashing of the shards onto the members, with bounded loads: each member is
+    placed `points` times on the ring and a shard goes to the first member after it that
+    doesn't have its share of the shards yet. A member joining or leaving only moves a
+    few shards, and none gets more than its share.
+    """
+
+    def __init__(self, members, points=64):
+        self.members = sorted(members)
+        self._ring = sorted(
+            (self._hash(f"{member}#{point}"), member) for member in self.members for point in range(points)
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    def assign(self, shards):
+        """
+        Member of each of the `shards` shards.
+        """
+        capacity = math.ceil(shards / len(self.members))
+        loads = dict.fromkeys(self.members, 0)
+        assignment = {}
+        for shard in range(shards):
+            index = bisect.bisect(self._keys, self._hash(f"shard-{shard}"))
+            while loads[member := self._ring[index % len(self._ring)][1]] >= capacity:
+                index += 1
+            loads[member] += 1
+            assignment[shard] = member
+        return assignment
+
+
+class ShardCoordinator:
+    """
+    Splits the workspace shards between the watcher replicas with Kubernetes Leases.
+
+    Every replica renews a member Lease, the members whose Lease is not expired are placed
+    on a hash ring, which tells who should watch each shard. A shard is only watched by
+    the holder of the shard Lease:
+
+    1. A replica stops watching the shards the ring moved away, then releases their Lease.
+    2. The shards the ring gives to a replica are acquired once free or expired, Leases are
+       updated on their resource version so that only one replica gets them.
+
+    So that no pod change is handled twice, or missed, during rebalancing, the resource
+    version a shard was watched up to is kept on its Lease when renewing and releasing it,
+    the next holder resumes from there. A replica that can't renew a Lease stops watching
+    the shard before it expires.
+
+    Arguments:
+      start_watch: `(shard, resource_version)` callable returning the started watch of a
+        shard, `resource_version` being None the first time the shard is watched. The watch
+        has a `resource_version` attribute and a `stop` method returning the resource version
+        it stopped at.
+    """
+
+    LEASE_PREFIX = "k8s-watcher"
+    MEMBER_SELECTOR = "k8s-watcher=member"
+    SHARD_SELECTOR = "k8s-watcher=shard"
+    RESOURCE_VERSION_ANNOTATION = "k8s-watcher/resource-version"
+
+    def __init__(self, k8s_api, identity, shards, namespace, lease_duration, start_watch):
+        self._k8s_coordination_v1 = client.CoordinationV1Api(api_client=k8s_api.api_client)
+        self.identity = identity
+        self.shards = shards
+        self.namespace = namespace
+        self.lease_duration = lease_duration
+        self.renew_interval = lease_duration / 3
+        self._start_watch = start_watch
+        self.watches = {}
+        self._renewed_at = {}
+
+    @staticmethod
+    def _now():
+        return datetime.now(pytz.utc)
+
+    def _is_expired(self, lease):
+        if not lease.spec.holder_identity or not lease.spec.renew_time:
+            return True
+        duration = timedelta(seconds=lease.spec.lease_duration_seconds or self.lease_duration)
+        return lease.spec.renew_time + duration < self._now()
+
+    def _lease_body(self, name, labels, holder, resource_version=None, watched_up_to=None):
+        metadata = {"name": name, "labels": labels}
+        if resource_version:
+            metadata["resourceVersion"] = resource_version
+        if watched_up_to:
+            metadata["annotations"] = {self.RESOURCE_VERSION_ANNOTATION: watched_up_to}
+        return {
+            "apiVersion": "coordination.k8s.io/v1",
+            "kind": "Lease",
+            "metadata": metadata,
+            "spec": {
+                "holderIdentity": holder,
+                "leaseDurationSeconds": self.lease_duration,
+                "renewTime": self._now().strftime("%Y-%m-%dT%H:%M:%S.%fZ") if holder else None,
+            },
+        }
+
+    def _shard_lease_name(self, shard):
+        return f"{self.LEASE_PREFIX}-shard-{shard}"
+
+    def _write_shard_lease(self, shard, lease, holder, watched_up_to):
+        """
+        Create or update the Lease of a shard, returns False if another replica changed it first.
+        """
+        name = self._shard_lease_name(shard)
+        labels = {"k8s-watcher": "shard"}
+        try:
+            if lease is None:
+                body = self._lease_body(name, labels, holder, watched_up_to=watched_up_to)
+                self._k8s_coordination_v1.create_namespaced_lease(namespace=self.namespace, body=body)
+            else:
+                body = self._lease_body(name, labels, holder, lease.metadata.resource_version, watched_up_to)
+                self._k8s_coordination_v1.replace_namespaced_lease(name=name, namespace=self.namespace, body=body)
+        except client.ApiException as exc:
+            if exc.status != 409:
+                raise
+            return False
+        return True
+
+    def _renew_membership(self):
+        name = f"{self.LEASE_PREFIX}-member-{self.identity}"
+        body = self._lease_body(name, {"k8s-watcher": "member"}, self.identity)
+        try:
+            self._k8s_coordination_v1.replace_namespaced_lease(name=name, namespace=self.namespace, body=body)
+        except client.ApiException as exc:
+            if exc.status != 404:
+                raise
+            self._k8s_coordination_v1.create_namespaced_lease(namespace=self.namespace, body=body)
+
+    def _get_members(self):
+        leases = self._k8s_coordination_v1.list_namespaced_lease(
+            namespace=self.namespace, label_selector=self.MEMBER_SELECTOR
+        ).items
+        return {lease.spec.holder_identity for lease in leases if not self._is_expired(lease)} | {self.identity}
+
+    def _stop_watch(self, shard):
+        self._renewed_at.pop(shard, None)
+        return self.watches.pop(shard).stop()
+
+    def _acquire(self, shard, lease):
+        annotations = (lease.metadata.annotations or {}) if lease else {}
+        watched_up_to = annotations.get(self.RESOURCE_VERSION_ANNOTATION)
+        if not self._write_shard_lease(shard, lease, self.identity, watched_up_to):
+            return
+        self.watches[shard] = self._start_watch(shard, watched_up_to)
+        self._renewed_at[shard] = time.monotonic()
+        logger.info("Acquired shard %s, watching from version %s", shard, watched_up_to)
+
+    def _release(self, shard, lease):
+        watched_up_to = self._stop_watch(shard)
+        if self._write_shard_lease(shard, lease, None, watched_up_to):
+            logger.info("Released shard %s at version %s", shard, watched_up_to)
+
+    def _renew(self, shard, lease):
+        try:
+            renewed = self._write_shard_lease(shard, lease, self.identity, self.watches[shard].resource_version)
+        except Exception:
+            logger.exception("Failed to renew the lease of shard %s", shard)
+            renewed = None
+
+        if renewed:
+            self._renewed_at[shard] = time.monotonic()
+        elif renewed is False or time.monotonic() - self._renewed_at[shard] > self.lease_duration - self.renew_interval:
+            # The lease is lost, or about to expire: another replica may take the shard over.
+            logger.warning("Lost shard %s", shard)
+            self._stop_watch(shard)
+
+    def rebalance(self):
+        """
+        Renew the Leases of this replica, then release and acquire shards to match the ring.
+        """
+        self._renew_membership()
+        assignment = HashRing(self._get_members()).assign(self.shards)
+        leases = {
+            lease.metadata.name: lease
+            for lease in self._k8s_coordination_v1.list_namespaced_lease(
+                namespace=self.namespace, label_selector=self.SHARD_SELECTOR
+            ).items
+        }
+
+        for shard in range(self.shards):
+            lease = leases.get(self._shard_lease_name(shard))
+            owned = assignment[shard] == self.identity
+            if shard in self.watches:
+                if lease is None or lease.spec.holder_identity != self.identity:
+                    logger.warning("Lost shard %s to %s", shard, lease and lease.spec.holder_identity)
+                    self._stop_watch(shard)
+                elif owned:
+                    self._renew(shard, lease)
+                else:
+                    self._release(shard, lease)
+            elif owned and (lease is None or lease.spec.holder_identity == self.identity or self._is_expired(lease)):
+                self._acquire(shard, lease)
+
+    def release_all(self):
+        """
+        Hand every shard over and leave the ring, e.g. when shutting down.
+        """
+        for shard in list(self.watches):
+            try:
+                lease = self._k8s_coordination_v1.read_namespaced_lease(
+                    name=self._shard_lease_name(shard), namespace=self.namespace
+                )
+                self._release(shard, lease)
+            except client.ApiException as exc:
+                logger.warning("Failed to release shard %s: %s", shard, exc.reason)
+        try:
+            self._k8s_coordination_v1.delete_namespaced_lease(
+                name=f"{self.LEASE_PREFIX}-member-{self.identity}", namespace=self.namespace
+            )
+        except client.ApiException as exc:
+            logger.warning("Failed to leave the ring: %s", exc.reason)
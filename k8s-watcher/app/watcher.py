@@ -1,14 +1,15 @@
 import logging
-import pytz
 import json
-from datetime import datetime
-from pprint import pformat
+import time
 
-from kubernetes import client, watch, config
-from vcl_utils.publisher import PublisherConnectionManager
-from vcl_utils.eks import EKSAPIClient
+from kubernetes import client, config
+from vcl_utils.publisher import AsyncPublisher
+from vcl_utils.eks import get_shared_eks_api_client
+from vcl_utils.sharding import SHARD_LABEL
 
 from app.config import Settings
+from app.pod_cache import PodCache
+from app.sharding import ShardCoordinator
 
 logger = logging.getLogger(__name__)
 
@@ -19,126 +20,204 @@ if Settings.APP_ENV == "DEV":
 def get_k8s_api_client():
     api_client = None
     if Settings.APP_ENV != "DEV":
-        eks = EKSAPIClient(eks_cluster_name=Settings.WORKSPACES_CLUSTER_NAME)
-        api_client = eks.api_client
+        api_client = get_shared_eks_api_client(Settings.WORKSPACES_CLUSTER_NAME)
 
     return client.CoreV1Api(api_client=api_client)
 
 
+def get_init_telemetry(pod):
+    """
+    Phase timings the init container wrote as its termination message, if any.
+    """
+    for container_status in pod.status.init_container_statuses or []:
+        terminated = container_status.state and container_status.state.terminated
+        if terminated and terminated.message:
+            try:
+                return json.loads(terminated.message)
+            except ValueError:
+                logger.warning("Invalid init container termination message: %r", terminated.message)
+    return None
+
+
+# Waiting reasons of containers that won't start without help.
+CONTAINER_FAILURE_REASONS = {
+    "CrashLoopBackOff",
+    "CreateContainerConfigError",
+    "CreateContainerError",
+    "ErrImagePull",
+    "ImagePullBackOff",
+    "InvalidImageName",
+    "RunContainerError",
+}
+
+
+def get_failure_reason(pod):
+    """
+    Get the reason why a workspace pod can't become ready, if any.
+    """
+    if pod.status.phase == "Failed":
+        return pod.status.reason or "Failed"
+
+    for container_status in (pod.status.init_container_statuses or []) + (pod.status.container_statuses or []):
+        state = container_status.state
+        if state.waiting and state.waiting.reason in CONTAINER_FAILURE_REASONS:
+            return state.waiting.reason
+        if state.terminated and state.terminated.exit_code != 0:
+            return state.terminated.reason or "Error"
+    return None
+
+
+def get_lifecycle(pod):
+    """
+    The lifecycle stages a workspace pod is in, in the order their messages are published.
+    """
+    workspace_container_name = pod.spec.containers[0].name
+    workspace_state = next(
+        (
+            container_status.state
+            for container_status in pod.status.container_statuses or []
+            if container_status.name == workspace_container_name
+        ),
+        None,
+    )
+    return {
+        "scheduled": any(
+            condition.type == "PodScheduled" and condition.status == "True" for condition in pod.status.conditions or []
+        ),
+        # A container is only reported once it has been created and started.
+        "created": bool(workspace_state and (workspace_state.running or workspace_state.terminated)),
+        "started": bool(workspace_state and workspace_state.running),
+        "failed": get_failure_reason(pod),
+        "deleted": pod.metadata.deletion_timestamp is not None,
+    }
+
+
+def handle_pod_change(event_type, old_pod, pod, publisher):
+    """
+    Publish the workspace lifecycle messages of the stages a pod change got the pod into.
+    """
+    # Make sure we only inspect workspace pods
+    if not pod.metadata.namespace.startswith(Settings.WORKSPACES_NAMESPACE_PREFIX):
+        return
+
+    previous = get_lifecycle(old_pod) if old_pod else {}
+    if event_type == "DELETED":
+        # Only its removal is news, whatever state the pod was left in.
+        current = {**previous, "deleted": True}
+    else:
+        current = get_lifecycle(pod)
+
+    workspace_meta = {
+        "assignment_id": pod.metadata.labels["assignment"],
+        "workspace_allocation_id": pod.metadata.labels["workspace_allocation"],
+    }
+    logger.info(f"[{event_type}] POD: {pod.metadata.namespace}/{pod.metadata.name} | STAGES: {current}")
+
+    for stage, value in current.items():
+        if not value or value == previous.get(stage):
+            continue
+        if stage == "started":
+            message = {**workspace_meta, "init_telemetry": get_init_telemetry(pod)}
+        else:
+            message = workspace_meta
+        publisher.publish(f"k8s.workspace.{stage}", message)
+
+
+def watch_pods(k8s_api, publisher):
+    """
+    Watch all the workspace pods.
+    """
+    stats_logged_at = time.monotonic()
+
+    def on_change(event_type, old_pod, pod):
+        nonlocal stats_logged_at
+        handle_pod_change(event_type, old_pod, pod, publisher)
+
+        if time.monotonic() - stats_logged_at >= Settings.STATS_INTERVAL:
+            logger.info("Pod cache: %s", pod_cache.stats)
+            logger.info("Publisher: %s", publisher.stats)
+            stats_logged_at = time.monotonic()
+
+    # The watch resumes from the last resource version it has seen, changes missed
+    # while that version was expired are found when listing the pods again.
+    pod_cache = PodCache(k8s_api, on_change=on_change)
+    pod_cache.run()
+
+
+def watch_shards(k8s_api, publisher, identity=None):
+    """
+    Watch the workspace pods of the shards this replica holds, out of those split between
+    the watcher replicas, see `ShardCoordinator`.
+    """
+
+    def start_shard_watch(shard, resource_version):
+        return PodCache(
+            k8s_api,
+            on_change=lambda event_type, old_pod, pod: handle_pod_change(event_type, old_pod, pod, publisher),
+            label_selector=f"{PodCache.LABEL_SELECTOR},{SHARD_LABEL}={shard}",
+            resource_version=resource_version,
+        ).start()
+
+    coordinator = ShardCoordinator(
+        k8s_api,
+        identity=identity or Settings.POD_NAME,
+        shards=Settings.WORKSPACES_SHARDS,
+        namespace=Settings.SHARD_LEASE_NAMESPACE,
+        lease_duration=Settings.SHARD_LEASE_DURATION,
+        start_watch=start_shard_watch,
+    )
+    stats_logged_at = time.monotonic()
+    try:
+        while True:
+            try:
+                coordinator.rebalance()
+            except client.ApiException as exc:
+                logger.warning("Failed to rebalance the shards: %s", exc.reason)
+
+            if time.monotonic() - stats_logged_at >= Settings.STATS_INTERVAL:
+                logger.info("Shards: %s", sorted(coordinator.watches))
+                logger.info(
+                    "Pod caches: %s", {shard: pod_cache.stats for shard, pod_cache in coordinator.watches.items()}
+                )
+                logger.info("Publisher: %s", publisher.stats)
+                stats_logged_at = time.monotonic()
+            time.sleep(coordinator.renew_interval)
+    finally:
+        coordinator.release_all()
+
+
 def start_watch():
     """
-    Watch events from kubernetes cluster infinitely for
-    workspace namespaces.
-
-    Workspace Pod Lifecycle Events:
-    -------------------------------
-    1. Scheduled
-    2. Pulled (workpace-init)
-    3. Created (workpace-init)
-    4. Started (workpace-init)
-    5. Pulled (wa-x)
-    6. Created (wa-x)
-    7. Started (wa-x)
-    8. Killling (wa-x)
+    Watch the workspace pods of the cluster infinitely, and publish their lifecycle.
+
+    Only pods labelled `pod=workspace` are listed and watched, the API server filters
+    the rest of the cluster out. Their lifecycle is read from the pod statuses rather
+    than from events, which can't be selected by labels. With SHARDING on, replicas
+    split the pods by their `shard` label.
+
+    Workspace Pod Lifecycle Messages:
+    ---------------------------------
+    1. Scheduled: the pod is bound to a node.
+    2. Created: the workspace container has been created.
+    3. Started: the workspace container is running, after the init container.
+    4. Failed: a container can't start, or exited with an error.
+    5. Deleted: the pod is terminating, or gone.
     """
     logger.info("Starting watcher")
     k8s_api = get_k8s_api_client()
     configure_ssl = Settings.APP_ENV != "DEV"
-    with PublisherConnectionManager(
-        Settings.RABBITMQ_CREDENTIALS, Settings.RABBITMQ_URL, configure_ssl=configure_ssl
+    # Messages are published from another thread, a slow broker doesn't hold the watch up.
+    with AsyncPublisher(
+        Settings.RABBITMQ_CREDENTIALS,
+        Settings.RABBITMQ_URL,
+        configure_ssl=configure_ssl,
+        max_queue_size=Settings.PUBLISHER_QUEUE_SIZE,
+        batch_size=Settings.PUBLISHER_BATCH_SIZE,
+        overflow=Settings.PUBLISHER_OVERFLOW,
+        spill_path=Settings.PUBLISHER_SPILL_PATH or None,
+        max_attempts=Settings.PUBLISHER_MAX_ATTEMPTS,
     ) as publisher:
-        while True:
-            watch_obj = watch.Watch()
-            watch_launched_at = datetime.now(pytz.utc)
-            selection_criteria = (
-                "metadata.namespace!=default,"
-                "metadata.namespace!=test,"
-                "metadata.namespace!=kube-system,"
-                "metadata.namespace!=kube-public,"
-                "metadata.namespace!=kube-node-lease,"
-                "metadata.namespace!=vcl-core,"
-                "involvedObject.kind=Pod"
-            )
-            try:
-                for event in watch_obj.stream(k8s_api.list_event_for_all_namespaces, field_selector=selection_criteria):
-                    event_obj = event["object"]
-                    event_timestamp = event_obj.event_time or event_obj.last_timestamp or event_obj.first_timestamp
-                    if event_timestamp < watch_launched_at:
-                        # Skip any events that are older than
-                        # the watcher service launch.
-                        logger.info(
-                            f"SKIPPING AN OLD EVENT: "
-                            f"TIME: {event_timestamp} | "
-                            f"TYPE: {event_obj.type} | "
-                            f"REASON: {event_obj.reason} | "
-                            f"MESSAGE: {event_obj.message}"
-                        )
-                        continue
-
-                    # Make sure we only inspect workspace events
-                    if event_obj.metadata.namespace.startswith(Settings.WORKSPACES_NAMESPACE_PREFIX):
-                        logger.info(
-                            f"[{event['type']}] TIME: {event_timestamp} | "
-                            f"TYPE: {event_obj.type} | "
-                            f"REASON: {event_obj.reason} | "
-                            f"MESSAGE: {event_obj.message}"
-                        )
-
-                        # 1. Get workspace pod details from cluster.
-                        try:
-                            workspace_pod = k8s_api.read_namespaced_pod(
-                                name=event_obj.involved_object.name,
-                                namespace=event_obj.involved_object.namespace,
-                            )
-                        except client.ApiException as exc:
-                            exc_info = json.loads(exc.body)
-                            if exc_info["reason"] == "NotFound":
-                                logger.info(f"No such workspace: '{event_obj.involved_object.namespace}'")
-                                continue
-                            raise
-
-                        # 2. Prepare workspace meta information for consumer events
-                        workspace_container_name = workspace_pod.spec.containers[0].name
-                        workspace_meta = {
-                            "assignment_id": workspace_pod.metadata.labels["assignment"],
-                            "student_id": workspace_pod.metadata.labels["student"],
-                            "workspace_allocation_id": workspace_pod.metadata.labels["workspace_allocation"],
-                        }
-
-                        # 3. Send events, relevant to pod life cycle, to consumer.
-                        event_type = event_obj.reason.upper()
-                        if event_type == "SCHEDULED" and workspace_container_name in event_obj.message:
-                            publisher.publish("k8s.workspace.scheduled", workspace_meta)
-                        elif event_type == "CREATED" and workspace_container_name in event_obj.message:
-                            publisher.publish("k8s.workspace.created", workspace_meta)
-                        elif event_type == "STARTED" and workspace_container_name in event_obj.message:
-                            publisher.publish("k8s.workspace.started", workspace_meta)
-                        elif event_type in ["FAILED", "BACKOFF"]:
-                            publisher.publish("k8s.workspace.failed", workspace_meta)
-                        elif event_type == "KILLING" and workspace_container_name in event_obj.message:
-                            publisher.publish("k8s.workspace.deleted", workspace_meta)
-                        else:
-                            # workspace is not ready yet, log container statuses
-                            for container_status_field in [
-                                "container_statuses",
-                                "init_container_statuses",
-                            ]:
-                                container_statuses = getattr(workspace_pod.status, container_status_field)
-                                if container_statuses and (container_status := container_statuses[0]):
-                                    logger.info(
-                                        f"container={container_status.name} "
-                                        f"state={container_status.state} ready={container_status.ready}"
-                                    )
-                                else:
-                                    logger.info(
-                                        "Pod '%s' has not been scheduled into any node yet", workspace_pod.metadata.name
-                                    )
-            except client.ApiException as exc:
-                if exc.status == 410:
-                    # Reinitialize watcher on 410 – resourceVersion for the provided watch is too old
-                    # ref: https://github.com/kubernetes/kubernetes/issues/72187
-                    exc_info = json.loads(exc.body)
-                    logger.info("Encountered 410 API response: %s", pformat(exc_info))
-                    continue
-                else:
-                    raise
+        if Settings.SHARDING:
+            watch_shards(k8s_api, publisher)
+        else:
+            watch_pods(k8s_api, publisher)
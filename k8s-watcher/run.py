@@ -1,5 +1,7 @@
 import click
 import logging
+import signal
+import sys
 
 from vcl_utils.logging import configure_logging
 from vcl_utils.publisher import PublisherConnectionManager
@@ -39,6 +41,8 @@ def check_readiness():
 
 @watcher_cli.command()
 def start_watcher():
+    # Exit cleanly when the pod is stopped, so that the shards it watches are handed over right away.
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
     start_watch()
 
 
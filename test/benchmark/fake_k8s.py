@@ -0,0 +1,518 @@
+"""
+A local stand-in for the Kubernetes API server, good enough for the calls VCL makes.
+
+Objects are kept in memory and served over HTTP with the Kubernetes REST paths, so the
+real kubernetes client is used end to end. A tiny deployment controller creates one pod
+per replica, together with the pod events a kubelet would emit, so that watches on pods
+and events see the same lifecycle as on a real cluster.
+
+Not supported: field selectors (ignored), set based label selectors, json patches, lists
+at a resource version other than an exact one.
+"""
+
+import copy
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_SCOPED = {"namespaces", "nodes"}
+
+
+def now_iso(micro=False):
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ" if micro else "%Y-%m-%dT%H:%M:%SZ")
+
+
+def merge_patch(target, patch):
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_patch(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+    return target
+
+
+def match_labels(labels, label_selector):
+    labels = labels or {}
+    for requirement in filter(None, (label_selector or "").split(",")):
+        if "!=" in requirement:
+            key, value = requirement.split("!=", 1)
+            if labels.get(key) == value:
+                return False
+        elif "=" in requirement:
+            key, value = requirement.split("=", 1)
+            if labels.get(key.rstrip("=")) != value:
+                return False
+        elif requirement.startswith("!"):
+            if requirement[1:] in labels:
+                return False
+        elif requirement not in labels:
+            return False
+    return True
+
+
+class ApiError(Exception):
+    def __init__(self, status, reason, message):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.message = message
+
+    def to_dict(self):
+        return {
+            "kind": "Status",
+            "apiVersion": "v1",
+            "metadata": {},
+            "status": "Failure",
+            "message": self.message,
+            "reason": self.reason,
+            "code": self.status,
+        }
+
+
+class ObjectStore:
+    """
+    In-memory objects keyed by (plural, namespace, name), with a change log for watches.
+    """
+
+    KEPT_METADATA = ("uid", "creationTimestamp", "namespace")
+
+    def __init__(self, pod_startup_delay=0):
+        self.pod_startup_delay = pod_startup_delay
+        self._objects = {}
+        self._log = []
+        self._resource_version = itertools.count(1)
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self.closed = False
+
+    @property
+    def resource_version(self):
+        with self._lock:
+            return self._log[-1][0] if self._log else 0
+
+    def _record(self, event_type, plural, obj):
+        rv = next(self._resource_version)
+        obj["metadata"]["resourceVersion"] = str(rv)
+        self._log.append((rv, event_type, plural, copy.deepcopy(obj)))
+        self._changed.notify_all()
+
+    def get(self, plural, namespace, name):
+        with self._lock:
+            try:
+                return copy.deepcopy(self._objects[(plural, namespace, name)])
+            except KeyError:
+                raise ApiError(HTTPStatus.NOT_FOUND, "NotFound", f'{plural} "{name}" not found')
+
+    def list(self, plural, namespace=None, label_selector=None, resource_version=None):
+        """
+        The objects matching, as they are or as they were at `resource_version`.
+        """
+        with self._lock:
+            if resource_version:
+                objects = {}
+                for rv, event_type, obj_plural, obj in self._log:
+                    if rv > resource_version:
+                        break
+                    key = (obj_plural, obj["metadata"].get("namespace"), obj["metadata"]["name"])
+                    if event_type == "DELETED":
+                        objects.pop(key, None)
+                    else:
+                        objects[key] = obj
+            else:
+                objects = self._objects
+            return [
+                copy.deepcopy(obj)
+                for (obj_plural, obj_namespace, _), obj in objects.items()
+                if obj_plural == plural
+                and (namespace is None or obj_namespace == namespace)
+                and match_labels(obj["metadata"].get("labels"), label_selector)
+            ]
+
+    def create(self, plural, namespace, obj):
+        with self._lock:
+            metadata = obj.setdefault("metadata", {})
+            if metadata.get("generateName") and not metadata.get("name"):
+                metadata["name"] = metadata["generateName"] + uuid.uuid4().hex[:5]
+            name = metadata["name"]
+            if (plural, namespace, name) in self._objects:
+                raise ApiError(HTTPStatus.CONFLICT, "AlreadyExists", f'{plural} "{name}" already exists')
+            if namespace and ("namespaces", None, namespace) not in self._objects:
+                raise ApiError(HTTPStatus.NOT_FOUND, "NotFound", f'namespaces "{namespace}" not found')
+
+            if namespace:
+                metadata["namespace"] = namespace
+            metadata["uid"] = str(uuid.uuid4())
+            metadata["creationTimestamp"] = now_iso()
+            if plural == "namespaces":
+                obj["status"] = {"phase": "Active"}
+            self._objects[(plural, namespace, name)] = obj
+            self._record("ADDED", plural, obj)
+            if plural == "deployments":
+                self._reconcile_deployment(namespace, name)
+            return copy.deepcopy(obj)
+
+    def update(self, plural, namespace, name, patch=None, replace=None):
+        with self._lock:
+            current = self._objects.get((plural, namespace, name))
+            if current is None:
+                raise ApiError(HTTPStatus.NOT_FOUND, "NotFound", f'{plural} "{name}" not found')
+            if replace is not None:
+                resource_version = replace.get("metadata", {}).get("resourceVersion")
+                if resource_version and resource_version != current["metadata"]["resourceVersion"]:
+                    raise ApiError(HTTPStatus.CONFLICT, "Conflict", f'{plural} "{name}" has been modified')
+                kept = {key: value for key, value in current["metadata"].items() if key in self.KEPT_METADATA}
+                replace.setdefault("metadata", {}).update(kept)
+                current = self._objects[(plural, namespace, name)] = replace
+            else:
+                merge_patch(current, patch)
+            self._record("MODIFIED", plural, current)
+            if plural == "deployments":
+                self._reconcile_deployment(namespace, name)
+            return copy.deepcopy(current)
+
+    def delete(self, plural, namespace, name):
+        with self._lock:
+            obj = self._objects.pop((plural, namespace, name), None)
+            if obj is None:
+                raise ApiError(HTTPStatus.NOT_FOUND, "NotFound", f'{plural} "{name}" not found')
+            if plural == "pods":
+                self._emit_pod_event(obj, "Killing", f"Stopping container {obj['spec']['containers'][0]['name']}")
+            self._record("DELETED", plural, obj)
+            if plural == "namespaces":
+                for key in [key for key in self._objects if key[1] == name and key[0] != "events"]:
+                    self.delete(*key)
+            return copy.deepcopy(obj)
+
+    def clear(self):
+        """
+        Drop all objects, e.g. those left over by a previous scenario.
+        """
+        with self._lock:
+            self._objects.clear()
+
+    def _emit_pod_event(self, pod, reason, message):
+        namespace = pod["metadata"]["namespace"]
+        event = {
+            "metadata": {"name": f"{pod['metadata']['name']}.{uuid.uuid4().hex[:8]}", "namespace": namespace},
+            "involvedObject": {"kind": "Pod", "name": pod["metadata"]["name"], "namespace": namespace},
+            "reason": reason,
+            "message": message,
+            "type": "Normal",
+            "eventTime": now_iso(micro=True),
+            "firstTimestamp": now_iso(),
+            "lastTimestamp": now_iso(),
+            "reportingComponent": "fake-kubelet",
+        }
+        self._objects[("events", namespace, event["metadata"]["name"])] = event
+        self._record("ADDED", "events", event)
+
+    def _reconcile_deployment(self, namespace, name):
+        deployment = self._objects[("deployments", namespace, name)]
+        replicas = deployment["spec"].get("replicas", 1)
+        template = deployment["spec"]["template"]
+        pods = [
+            key
+            for key, obj in self._objects.items()
+            if key[0] == "pods"
+            and key[1] == namespace
+            and any(owner["name"] == name for owner in obj["metadata"].get("ownerReferences", []))
+        ]
+        for key in pods[replicas:]:
+            self.delete(*key)
+        for _ in range(replicas - len(pods)):
+            self._create_pod(namespace, deployment, template)
+        deployment["status"] = {"replicas": replicas, "readyReplicas": replicas}
+
+    def _create_pod(self, namespace, deployment, template):
+        deployment_name = deployment["metadata"]["name"]
+        containers = template["spec"]["containers"]
+        pod = {
+            "metadata": {
+                "name": f"{deployment_name}-{uuid.uuid4().hex[:10]}",
+                "labels": copy.deepcopy(template["metadata"].get("labels", {})),
+                "ownerReferences": [
+                    {
+                        "apiVersion": "apps/v1",
+                        "kind": "Deployment",
+                        "name": deployment_name,
+                        "uid": deployment["metadata"]["uid"],
+                    }
+                ],
+            },
+            "spec": copy.deepcopy(template["spec"]),
+            "status": {"phase": "Pending", "conditions": [{"type": "PodScheduled", "status": "True"}]},
+        }
+        pod["spec"]["nodeName"] = "fake-node"
+        pod = self.create("pods", namespace, pod)
+        self._emit_pod_event(pod, "Scheduled", f"Successfully assigned {namespace}/{pod['metadata']['name']}")
+        for container in containers:
+            self._emit_pod_event(pod, "Pulled", f'Container image "{container["image"]}" already present')
+            self._emit_pod_event(pod, "Created", f"Created container {container['name']}")
+
+        if self.pod_startup_delay:
+            timer = threading.Timer(self.pod_startup_delay, self._start_pod, args=(namespace, pod["metadata"]["name"]))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._start_pod(namespace, pod["metadata"]["name"])
+
+    def _start_pod(self, namespace, name):
+        with self._lock:
+            pod = self._objects.get(("pods", namespace, name))
+            if pod is None:
+                return
+            container_statuses = [
+                {
+                    "name": container["name"],
+                    "image": container["image"],
+                    "imageID": "",
+                    "ready": True,
+                    "restartCount": 0,
+                    "started": True,
+                    "state": {"running": {"startedAt": now_iso()}},
+                }
+                for container in pod["spec"]["containers"]
+            ]
+            for container in pod["spec"]["containers"]:
+                self._emit_pod_event(pod, "Started", f"Started container {container['name']}")
+            self.update(
+                "pods",
+                namespace,
+                name,
+                patch={
+                    "status": {
+                        "phase": "Running",
+                        "conditions": [
+                            {"type": "PodScheduled", "status": "True"},
+                            {"type": "Ready", "status": "True"},
+                        ],
+                        "containerStatuses": container_statuses,
+                    }
+                },
+            )
+
+    def watch(self, plural, namespace, label_selector, resource_version, timeout):
+        """
+        Yield (type, object) changes after `resource_version`, or the current objects first
+        when it's not set, until `timeout` seconds have passed.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            if resource_version:
+                position = next((i for i, entry in enumerate(self._log) if entry[0] > resource_version), len(self._log))
+                pending = []
+            else:
+                position = len(self._log)
+                pending = [("ADDED", obj) for obj in self.list(plural, namespace, label_selector)]
+
+        yield from pending
+        while not self.closed and time.monotonic() < deadline:
+            with self._lock:
+                while position == len(self._log) and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    self._changed.wait(remaining)
+                entries = self._log[position:]
+                position = len(self._log)
+
+            for _, event_type, obj_plural, obj in entries:
+                if obj_plural != plural:
+                    continue
+                if namespace and obj["metadata"].get("namespace") != namespace:
+                    continue
+                if not match_labels(obj["metadata"].get("labels"), label_selector):
+                    continue
+                yield event_type, obj
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._changed.notify_all()
+
+
+class FakeKubernetesRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are sent separately, don't let Nagle's algorithm delay the body.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def _parse_path(self):
+        """
+        Split a REST path into (plural, namespace, name, subresource).
+        """
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        parts = parts[2:] if parts[0] == "api" else parts[3:]
+        namespace = None
+        if len(parts) > 1 and parts[0] == "namespaces":
+            namespace, parts = parts[1], parts[2:]
+            if not parts:
+                return "namespaces", None, namespace, None, parse_qs(url.query)
+        plural = parts[0] if parts else "namespaces"
+        name = parts[1] if len(parts) > 1 else None
+        subresource = parts[2] if len(parts) > 2 else None
+        return plural, namespace, name, subresource, parse_qs(url.query)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_watch(self, plural, namespace, query):
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.server.open_watches[plural] += 1
+        changes = self.store.watch(
+            plural,
+            namespace,
+            query.get("labelSelector", [None])[0],
+            int(query.get("resourceVersion", ["0"])[0] or 0),
+            int(query.get("timeoutSeconds", [self.server.watch_timeout])[0]),
+        )
+        try:
+            for event_type, obj in changes:
+                line = json.dumps({"type": event_type, "object": obj}).encode("utf-8") + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.server.open_watches[plural] -= 1
+        self.close_connection = True
+
+    def _handle(self):
+        server = self.server
+        plural, namespace, name, subresource, query = self._parse_path()
+        is_watch = query.get("watch", ["false"])[0].lower() in ("true", "1")
+        kind = plural + (f"/{subresource}" if subresource else "")
+        server.count_call(f"{self.command} {kind}{' (watch)' if is_watch else ''}")
+
+        if server.latency:
+            time.sleep(server.latency)
+        body = self._read_body() if self.command in ("POST", "PUT", "PATCH") else None
+        if server.error_rate and server.random.random() < server.error_rate:
+            error = ApiError(HTTPStatus.INTERNAL_SERVER_ERROR, "InternalError", "injected error")
+            return self._send_json(error.status, error.to_dict())
+
+        if plural in CLUSTER_SCOPED:
+            namespace = None
+        try:
+            if self.command == "GET" and is_watch:
+                return self._send_watch(plural, namespace, query)
+            if self.command == "GET" and name:
+                data = self.store.get(plural, namespace, name)
+            elif self.command == "GET":
+                if query.get("resourceVersionMatch", [None])[0] == "Exact":
+                    resource_version = int(query["resourceVersion"][0])
+                else:
+                    resource_version = None
+                items = self.store.list(plural, namespace, query.get("labelSelector", [None])[0], resource_version)
+                data = {
+                    "metadata": {"resourceVersion": str(resource_version or self.store.resource_version)},
+                    "items": items,
+                }
+            elif self.command == "POST":
+                data = self.store.create(plural, namespace, body)
+            elif self.command == "PATCH" and subresource == "scale":
+                self.store.update(plural, namespace, name, patch={"spec": body["spec"]})
+                data = {"metadata": {"name": name, "namespace": namespace}, "spec": body["spec"]}
+            elif self.command == "PATCH":
+                data = self.store.update(plural, namespace, name, patch=body)
+            elif self.command == "PUT":
+                data = self.store.update(plural, namespace, name, replace=body)
+            elif self.command == "DELETE":
+                data = self.store.delete(plural, namespace, name)
+            else:
+                raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "MethodNotAllowed", self.command)
+        except ApiError as exc:
+            return self._send_json(exc.status, exc.to_dict())
+        self._send_json(HTTPStatus.CREATED if self.command == "POST" else HTTPStatus.OK, data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+
+class FakeKubernetesServer(ThreadingHTTPServer):
+    """
+    Arguments:
+      latency: seconds added to every API call.
+      error_rate: share of API calls answered with a 500 error.
+      pod_startup_delay: seconds between a pod being created and becoming ready.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0, error_rate=0, pod_startup_delay=0, watch_timeout=300, seed=0):
+        super().__init__(("127.0.0.1", 0), FakeKubernetesRequestHandler)
+        self.store = ObjectStore(pod_startup_delay=pod_startup_delay)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.watch_timeout = watch_timeout
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.open_watches = Counter()
+        self._calls_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count_call(self, call):
+        with self._calls_lock:
+            self.calls[call] += 1
+
+    def reset_calls(self):
+        with self._calls_lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+    def wait_for_watch(self, plural, timeout=10):
+        """
+        Wait until a watch on `plural` is open, returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while not self.open_watches[plural]:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.store.close()
+        self.shutdown()
+        self.server_close()
@@ -1,4 +1,8 @@
+import atexit
+import logging
+import os
 import tempfile
+import threading
 import base64
 from datetime import datetime, timedelta
 
@@ -12,8 +16,16 @@ from awscli.customizations.eks.get_token import (
     TOKEN_EXPIRATION_MINS,
 )
 
+logger = logging.getLogger(__name__)
+
 client_factory = STSClientFactory(session=session.get_session())
 
+# Refresh the token this long before it expires.
+TOKEN_REFRESH_MARGIN = timedelta(minutes=2)
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
 
 class EKSAPIClient:
     """
@@ -23,10 +35,14 @@ class EKSAPIClient:
     This is supposed to be used in place of default kubernetes.client.ApiClient.
     """
 
-    def __init__(self, eks_cluster_name: str) -> None:
+    def __init__(self, eks_cluster_name: str, auto_refresh: bool = False) -> None:
         self.eks_cluster_name = eks_cluster_name
         self.eks_cluster_data = self._get_eks_cluster_data()
+        self._cafile = None
+        self._refresh_timer = None
         self.api_client = self._k8s_api_client()
+        if auto_refresh:
+            self._schedule_token_refresh()
 
     def _get_eks_cluster_data(self):
         eks = boto3.client("eks")
@@ -34,11 +50,10 @@ class EKSAPIClient:
         return cluster_data
 
     def _write_cafile(self, data: str) -> tempfile.NamedTemporaryFile:
-        cafile = tempfile.NamedTemporaryFile(delete=False)
         cadata_b64 = data
         cadata = base64.b64decode(cadata_b64)
-        cafile.write(cadata)
-        cafile.flush()
+        with tempfile.NamedTemporaryFile(delete=False) as cafile:
+            cafile.write(cadata)
         return cafile.name
 
     def _get_token(self) -> str:
@@ -46,6 +61,42 @@ class EKSAPIClient:
         expiry = datetime.now(pytz.utc) + timedelta(minutes=TOKEN_EXPIRATION_MINS)
         return TokenGenerator(sts_client).get_token(self.eks_cluster_name), expiry
 
+    def _refresh_token(self, kconfig):
+        token, expiry = self._get_token()
+        kconfig.api_key = {"authorization": f"Bearer {token}"}
+        kconfig.expiry = expiry
+
+    def _schedule_token_refresh(self):
+        """
+        Refresh the token in the background shortly before it expires so that
+        requests never have to wait for STS.
+        """
+        kconfig = self.api_client.configuration
+        refresh_in = (kconfig.expiry - TOKEN_REFRESH_MARGIN - datetime.now(pytz.utc)).total_seconds()
+
+        def _refresh():
+            try:
+                self._refresh_token(kconfig)
+            except Exception:
+                # The request time hook will retry once the token has expired.
+                logger.exception("Failed to refresh EKS token for cluster '%s'", self.eks_cluster_name)
+            self._schedule_token_refresh()
+
+        self._refresh_timer = threading.Timer(max(refresh_in, 0), _refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def close(self):
+        """
+        Stop token refreshes, release pooled connections and remove the CA file.
+        """
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+        self.api_client.close()
+        self.api_client.rest_client.pool_manager.clear()
+        if self._cafile and os.path.exists(self._cafile):
+            os.remove(self._cafile)
+
     def _k8s_api_client(self):
         """
         Returns k8s api client given eks awscli client.
@@ -56,9 +107,7 @@ class EKSAPIClient:
             A hook to refresh EKS token when it expires.
             """
             if kconfig.expiry <= datetime.now(pytz.utc):
-                token, expiry = self._get_token()
-                kconfig.api_key = {"authorization": f"Bearer {token}"}
-                kconfig.expiry = expiry
+                self._refresh_token(kconfig)
 
         # Build k8s configuration with auth token and a hook
         # to refresh that auth token once expired.
@@ -67,7 +116,25 @@ class EKSAPIClient:
             host=self.eks_cluster_data["endpoint"],
             api_key={"authorization": f"Bearer {token}"},
         )
-        kconfig.ssl_ca_cert = self._write_cafile(data=self.eks_cluster_data["certificateAuthority"]["data"])
+        self._cafile = self._write_cafile(data=self.eks_cluster_data["certificateAuthority"]["data"])
+        kconfig.ssl_ca_cert = self._cafile
         kconfig.expiry = expiry
         kconfig.refresh_api_key_hook = _refresh_eks_token
         return client.ApiClient(configuration=kconfig)
+
+
+def get_shared_eks_api_client(eks_cluster_name: str) -> client.ApiClient:
+    """
+    Get the k8s api client of a long-lived EKSAPIClient shared by the whole process.
+
+    The client keeps its token fresh in the background and reuses its connection
+    pool across callers. Clients are keyed by pid so forked workers never share
+    a connection pool or a refresh thread with their parent.
+    """
+    key = (os.getpid(), eks_cluster_name)
+    with _shared_clients_lock:
+        if key not in _shared_clients:
+            eks = EKSAPIClient(eks_cluster_name, auto_refresh=True)
+            atexit.register(eks.close)
+            _shared_clients[key] = eks
+        return _shared_clients[key].api_client
@@ -1,6 +1,10 @@
 import json
 import logging
+import os
 import ssl
+import threading
+import time
+from collections import deque
 from typing import Tuple
 import pika
 
@@ -75,3 +79,281 @@ class PublisherConnectionManager:
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self._close()
+
+
+class AsyncPublisher:
+    """
+    Publishes messages from a dedicated thread, so that callers never wait on RabbitMQ.
+
+    Messages are queued in memory, up to `max_queue_size`. The publisher thread sends
+    them in batches of up to `batch_size`, then waits for the broker to confirm the whole
+    batch before sending the next one. Unconfirmed messages are put back when the broker
+    goes away, and the thread reconnects with a growing delay. A message the broker
+    rejects (nack) is retried up to `max_attempts` times, then dropped.
+
+    When the queue is full, e.g. while the broker is down, `overflow` decides what
+    happens to new messages:
+    - "block": wait up to `block_timeout` seconds for room (backpressure), then drop.
+    - "drop": drop them right away.
+    - "spill": append them to the `spill_path` file, sent once the queue drains.
+    """
+
+    log_prefix = "[PUBLISHER]"
+    EXCHANGE = PublisherConnectionManager.EXCHANGE
+    TYPE = PublisherConnectionManager.TYPE
+    OVERFLOW_POLICIES = ("block", "drop", "spill")
+    MAX_RECONNECT_DELAY = 30
+
+    def __init__(
+        self,
+        rabbitmq_credentials: Tuple[str],
+        rabbitmq_url: Tuple[str],
+        configure_ssl: bool = False,
+        max_queue_size: int = 10000,
+        batch_size: int = 100,
+        overflow: str = "block",
+        block_timeout: float = 5,
+        spill_path: str = None,
+        max_attempts: int = 5,
+    ):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        if overflow == "spill" and not spill_path:
+            raise ValueError("The spill overflow policy needs a spill path")
+
+        credentials = pika.PlainCredentials(*rabbitmq_credentials)
+        self._params = pika.connection.ConnectionParameters(*rabbitmq_url, credentials)
+        if configure_ssl:
+            self._params.ssl_options = get_ssl_options()
+
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.spill_path = spill_path
+        self.max_attempts = max_attempts
+
+        # Queued messages are (routing key, message, queued at, nacked attempts) tuples.
+        self._messages = deque()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self._conn = None
+        self._channel = None
+        # Set while the connection waits for messages, publish() then wakes it up.
+        self._idle = False
+        # Messages of the current batch waiting for their confirm, by delivery tag.
+        self._unconfirmed = {}
+        self._delivery_tag = 0
+        self._confirmed = False
+        self._latencies = deque(maxlen=1000)
+        self.published = self.dropped = self.spilled = self.rejected = 0
+
+    def publish(self, routing_key, msg):
+        """Queue msg to be published, applying the overflow policy when the queue is full."""
+
+        with self._condition:
+            if len(self._messages) >= self.max_queue_size and self.overflow == "block":
+                self._condition.wait_for(lambda: len(self._messages) < self.max_queue_size, self.block_timeout)
+            if len(self._messages) >= self.max_queue_size:
+                if self.overflow == "spill":
+                    self._spill(routing_key, msg)
+                else:
+                    self.dropped += 1
+                    logger.warning(f"{self.log_prefix} Queue full, dropping message {msg} to {routing_key}")
+                return
+            self._messages.append((routing_key, msg, time.monotonic(), 0))
+            self._wake_up()
+
+    def _wake_up(self):
+        # Called with the condition held.
+        self._condition.notify_all()
+        if self._idle:
+            self._idle = False
+            self._conn.ioloop.add_callback_threadsafe(self._publish_batch)
+
+    def _spill(self, routing_key, msg):
+        with open(self.spill_path, "a") as f:
+            f.write(json.dumps({"routing_key": routing_key, "msg": msg}) + "\n")
+        self.spilled += 1
+
+    def _unspill(self):
+        # Called with the condition held, once the queue is empty.
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        with open(self.spill_path) as f:
+            lines = f.readlines()
+        size = self.max_queue_size
+        queued, left = lines[:size], lines[size:]
+        now = time.monotonic()
+        for line in queued:
+            spilled = json.loads(line)
+            self._messages.append((spilled["routing_key"], spilled["msg"], now, 0))
+        with open(self.spill_path, "w") as f:
+            f.writelines(left)
+        logger.info(f"{self.log_prefix} Queued {len(queued)} spilled messages")
+
+    # The methods below run in the publisher thread, from the connection's I/O loop.
+
+    def _on_connection_open(self, conn):
+        conn.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, conn, exc):
+        logger.warning(f"{self.log_prefix} Failed to connect: {exc!r}")
+        conn.ioloop.stop()
+
+    def _on_connection_closed(self, conn, reason):
+        if self._unconfirmed or not self._stopping:
+            logger.warning(f"{self.log_prefix} Connection closed: {reason!r}")
+        conn.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self._channel = channel
+        self._delivery_tag = 0
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.exchange_declare(
+            exchange=self.EXCHANGE,
+            exchange_type=self.TYPE,
+            callback=lambda frame: channel.confirm_delivery(self._on_delivery, callback=self._on_confirm_select),
+        )
+
+    def _on_channel_closed(self, channel, reason):
+        if self._conn.is_open:
+            logger.warning(f"{self.log_prefix} Channel closed: {reason!r}")
+        self._close()
+
+    def _close(self):
+        if self._conn.is_open:
+            logger.info(f"{self.log_prefix} Closing queue connection")
+            self._conn.close()
+
+    def _on_confirm_select(self, frame):
+        logger.info(f"{self.log_prefix} Connected")
+        self._publish_batch()
+
+    def _publish_batch(self):
+        """Publish the next batch, its confirms are received by `_on_delivery`."""
+
+        if not self._channel or not self._channel.is_open:
+            return
+        with self._condition:
+            if not self._messages:
+                self._unspill()
+            if not self._messages:
+                if self._stopping:
+                    self._close()
+                else:
+                    self._idle = True
+                return
+            batch = [self._messages.popleft() for _ in range(min(self.batch_size, len(self._messages)))]
+            self._condition.notify_all()
+
+        for index, (routing_key, msg, queued_at, attempts) in enumerate(batch):
+            try:
+                self._channel.basic_publish(
+                    exchange=self.EXCHANGE,
+                    routing_key=routing_key,
+                    body=json.dumps(msg).encode(),
+                )
+            except pika.exceptions.AMQPError as exc:
+                logger.warning(f"{self.log_prefix} Failed to publish message {msg} to {routing_key}: {exc!r}")
+                with self._condition:
+                    self._messages.extendleft(reversed(batch[index:]))
+                self._close()
+                return
+            self._delivery_tag += 1
+            self._unconfirmed[self._delivery_tag] = (routing_key, msg, queued_at, attempts)
+
+    def _on_delivery(self, frame):
+        """Handle a broker ack or nack, for one delivery tag or every tag up to it."""
+
+        acked = isinstance(frame.method, pika.spec.Basic.Ack)
+        if frame.method.multiple:
+            tags = [tag for tag in self._unconfirmed if tag <= frame.method.delivery_tag]
+        else:
+            tags = [frame.method.delivery_tag] if frame.method.delivery_tag in self._unconfirmed else []
+
+        retried = []
+        for tag in tags:
+            routing_key, msg, queued_at, attempts = self._unconfirmed.pop(tag)
+            if acked:
+                self._latencies.append(time.monotonic() - queued_at)
+                self.published += 1
+                logger.info(f"{self.log_prefix} Message {msg} sent to {routing_key}")
+            elif attempts + 1 < self.max_attempts:
+                logger.warning(f"{self.log_prefix} Message {msg} to {routing_key} rejected, retrying")
+                retried.append((routing_key, msg, queued_at, attempts + 1))
+            else:
+                self.rejected += 1
+                logger.error(
+                    f"{self.log_prefix} Message {msg} to {routing_key} rejected {attempts + 1} times, dropping"
+                )
+        if retried:
+            with self._condition:
+                self._messages.extendleft(reversed(retried))
+
+        if not self._unconfirmed:
+            self._confirmed = True
+            self._publish_batch()
+
+    def _run(self):
+        reconnect_delay = 1
+        while True:
+            with self._condition:
+                self._idle = False
+                self._confirmed = False
+                self._channel = None
+                self._conn = pika.SelectConnection(
+                    self._params,
+                    on_open_callback=self._on_connection_open,
+                    on_open_error_callback=self._on_connection_open_error,
+                    on_close_callback=self._on_connection_closed,
+                )
+            # Runs until the connection is closed: when stopping, or when the broker goes away.
+            self._conn.ioloop.start()
+
+            with self._condition:
+                self._idle = False
+                # Put back what the broker didn't confirm, in order.
+                self._messages.extendleft(reversed([self._unconfirmed[tag] for tag in sorted(self._unconfirmed)]))
+                self._unconfirmed.clear()
+                if self._stopping and not self._messages:
+                    return
+            if self._stopping:
+                logger.warning(f"{self.log_prefix} Stopping with {len(self._messages)} messages not sent")
+                return
+            if self._confirmed:
+                reconnect_delay = 1
+            time.sleep(reconnect_delay)
+            reconnect_delay = min(2 * reconnect_delay, self.MAX_RECONNECT_DELAY)
+
+    @property
+    def stats(self):
+        """
+        Queue depth, messages published, dropped, spilled and rejected by the broker,
+        and p50/p95 publish latency in seconds.
+        """
+
+        latencies = sorted(self._latencies)
+        return {
+            "depth": len(self._messages),
+            "published": self.published,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "rejected": self.rejected,
+            "latency_p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+            "latency_p95": round(latencies[int(len(latencies) * 0.95)], 3) if latencies else None,
+        }
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name="publisher", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        with self._condition:
+            self._stopping = True
+            if self._conn:
+                self._wake_up()
+        # Queued messages are sent before leaving, unless the broker is down.
+        self._thread.join()
@@ -0,0 +1,13 @@
+import zlib
+
+# Label of the workspace pods and namespaces, the shard their workspace allocation belongs to.
+SHARD_LABEL = "shard"
+
+
+def get_shard(workspace_allocation_id, shards):
+    """
+    Shard of a workspace allocation, out of `shards`.
+
+    A CRC is used rather than `hash()`, so that every process agrees on it.
+    """
+    return zlib.crc32(str(workspace_allocation_id).encode("utf-8")) % shards
@@ -2,7 +2,10 @@ from django.contrib import admin
 
 from .models import (
     Assignment,
+    AssignmentArtifact,
     AssignmentTag,
+    GoldenSnapshot,
+    PooledVolume,
     Submission,
     WorkspaceConfiguration,
     WorkspaceAllocation,
@@ -41,9 +44,52 @@ class SubmissionAdmin(admin.ModelAdmin):
         return obj.workspace_allocation.learner.id
 
 
+@admin.register(AssignmentArtifact)
+class AssignmentArtifactAdmin(admin.ModelAdmin):
+    list_display = (
+        "assignment",
+        "status",
+        "commit",
+        "size",
+        "created_at",
+    )
+    list_filter = ("status",)
+
+
+@admin.register(GoldenSnapshot)
+class GoldenSnapshotAdmin(admin.ModelAdmin):
+    list_display = (
+        "assignment",
+        "status",
+        "size",
+        "snapshot_id",
+        "created_at",
+    )
+    list_filter = ("status",)
+
+
+@admin.register(PooledVolume)
+class PooledVolumeAdmin(admin.ModelAdmin):
+    list_display = (
+        "volume_id",
+        "size",
+        "availability_zone",
+        "created_at",
+    )
+    list_filter = ("size", "availability_zone")
+
+
 @admin.register(WorkspaceConfiguration)
 class WorkspaceConfigurationAdmin(admin.ModelAdmin):
-    list_display = ("assignment", "docker_image")
+    list_display = (
+        "assignment",
+        "docker_image",
+        "hibernate_workspaces",
+        "warm_pool_size",
+        "warm_pool_hits",
+        "warm_pool_misses",
+    )
+    readonly_fields = ("warm_pool_hits", "warm_pool_misses")
 
 
 @admin.register(WorkspaceAllocation)
@@ -53,8 +99,11 @@ class WorkspaceAllocationAdmin(admin.ModelAdmin):
         "learner",
         "workspace_status",
         "workspace_url",
+        "is_standby",
+        "hibernated_at",
         "created_at",
     )
+    list_filter = ("is_standby",)
 
 
 @admin.register(WorkspaceSession)
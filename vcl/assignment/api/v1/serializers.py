@@ -12,4 +12,5 @@ class WorkspaceAllocationSerializer(serializers.ModelSerializer):
             "workspace_status",
             "workspace_status_updated_at",
             "debug",
+            "launch_queue_position",
         )
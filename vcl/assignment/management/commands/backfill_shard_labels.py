@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from workspace.sharding import ShardLabelBackfill
+
+
+class Command(BaseCommand):
+    """
+    A management command which adds the shard label to the workspaces created before
+    workspaces were sharded. Run it before scaling the k8s-watcher above one replica, the
+    replicas only watch the workspace pods with a shard label.
+
+    An example usage is as follow:
+
+        python manage.py backfill_shard_labels --dry-run
+        python manage.py backfill_shard_labels --restart-running
+    """
+
+    help = "Adds the shard label to the workspace namespaces, pods and deployments missing it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the resources to label.")
+        parser.add_argument(
+            "--restart-running",
+            action="store_true",
+            help="Also label the pod template of running deployments, which restarts their workspace.",
+        )
+
+    def handle(self, *args, **options):
+        backfill = ShardLabelBackfill(dry_run=options["dry_run"], restart_running=options["restart_running"])
+        report = backfill.run(
+            on_label=lambda kind, namespace, shard: self.stdout.write(f"{kind}\t{namespace}\t{shard}")
+        )
+        self.stdout.write(
+            f"{report['namespaces']} namespaces, {report['pods']} pods "
+            f"and {report['deployments']} deployments labelled."
+        )
+        if report["running"]:
+            self.stdout.write(
+                f"{report['running']} running deployments left as is, their pod is labelled but a new one "
+                "wouldn't be, use --restart-running to label them too."
+            )
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from vcl.storage import OrphanedVolumeCollector
+
+
+class Command(BaseCommand):
+    """
+    A management command which deletes the workspace volumes of this environment that no
+    workspace allocation nor the volume pool uses anymore.
+
+    An example usage is as follow:
+
+        python manage.py collect_orphaned_volumes --dry-run
+        python manage.py collect_orphaned_volumes --snapshot --batch-size 10 --batch-delay 2
+    """
+
+    help = "Deletes orphaned workspace volumes, optionally snapshotting them first."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the orphaned volumes.")
+        parser.add_argument("--snapshot", action="store_true", help="Snapshot orphaned volumes before deleting them.")
+        parser.add_argument("--batch-size", type=int, help="Volumes deleted between two pauses.")
+        parser.add_argument("--batch-delay", type=float, help="Seconds to pause between two batches.")
+        parser.add_argument("--grace-period", type=int, help="Hours during which new volumes are kept.")
+
+    def handle(self, *args, **options):
+        if settings.APP_ENV == "DEV":
+            raise CommandError("Workspaces don't use EBS volumes in the DEV environment")
+
+        collector = OrphanedVolumeCollector(
+            dry_run=options["dry_run"],
+            snapshot=options["snapshot"],
+            batch_size=options["batch_size"],
+            batch_delay=options["batch_delay"],
+            grace_period=options["grace_period"],
+        )
+        report = collector.run(
+            on_orphan=lambda volume: self.stdout.write(
+                f"{volume['VolumeId']}\t{volume['Size']}GiB\t{volume['CreateTime'].isoformat()}"
+            )
+        )
+        self.stdout.write(
+            f"{report['orphaned']} orphaned volumes ({report['orphaned_gb']}GiB) out of {report['scanned']} scanned."
+        )
+        if not options["dry_run"]:
+            self.stdout.write(f"{report['collected']} collected, {report['failed']} failed.")
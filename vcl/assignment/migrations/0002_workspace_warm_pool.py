@@ -0,0 +1,51 @@
+# Generated by Django 3.2.13 on 2026-10-17 19:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assignment", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workspaceallocation",
+            name="is_standby",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="workspaceconfiguration",
+            name="warm_pool_hits",
+            field=models.PositiveIntegerField(default=0, help_text="Launches served by a standby workspace."),
+        ),
+        migrations.AddField(
+            model_name="workspaceconfiguration",
+            name="warm_pool_misses",
+            field=models.PositiveIntegerField(
+                default=0, help_text="First launches that found no standby workspace to claim."
+            ),
+        ),
+        migrations.AddField(
+            model_name="workspaceconfiguration",
+            name="warm_pool_size",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Number of booted standby workspaces kept ready to be claimed by learners. 0 disables the pool.",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="workspaceallocation",
+            name="learner",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Empty for standby workspaces of the warm pool.",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="workspace_allocations",
+                to="assignment.workspaceuser",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.13 on 2026-10-17 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assignment", "0002_workspace_warm_pool"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workspaceallocation",
+            name="namespace_deleted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="workspaceallocation",
+            name="namespace_deletion_requested_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.13 on 2026-10-17 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assignment", "0003_workspace_namespace_deletion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workspaceallocation",
+            name="hibernated_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="workspaceconfiguration",
+            name="hibernate_workspaces",
+            field=models.BooleanField(
+                default=False,
+                help_text="Keep the namespace of ended sessions and only scale the workspace down, so that it resumes quickly. Hibernated workspaces are dropped after WORKSPACES_HIBERNATION_TTL hours.",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.13 on 2026-10-17 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assignment", "0004_workspace_hibernation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workspaceallocation",
+            name="launch_priority",
+            field=models.PositiveSmallIntegerField(
+                blank=True, choices=[(0, "Instructor"), (1, "Student"), (2, "Standby")], null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="workspaceallocation",
+            name="launch_queued_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
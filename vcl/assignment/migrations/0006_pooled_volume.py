@@ -0,0 +1,23 @@
+# Generated by Django 3.2.13 on 2026-10-17 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assignment", "0005_workspace_launch_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PooledVolume",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("volume_id", models.CharField(max_length=32, unique=True)),
+                ("size", models.PositiveIntegerField(help_text="Volume size, in GiB.")),
+                ("availability_zone", models.CharField(max_length=32)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
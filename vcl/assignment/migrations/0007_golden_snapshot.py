@@ -0,0 +1,50 @@
+# Generated by Django 3.2.13 on 2026-10-17 19:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assignment", "0006_pooled_volume"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GoldenSnapshot",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("code_repo", models.URLField(help_text="Code repo the snapshot was built from.")),
+                ("size", models.PositiveIntegerField(help_text="Volume size, in GiB.")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Building", "Building"),
+                            ("Snapshotting", "Snapshotting"),
+                            ("Ready", "Ready"),
+                            ("Failed", "Failed"),
+                        ],
+                        default="Building",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "volume_id",
+                    models.CharField(blank=True, help_text="Volume the snapshot is built on.", max_length=32),
+                ),
+                ("snapshot_id", models.CharField(blank=True, max_length=32)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "assignment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="golden_snapshots",
+                        to="assignment.assignment",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.13 on 2026-10-17 19:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assignment", "0007_golden_snapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AssignmentArtifact",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("code_repo", models.URLField(help_text="Code repo the artifact was built from.")),
+                (
+                    "commit",
+                    models.CharField(help_text="Commit of the code repo the artifact was built from.", max_length=40),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("Building", "Building"), ("Ready", "Ready"), ("Failed", "Failed")],
+                        default="Building",
+                        max_length=20,
+                    ),
+                ),
+                ("size", models.PositiveBigIntegerField(blank=True, help_text="Tarball size, in bytes.", null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "assignment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="artifacts",
+                        to="assignment.assignment",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="assignmentartifact",
+            constraint=models.UniqueConstraint(
+                fields=("assignment", "code_repo", "commit"), name="unique_assignment_artifact"
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.13 on 2026-10-17 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assignment", "0008_assignment_artifact"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workspacesession",
+            name="init_telemetry",
+            field=models.JSONField(
+                blank=True,
+                help_text="Phase durations and sizes reported by the init container of the workspace.",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.2.13 on 2026-10-17 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assignment", "0009_workspacesession_init_telemetry"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="assignmentartifact",
+            name="unique_assignment_artifact",
+        ),
+        migrations.AddField(
+            model_name="assignment",
+            name="code_ref",
+            field=models.CharField(
+                blank=True,
+                help_text="Branch or tag of the code repo to checkout, its default branch if empty.",
+                max_length=255,
+            ),
+        ),
+        migrations.AddField(
+            model_name="assignment",
+            name="code_subdirectory",
+            field=models.CharField(
+                blank=True,
+                help_text="Folder of the code repo learners get, with a sparse checkout. The whole repo if empty.",
+                max_length=255,
+            ),
+        ),
+        migrations.AddField(
+            model_name="assignment",
+            name="shallow_clone",
+            field=models.BooleanField(
+                default=True, help_text="Only clone the latest commit of the code repo, its history is dropped anyway."
+            ),
+        ),
+        migrations.AddField(
+            model_name="assignmentartifact",
+            name="code_ref",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="assignmentartifact",
+            name="code_subdirectory",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="goldensnapshot",
+            name="code_ref",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="goldensnapshot",
+            name="code_subdirectory",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name="assignmentartifact",
+            constraint=models.UniqueConstraint(
+                fields=("assignment", "code_repo", "code_ref", "code_subdirectory", "commit"),
+                name="unique_assignment_artifact",
+            ),
+        ),
+    ]
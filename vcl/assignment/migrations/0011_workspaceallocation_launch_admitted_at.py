@@ -0,0 +1,18 @@
+# Generated by Django 3.2.13 on 2026-10-17 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assignment", "0010_assignment_checkout_options"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workspaceallocation",
+            name="launch_admitted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.13 on 2026-10-17 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assignment", "0011_workspaceallocation_launch_admitted_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="goldensnapshot",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("Building", "Building"),
+                    ("Snapshotting", "Snapshotting"),
+                    ("Ready", "Ready"),
+                    ("Failed", "Failed"),
+                    ("Outdated", "Outdated"),
+                ],
+                default="Building",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -3,15 +3,16 @@ import uuid
 from decimal import Decimal
 from urllib.parse import urljoin
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.contrib.postgres.fields import ArrayField
-from django.db.models.signals import pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
 from common.utils import CommonActionsMixin
+from vcl.storage import get_artifacts_client
 from workspace import Workspace
 
 logger = logging.getLogger(__name__)
@@ -37,12 +38,155 @@ class Assignment(models.Model):
     max_attempts = models.IntegerField(default=1)
     max_score = models.IntegerField(default=100)
     code_repo = models.URLField()
+    code_ref = models.CharField(
+        max_length=255, blank=True, help_text="Branch or tag of the code repo to checkout, its default branch if empty."
+    )
+    code_subdirectory = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="Folder of the code repo learners get, with a sparse checkout. The whole repo if empty.",
+    )
+    shallow_clone = models.BooleanField(
+        default=True, help_text="Only clone the latest commit of the code repo, its history is dropped anyway."
+    )
 
     tags = models.ManyToManyField(AssignmentTag, related_name="assignments", blank=True)
 
     def __str__(self):
         return f"{self.name}"
 
+    def get_golden_snapshot(self, size):
+        """
+        Latest golden snapshot built from the current code repo for volumes of the given size, if any.
+        """
+        return (
+            self.golden_snapshots.filter(
+                status=GoldenSnapshot.Status.READY,
+                code_repo=self.code_repo,
+                code_ref=self.code_ref,
+                code_subdirectory=self.code_subdirectory,
+                size=size,
+            )
+            .order_by("-created_at")
+            .first()
+        )
+
+    def get_artifact(self):
+        """
+        Latest artifact built from the current code repo, if any.
+        """
+        return (
+            self.artifacts.filter(
+                status=AssignmentArtifact.Status.READY,
+                code_repo=self.code_repo,
+                code_ref=self.code_ref,
+                code_subdirectory=self.code_subdirectory,
+            )
+            .order_by("-created_at")
+            .first()
+        )
+
+
+class AssignmentArtifact(models.Model):
+    """
+    Tarball of the assignment code at a commit, already reset to a single commit and
+    owned by the workspace user, init containers extract it instead of cloning the repo.
+    """
+
+    class Status(models.TextChoices):
+        BUILDING = "Building"
+        READY = "Ready"
+        FAILED = "Failed"
+
+    assignment = models.ForeignKey(
+        "assignment.Assignment",
+        on_delete=models.CASCADE,
+        related_name="artifacts",
+    )
+    code_repo = models.URLField(help_text="Code repo the artifact was built from.")
+    code_ref = models.CharField(max_length=255, blank=True)
+    code_subdirectory = models.CharField(max_length=255, blank=True)
+    commit = models.CharField(max_length=40, help_text="Commit of the code repo the artifact was built from.")
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.BUILDING)
+    size = models.PositiveBigIntegerField(null=True, blank=True, help_text="Tarball size, in bytes.")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["assignment", "code_repo", "code_ref", "code_subdirectory", "commit"],
+                name="unique_assignment_artifact",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.assignment} | {self.commit[:8]} | {self.status}"
+
+    @property
+    def key(self):
+        return f"assignments/{self.assignment_id}/{self.commit}-{self.id}.tar.gz"
+
+    @property
+    def download_url(self):
+        """
+        Presigned URL of the tarball, init containers can't authenticate to the storage.
+        """
+        return get_artifacts_client().generate_presigned_url(
+            "get_object",
+            Params={"Bucket": settings.WORKSPACES_ARTIFACTS_BUCKET, "Key": self.key},
+            ExpiresIn=settings.WORKSPACES_ARTIFACTS_URL_EXPIRY,
+        )
+
+    def update_status(self, status, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.status = status
+        self.save(update_fields=["status", "updated_at", *fields])
+
+
+class GoldenSnapshot(models.Model):
+    """
+    EBS snapshot of a workspace volume with the assignment code already checked out
+    and owned by the workspace user, first launches create learner volumes from it.
+    """
+
+    class Status(models.TextChoices):
+        BUILDING = "Building"
+        SNAPSHOTTING = "Snapshotting"
+        READY = "Ready"
+        FAILED = "Failed"
+        # Replaced by a newer snapshot, deleted once no launch can still be using it.
+        OUTDATED = "Outdated"
+
+    assignment = models.ForeignKey(
+        "assignment.Assignment",
+        on_delete=models.CASCADE,
+        related_name="golden_snapshots",
+    )
+    code_repo = models.URLField(help_text="Code repo the snapshot was built from.")
+    code_ref = models.CharField(max_length=255, blank=True)
+    code_subdirectory = models.CharField(max_length=255, blank=True)
+    size = models.PositiveIntegerField(help_text="Volume size, in GiB.")
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.BUILDING)
+    volume_id = models.CharField(max_length=32, blank=True, help_text="Volume the snapshot is built on.")
+    snapshot_id = models.CharField(max_length=32, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.assignment} | {self.snapshot_id or self.volume_id} | {self.status}"
+
+    @property
+    def job_name(self):
+        return f"golden-snapshot-{self.id}"
+
+    def update_status(self, status, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.status = status
+        self.save(update_fields=["status", "updated_at", *fields])
+
 
 class Submission(models.Model):
     class Status(models.TextChoices):
@@ -101,6 +245,21 @@ class WorkspaceConfiguration(models.Model):
             "Persistent storage size (GiB) used for assignment files. System dependencies use a separated storage."
         ),
     )
+    hibernate_workspaces = models.BooleanField(
+        default=False,
+        help_text=(
+            "Keep the namespace of ended sessions and only scale the workspace down, so that it resumes quickly. "
+            "Hibernated workspaces are dropped after WORKSPACES_HIBERNATION_TTL hours."
+        ),
+    )
+    warm_pool_size = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of booted standby workspaces kept ready to be claimed by learners. 0 disables the pool.",
+    )
+    warm_pool_hits = models.PositiveIntegerField(default=0, help_text="Launches served by a standby workspace.")
+    warm_pool_misses = models.PositiveIntegerField(
+        default=0, help_text="First launches that found no standby workspace to claim."
+    )
 
     def __str__(self):
         return (
@@ -113,6 +272,20 @@ class WorkspaceConfiguration(models.Model):
         )
 
 
+class PooledVolume(models.Model):
+    """
+    Pre-created, unattached EBS volume waiting to be claimed by the first launch of a workspace.
+    """
+
+    volume_id = models.CharField(max_length=32, unique=True)
+    size = models.PositiveIntegerField(help_text="Volume size, in GiB.")
+    availability_zone = models.CharField(max_length=32)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.volume_id} ({self.size}GiB, {self.availability_zone})"
+
+
 class WorkspaceStatus(models.TextChoices):
     """
     This is in compliance to:
@@ -125,6 +298,24 @@ class WorkspaceStatus(models.TextChoices):
     UNKNOWN = "Unknown"
 
 
+class LaunchPriority(models.IntegerChoices):
+    """
+    Order in which queued workspace launches are admitted, lowest first.
+    """
+
+    INSTRUCTOR = 0
+    STUDENT = 1
+    STANDBY = 2
+
+
+class WorkspaceAllocationQuerySet(models.QuerySet):
+    def launch_queue(self):
+        return self.filter(launch_queued_at__isnull=False).order_by("launch_priority", "launch_queued_at")
+
+    def launch_admitted(self):
+        return self.filter(launch_admitted_at__isnull=False)
+
+
 class WorkspaceAllocation(models.Model, CommonActionsMixin):
     class Meta:
         unique_together = (("assignment", "learner"),)
@@ -138,7 +329,11 @@ class WorkspaceAllocation(models.Model, CommonActionsMixin):
         "assignment.WorkspaceUser",
         on_delete=models.CASCADE,
         related_name="workspace_allocations",
+        null=True,
+        blank=True,
+        help_text="Empty for standby workspaces of the warm pool.",
     )
+    is_standby = models.BooleanField(default=False)
     volume = models.JSONField(
         null=True,
         blank=True,
@@ -148,11 +343,20 @@ class WorkspaceAllocation(models.Model, CommonActionsMixin):
     # workspace metadata fields
     workspace_status = models.CharField(max_length=255, choices=WorkspaceStatus.choices, null=True, blank=True)
     workspace_status_updated_at = models.DateTimeField(null=True, blank=True)
+    namespace_deletion_requested_at = models.DateTimeField(null=True, blank=True)
+    namespace_deleted_at = models.DateTimeField(null=True, blank=True)
+    hibernated_at = models.DateTimeField(null=True, blank=True)
+    launch_priority = models.PositiveSmallIntegerField(choices=LaunchPriority.choices, null=True, blank=True)
+    launch_queued_at = models.DateTimeField(null=True, blank=True)
+    # Admitted launches keep their capacity reserved until their pod exists.
+    launch_admitted_at = models.DateTimeField(null=True, blank=True)
 
     debug = models.BooleanField(default=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = WorkspaceAllocationQuerySet.as_manager()
+
     @property
     def workspace_url(self):
         return urljoin(
@@ -188,35 +392,143 @@ class WorkspaceAllocation(models.Model, CommonActionsMixin):
 
         return session
 
+    @classmethod
+    def claim_standby(cls, assignment, learner):
+        """
+        Hand a booted standby workspace from the assignment's warm pool over to the learner.
+
+        Returns the claimed allocation, or `None` if the warm pool is disabled or empty.
+        """
+        from .tasks import relabel_workspace
+
+        ws_conf = getattr(assignment, "workspace_configuration", None)
+        if not ws_conf or not ws_conf.warm_pool_size:
+            return None
+
+        try:
+            with transaction.atomic():
+                standby = (
+                    cls.objects.select_for_update(skip_locked=True)
+                    .filter(assignment=assignment, is_standby=True, workspace_status=WorkspaceStatus.RUNNING)
+                    .order_by("created_at")
+                    .first()
+                )
+                if standby:
+                    standby.learner = learner
+                    standby.is_standby = False
+                    standby.save(update_fields=["learner", "is_standby"])
+        except IntegrityError:
+            # A concurrent launch of the learner, e.g. a double click, claimed another standby first.
+            logger.info("Learner %s already claimed a standby workspace of %s", learner.id, assignment.id)
+            return cls.get_or_none(assignment=assignment, learner=learner)
+
+        counter = "warm_pool_hits" if standby else "warm_pool_misses"
+        WorkspaceConfiguration.objects.filter(id=ws_conf.id).update(**{counter: models.F(counter) + 1})
+
+        if standby:
+            logger.info("Claimed standby workspace wa-%d for learner %s", standby.id, learner.id)
+            relabel_workspace.apply_async(args=(standby.id,))
+        return standby
+
     def launch_workspace_async(self, instructor=None):
         """
         Launch workspace asynchronously.
+
+        With launch admission enabled, the launch is queued and only submitted to the
+        cluster once its node group has room for it.
         """
-        from .tasks import launch_workspace
+        from .tasks import admit_queued_launches, launch_workspace
 
         # 1) Initiate workspace session
         active_session = self.get_active_session()
         if not active_session:
-            WorkspaceSession.create_from_workspace_allocation(workspace_allocation=self, instructor=instructor)
+            active_session = WorkspaceSession.create_from_workspace_allocation(
+                workspace_allocation=self, instructor=instructor
+            )
+            if self.workspace_status == WorkspaceStatus.RUNNING:
+                # The workspace is already up, e.g. a standby claimed from the warm pool,
+                # so the cluster won't send another start event for this session.
+                active_session.start()
 
         # 2) Launch workspace.
-        launch_workspace.apply_async(args=(self.id,))
+        if settings.WORKSPACES_LAUNCH_ADMISSION_ENABLED and self.workspace_status != WorkspaceStatus.RUNNING:
+            self.queue_launch(LaunchPriority.INSTRUCTOR if instructor else LaunchPriority.STUDENT)
+            admit_queued_launches.apply_async()
+        else:
+            launch_workspace.apply_async(args=(self.id,))
+
+    def queue_launch(self, priority):
+        """
+        Put the workspace launch in the admission queue, keeping its place if it's already queued.
+        """
+        if self.launch_queued_at:
+            priority = min(priority, self.launch_priority)
+        else:
+            self.launch_queued_at = timezone.now()
+        self.launch_priority = priority
+        self.launch_admitted_at = None
+        self.save(update_fields=["launch_priority", "launch_queued_at", "launch_admitted_at"])
+
+    @property
+    def launch_queue_position(self):
+        """
+        1-based position in the launch admission queue, `None` if the launch isn't queued.
+        """
+        if not self.launch_queued_at:
+            return None
+        ahead = WorkspaceAllocation.objects.launch_queue().filter(
+            models.Q(launch_priority__lt=self.launch_priority)
+            | models.Q(launch_priority=self.launch_priority, launch_queued_at__lt=self.launch_queued_at)
+        )
+        return ahead.count() + 1
 
     def update_workspace_status(self, workspace_status):
         self.workspace_status = workspace_status
         self.workspace_status_updated_at = timezone.now()
         self.save(update_fields=["workspace_status", "workspace_status_updated_at"])
 
+    @property
+    def hibernation_enabled(self):
+        ws_conf = self.workspace_configuration
+        return bool(ws_conf and ws_conf.hibernate_workspaces)
+
+    @property
+    def is_namespace_deletion_pending(self):
+        return bool(self.namespace_deletion_requested_at and not self.namespace_deleted_at)
+
+    def mark_hibernated(self):
+        self.hibernated_at = timezone.now()
+        self.save(update_fields=["hibernated_at"])
+
+    def mark_resumed(self):
+        self.hibernated_at = None
+        self.save(update_fields=["hibernated_at"])
+
+    def mark_namespace_deletion_requested(self):
+        self.namespace_deletion_requested_at = timezone.now()
+        self.namespace_deleted_at = None
+        self.hibernated_at = None
+        self.save(update_fields=["namespace_deletion_requested_at", "namespace_deleted_at", "hibernated_at"])
+
+    def mark_namespace_deleted(self):
+        self.namespace_deleted_at = timezone.now()
+        self.hibernated_at = None
+        self.save(update_fields=["namespace_deleted_at", "hibernated_at"])
+
     def update_from_cluster(self):
         workspace = Workspace(self)
         workspace.update_ws_details_from_cluster(wait_for_readiness=True)
         self.update_workspace_status(workspace_status=workspace.details["status"])
 
+    @property
+    def learner_label(self):
+        return str(self.learner.id) if self.learner else "standby"
+
     def get_id(self):
-        return f"{self.assignment.id}:{self.learner.id}"
+        return f"{self.assignment.id}:{self.learner_label}"
 
     def __str__(self):
-        return f"<{self.id} | workspace status: {self.workspace_status} | learner: {self.learner.id}>"
+        return f"<{self.id} | workspace status: {self.workspace_status} | learner: {self.learner_label}>"
 
 
 @receiver(pre_delete, sender=WorkspaceAllocation, dispatch_uid="terminate_workspace_for_allocation_signal")
@@ -226,21 +538,68 @@ def terminate_workspace_for_allocation(sender, instance, using, **kwargs):
     terminate_workspace_namespace_if_exists.apply_async(args=(instance.id,))
 
 
+@receiver(post_save, sender=WorkspaceConfiguration, dispatch_uid="sync_image_prepuller_on_save_signal")
+@receiver(post_delete, sender=WorkspaceConfiguration, dispatch_uid="sync_image_prepuller_on_delete_signal")
+def sync_image_prepuller_for_configuration(sender, instance, using, **kwargs):
+    from assignment.tasks import sync_image_prepuller
+
+    transaction.on_commit(sync_image_prepuller.apply_async, using=using)
+
+
+@receiver(post_save, sender=Assignment, dispatch_uid="refresh_assignment_artifact_on_save_signal")
+def refresh_assignment_artifact_on_save(sender, instance, using, **kwargs):
+    """
+    Build an artifact of the new code repo when it changes, commits pushed later are picked up periodically.
+    """
+    from assignment.tasks import refresh_assignment_artifacts
+
+    if not settings.WORKSPACES_ARTIFACTS_BUCKET:
+        return
+
+    transaction.on_commit(
+        lambda: refresh_assignment_artifacts.apply_async(kwargs={"assignment_id": instance.id}), using=using
+    )
+
+
+@receiver(post_save, sender=Assignment, dispatch_uid="refresh_golden_snapshot_on_assignment_save_signal")
+@receiver(post_save, sender=WorkspaceConfiguration, dispatch_uid="refresh_golden_snapshot_on_configuration_save_signal")
+def refresh_golden_snapshot_on_save(sender, instance, using, **kwargs):
+    """
+    Rebuild the golden snapshot when the checkout or the storage size of an assignment changes.
+    """
+    from assignment.tasks import refresh_golden_snapshots
+
+    if not settings.WORKSPACES_GOLDEN_SNAPSHOTS_ENABLED:
+        return
+
+    assignment_id = instance.id if sender is Assignment else instance.assignment_id
+    if assignment_id:
+        transaction.on_commit(
+            lambda: refresh_golden_snapshots.apply_async(kwargs={"assignment_id": assignment_id}), using=using
+        )
+
+
 class WorkspaceSessionQuerySet(models.QuerySet):
     def active(self):
         return self.filter(is_terminated=False, expires_at__gt=timezone.now())
 
     def expired(self):
-        return self.select_related("workspace_allocation", "workspace_allocation__learner").filter(
-            is_terminated=False, expires_at__lte=timezone.now()
-        )
+        return self.select_related(
+            "workspace_allocation",
+            "workspace_allocation__learner",
+            "workspace_allocation__assignment__workspace_configuration",
+        ).filter(is_terminated=False, expires_at__lte=timezone.now())
 
     def reached_max_duration(self):
         max_duration_hours_allowed_in_past = timezone.now() - timezone.timedelta(
             hours=settings.WORKSPACES_MAX_SESSION_DURATION
         )
         return (
-            self.select_related("workspace_allocation", "workspace_allocation__learner")
+            self.select_related(
+                "workspace_allocation",
+                "workspace_allocation__learner",
+                "workspace_allocation__assignment__workspace_configuration",
+            )
             .filter(is_terminated=False, started_at__isnull=False)
             .filter(started_at__lte=max_duration_hours_allowed_in_past)
         )
@@ -266,6 +625,9 @@ class WorkspaceSession(models.Model, CommonActionsMixin):
     expires_at = models.DateTimeField(default=default_expiry)
     ended_at = models.DateTimeField(null=True, blank=True)
     is_terminated = models.BooleanField(default=False)
+    init_telemetry = models.JSONField(
+        null=True, blank=True, help_text="Phase durations and sizes reported by the init container of the workspace."
+    )
 
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
@@ -295,9 +657,10 @@ class WorkspaceSession(models.Model, CommonActionsMixin):
     def create_from_workspace_allocation(cls, workspace_allocation, instructor=None):
         return cls.objects.create(workspace_allocation=workspace_allocation, instructor=instructor)
 
-    def start(self):
+    def start(self, init_telemetry=None):
         self.started_at = timezone.now()
-        self.save(update_fields=["started_at"])
+        self.init_telemetry = init_telemetry
+        self.save(update_fields=["started_at", "init_telemetry"])
 
     def extend(self):
         self.expires_at = timezone.now() + timezone.timedelta(hours=settings.WORKSPACES_SESSION_EXTENSION_PERIOD)
@@ -307,11 +670,12 @@ class WorkspaceSession(models.Model, CommonActionsMixin):
         self.expires_at = timezone.now()
         self.save(update_fields=["expires_at"])
 
-    def terminate(self):
+    def terminate(self, reset_workspace_status=True):
         self.is_terminated = True
         self.ended_at = timezone.now()
         self.save(update_fields=["is_terminated", "ended_at"])
-        self.workspace_allocation.update_workspace_status(workspace_status=None)
+        if reset_workspace_status:
+            self.workspace_allocation.update_workspace_status(workspace_status=None)
 
 
 class WorkspaceUser(models.Model, CommonActionsMixin):
@@ -0,0 +1,234 @@
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from kubernetes import client
+
+from workspace.base import Workspace
+from workspace.utils import get_k8s_api_client
+
+from .models import WorkspaceAllocation, WorkspaceSession, WorkspaceStatus
+
+logger = logging.getLogger(__name__)
+
+
+class WorkspaceReconciler:
+    """
+    Bring workspace state in the database in line with the workspaces cluster.
+
+    A pass reads the cluster with three list calls (namespaces, workspace deployments
+    and workspace pods), diffs it against workspace allocations and sessions with a
+    few bulk queries and fixes the differences in batches:
+
+    * workspace statuses that drifted from the pods are updated.
+    * active sessions whose start event got lost are started.
+    * workspace namespaces without an allocation are dropped.
+    * running workspaces nobody has a session for are hibernated or dropped, their namespace
+      deletion is tracked like any other, by `track_namespace_deletion`.
+
+    Anything that changed during the grace period is left to the event path.
+    """
+
+    NAMESPACE_PREFIX = "wa-"
+
+    def __init__(self, api_client=None, grace_period=None, batch_size=None):
+        api_client = api_client or get_k8s_api_client()
+        self._k8s_core_v1 = client.CoreV1Api(api_client=api_client)
+        self._k8s_apps_v1 = client.AppsV1Api(api_client=api_client)
+        self.grace_period = timezone.timedelta(
+            minutes=settings.WORKSPACES_RECONCILER_GRACE_PERIOD if grace_period is None else grace_period,
+        )
+        self.batch_size = settings.WORKSPACES_RECONCILER_BATCH_SIZE if batch_size is None else batch_size
+
+    @classmethod
+    def _get_allocation_id(cls, namespace_name):
+        allocation_id = namespace_name.removeprefix(cls.NAMESPACE_PREFIX)
+        return int(allocation_id) if allocation_id.isdigit() else None
+
+    def _list_cluster_state(self):
+        """
+        Collect workspace namespaces, deployment replicas and pod statuses keyed by allocation id.
+        """
+        namespaces = {}
+        for namespace in self._k8s_core_v1.list_namespace().items:
+            if namespace.metadata.name.startswith(self.NAMESPACE_PREFIX):
+                if (allocation_id := self._get_allocation_id(namespace.metadata.name)) is not None:
+                    namespaces[allocation_id] = namespace
+
+        replicas = {}
+        for deployment in self._k8s_apps_v1.list_deployment_for_all_namespaces(
+            label_selector="workspace_allocation"
+        ).items:
+            if (allocation_id := self._get_allocation_id(deployment.metadata.namespace)) is not None:
+                replicas[allocation_id] = deployment.spec.replicas or 0
+
+        pod_statuses = {}
+        for pod in self._k8s_core_v1.list_pod_for_all_namespaces(label_selector="pod=workspace").items:
+            if (allocation_id := self._get_allocation_id(pod.metadata.namespace)) is None:
+                continue
+            if Workspace._is_pod_ready(pod):
+                pod_statuses[allocation_id] = WorkspaceStatus.RUNNING
+            elif Workspace._get_pod_failure_reason(pod):
+                pod_statuses[allocation_id] = WorkspaceStatus.FAILED
+            else:
+                pod_statuses.setdefault(allocation_id, WorkspaceStatus.PENDING)
+
+        return namespaces, replicas, pod_statuses
+
+    def _batches(self, items):
+        items = list(items)
+        # A batch size of 0 fixes everything in one batch.
+        batch_size = self.batch_size or len(items) or 1
+        for start in range(0, len(items), batch_size):
+            end = start + batch_size
+            yield items[start:end]
+
+    def _drop_namespaces(self, namespace_names):
+        for batch in self._batches(namespace_names):
+            for namespace_name in batch:
+                try:
+                    self._k8s_core_v1.delete_namespace(name=namespace_name)
+                except client.ApiException as exc:
+                    if exc.status != 404:
+                        raise
+            logger.info("[RECONCILER] Dropped %d orphaned namespaces", len(batch))
+
+    def _hibernate(self, allocation_ids):
+        for batch in self._batches(allocation_ids):
+            for allocation_id in batch:
+                namespace_name = f"{self.NAMESPACE_PREFIX}{allocation_id}"
+                try:
+                    self._k8s_apps_v1.patch_namespaced_deployment_scale(
+                        name=namespace_name, namespace=namespace_name, body={"spec": {"replicas": 0}}
+                    )
+                except client.ApiException as exc:
+                    if exc.status != 404:
+                        raise
+            WorkspaceAllocation.objects.filter(id__in=batch).update(
+                hibernated_at=timezone.now(), workspace_status=None, workspace_status_updated_at=timezone.now()
+            )
+            logger.info("[RECONCILER] Hibernated %d workspaces without a session", len(batch))
+
+    def run(self):
+        """
+        Run a single reconciliation pass.
+
+        Returns:
+          report of what was fixed.
+        """
+        from .tasks import track_namespace_deletion
+
+        now = timezone.now()
+        settled_before = now - self.grace_period
+        namespaces, replicas, pod_statuses = self._list_cluster_state()
+
+        allocations = {
+            allocation["id"]: allocation
+            for allocation in WorkspaceAllocation.objects.filter(
+                Q(id__in=namespaces.keys()) | Q(workspace_status__isnull=False)
+            ).values(
+                "id",
+                "is_standby",
+                "hibernated_at",
+                "namespace_deletion_requested_at",
+                "namespace_deleted_at",
+                "workspace_status",
+                "workspace_status_updated_at",
+                "assignment__workspace_configuration__hibernate_workspaces",
+            )
+        }
+        active_sessions = dict(
+            WorkspaceSession.objects.active()
+            .filter(workspace_allocation_id__in=allocations.keys())
+            .values_list("workspace_allocation_id", "started_at")
+        )
+
+        # 1) Workspace statuses
+        status_updates = defaultdict(list)
+        sessions_to_start = []
+        for allocation_id, allocation in allocations.items():
+            if allocation["workspace_status_updated_at"] and allocation["workspace_status_updated_at"] > settled_before:
+                continue
+
+            cluster_status = pod_statuses.get(allocation_id)
+            has_session = allocation_id in active_sessions or allocation["is_standby"]
+            if cluster_status == WorkspaceStatus.RUNNING and not has_session:
+                # Taken care of below as a workspace nobody is using.
+                continue
+            if allocation["workspace_status"] != cluster_status:
+                status_updates[cluster_status].append(allocation_id)
+            if cluster_status == WorkspaceStatus.RUNNING and allocation_id in active_sessions:
+                if active_sessions[allocation_id] is None:
+                    sessions_to_start.append(allocation_id)
+
+        for workspace_status, allocation_ids in status_updates.items():
+            for batch in self._batches(allocation_ids):
+                WorkspaceAllocation.objects.filter(id__in=batch).update(
+                    workspace_status=workspace_status, workspace_status_updated_at=now
+                )
+            logger.info("[RECONCILER] Set status %s on %d workspaces", workspace_status, len(allocation_ids))
+
+        for batch in self._batches(sessions_to_start):
+            WorkspaceSession.objects.active().filter(workspace_allocation_id__in=batch, started_at__isnull=True).update(
+                started_at=now
+            )
+
+        # 2) Namespaces
+        orphaned_namespaces = []
+        to_hibernate = []
+        for allocation_id, namespace in namespaces.items():
+            if namespace.status.phase == "Terminating" or namespace.metadata.creation_timestamp > settled_before:
+                continue
+
+            allocation = allocations.get(allocation_id)
+            if allocation is None:
+                orphaned_namespaces.append(namespace.metadata.name)
+                continue
+
+            deletion_pending = allocation["namespace_deletion_requested_at"] and not allocation["namespace_deleted_at"]
+            if (
+                allocation["is_standby"]
+                or allocation["hibernated_at"]
+                or deletion_pending
+                or allocation_id in active_sessions
+                or not replicas.get(allocation_id)
+            ):
+                continue
+
+            # A running workspace without a session.
+            if allocation["assignment__workspace_configuration__hibernate_workspaces"]:
+                to_hibernate.append(allocation_id)
+            else:
+                orphaned_namespaces.append(namespace.metadata.name)
+
+        self._drop_namespaces(orphaned_namespaces)
+        self._hibernate(to_hibernate)
+        dropped_allocation_ids = [
+            allocation_id
+            for allocation_id in map(self._get_allocation_id, orphaned_namespaces)
+            if allocation_id in allocations
+        ]
+        for batch in self._batches(dropped_allocation_ids):
+            WorkspaceAllocation.objects.filter(id__in=batch).update(
+                namespace_deletion_requested_at=now,
+                namespace_deleted_at=None,
+                workspace_status=None,
+                workspace_status_updated_at=now,
+            )
+            for allocation_id in batch:
+                track_namespace_deletion.apply_async(
+                    args=(allocation_id,), countdown=settings.NAMESPACE_DELETION_CHECK_MIN_DELAY
+                )
+
+        report = {
+            "namespaces": len(namespaces),
+            "pods": len(pod_statuses),
+            "status_updates": sum(len(allocation_ids) for allocation_ids in status_updates.values()),
+            "sessions_started": len(sessions_to_start),
+            "namespaces_dropped": len(orphaned_namespaces),
+            "workspaces_hibernated": len(to_hibernate),
+        }
+        logger.info("[RECONCILER] Pass done: %s", report)
+        return report
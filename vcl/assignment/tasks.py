@@ -1,40 +1,547 @@
 import logging
 import json
+import subprocess
 
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 from workspace import Workspace
+from workspace.capacity import NodeGroupCapacity
+from workspace.prepuller import ImagePrePuller
+from workspace.resources import Deployment, Namespace, get_init_container_image
+from workspace.artifacts import AssignmentArtifactBuilder, describe_error
+from workspace.snapshots import GoldenSnapshotBuilder, delete_outdated_golden_snapshots
 from vcl import celery_app
+from vcl.storage import (
+    VOLUME_STATE_MISSING,
+    EBSVolumePool,
+    OrphanedVolumeCollector,
+    describe_volumes_by_id,
+    get_ec2_client,
+    get_volume_metadata,
+    pop_stats,
+)
+from celery.exceptions import MaxRetriesExceededError
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Count, Q
 from kubernetes import client
 
-from assignment.models import WorkspaceAllocation, WorkspaceSession
+from assignment.models import (
+    Assignment,
+    AssignmentArtifact,
+    GoldenSnapshot,
+    LaunchPriority,
+    WorkspaceAllocation,
+    WorkspaceConfiguration,
+    WorkspaceSession,
+    WorkspaceStatus,
+)
+from assignment.reconciler import WorkspaceReconciler
 from workspace.utils import get_k8s_api_client
 
 logger = logging.getLogger(__name__)
 
 
-@celery_app.task
-def launch_workspace(workspace_allocation_id):
+@celery_app.task(bind=True, max_retries=settings.NAMESPACE_DELETION_CHECK_MAX_RETRIES)
+def launch_workspace(self, workspace_allocation_id):
     """
     This task is used to launch the workspace.
+
+    The allocation is only locked to read and record its state, its volume and resources are
+    created without holding the lock: that takes a while, and `scale_down_workspace`,
+    `claim_standby` and the reconciler lock the allocation too.
     """
-    wa = WorkspaceAllocation.objects.get(id=workspace_allocation_id)
+    # Waits for a `scale_down_workspace` of the previous session to be over, see there.
+    with transaction.atomic():
+        wa = WorkspaceAllocation.objects.select_for_update().get(id=workspace_allocation_id)
+
+    if wa.is_namespace_deletion_pending:
+        # Resources can't be created in a namespace that is still terminating.
+        namespace = Namespace(workspace_allocation=wa, api_client=get_k8s_api_client())
+        if namespace.exists():
+            countdown = min(
+                settings.NAMESPACE_DELETION_CHECK_MIN_DELAY * 2**self.request.retries,
+                settings.NAMESPACE_DELETION_CHECK_MAX_DELAY,
+            )
+            logger.info(
+                "Namespace '%s' is still terminating, launch is deferred by %ds.", namespace.namespace, countdown
+            )
+            try:
+                raise self.retry(countdown=countdown)
+            except MaxRetriesExceededError:
+                logger.error("Namespace '%s' is still terminating, launch failed.", namespace.namespace)
+                wa.update_workspace_status(workspace_status=WorkspaceStatus.FAILED)
+                return
+        wa.mark_namespace_deleted()
+
     workspace = Workspace(wa)
+    if wa.hibernated_at:
+        # The active session of the launch keeps `delete_workspace_namespace` off the namespace meanwhile.
+        resumed = workspace.resume()
+        with transaction.atomic():
+            WorkspaceAllocation.objects.select_for_update().get(id=wa.id).mark_resumed()
+        if resumed:
+            logger.info("Resumed hibernated workspace wa-%d", wa.id)
+            return
+        logger.info("Hibernated workspace wa-%d is gone, launching it again", wa.id)
+
     workspace.launch(wait_for_readiness=False)
 
 
+@celery_app.task
+def relabel_workspace(workspace_allocation_id):
+    """
+    Relabel a claimed standby workspace with its learner.
+    """
+    wa = WorkspaceAllocation.objects.get(id=workspace_allocation_id)
+    Workspace(wa).deployment.relabel()
+
+
+@celery_app.task
+def refill_warm_pools():
+    """
+    Keep the number of standby workspaces of each assignment in line with its warm pool size.
+    """
+    ws_confs = (
+        WorkspaceConfiguration.objects.filter(assignment__isnull=False)
+        .annotate(
+            standby_count=Count(
+                "assignment__workspace_allocations",
+                filter=Q(assignment__workspace_allocations__is_standby=True),
+            )
+        )
+        .filter(Q(warm_pool_size__gt=0) | Q(standby_count__gt=0))
+        .select_related("assignment")
+    )
+    for ws_conf in ws_confs:
+        missing = ws_conf.warm_pool_size - ws_conf.standby_count
+        logger.info(
+            "Warm pool for assignment %s: %d/%d standby workspaces",
+            ws_conf.assignment.id,
+            ws_conf.standby_count,
+            ws_conf.warm_pool_size,
+        )
+        for _ in range(missing):
+            wa = WorkspaceAllocation.objects.create(assignment=ws_conf.assignment, is_standby=True)
+            if settings.WORKSPACES_LAUNCH_ADMISSION_ENABLED:
+                wa.queue_launch(LaunchPriority.STANDBY)
+            else:
+                launch_workspace.apply_async(args=(wa.id,))
+
+        if missing < 0:
+            # Pool was shrunk, drop the youngest standby workspaces first.
+            excess_ids = list(
+                WorkspaceAllocation.objects.filter(assignment=ws_conf.assignment, is_standby=True)
+                .order_by("-created_at")
+                .values_list("id", flat=True)[:-missing]
+            )
+            # Locked like `claim_standby` does, a standby claimed in the meantime is kept.
+            with transaction.atomic():
+                excess = WorkspaceAllocation.objects.select_for_update(skip_locked=True).filter(
+                    id__in=excess_ids, is_standby=True
+                )
+                for wa in excess:
+                    wa.delete()
+
+    if settings.WORKSPACES_LAUNCH_ADMISSION_ENABLED:
+        admit_queued_launches.apply_async()
+
+
+@celery_app.task
+def admit_queued_launches():
+    """
+    Submit queued workspace launches to the cluster as long as their node group has room for them.
+
+    Launches are admitted in queue order, instructors first then students and standby workspaces
+    by wait time. Once a launch doesn't fit, later launches for the same node group wait too so
+    they can't jump the queue. Admitted launches keep their capacity reserved until their pod
+    exists, or for WORKSPACES_LAUNCH_ADMISSION_RESERVATION_TIMEOUT minutes. Launches whose
+    session expired or ended while they were queued are cancelled.
+    """
+    if not settings.WORKSPACES_LAUNCH_ADMISSION_ENABLED:
+        return
+
+    lock = cache.lock("assignment:admit_queued_launches", timeout=60)
+    if not lock.acquire(blocking=False):
+        logger.info("Launch admission is already running.")
+        return
+
+    try:
+        queue = list(WorkspaceAllocation.objects.launch_queue().select_related("assignment__workspace_configuration"))
+        # Standby workspaces have no session.
+        active_ids = set(
+            WorkspaceSession.objects.active()
+            .filter(workspace_allocation_id__in=[wa.id for wa in queue])
+            .values_list("workspace_allocation_id", flat=True)
+        )
+        cancelled_ids = [wa.id for wa in queue if not wa.is_standby and wa.id not in active_ids]
+        if cancelled_ids:
+            WorkspaceAllocation.objects.filter(id__in=cancelled_ids).update(launch_priority=None, launch_queued_at=None)
+            logger.info("Cancelled %d queued workspace launches without an active session", len(cancelled_ids))
+            queue = [wa for wa in queue if wa.id not in cancelled_ids]
+        if not queue:
+            return
+
+        admitted = {}
+        expired_ids = []
+        reserved_after = timezone.now() - timezone.timedelta(
+            minutes=settings.WORKSPACES_LAUNCH_ADMISSION_RESERVATION_TIMEOUT
+        )
+        for wa in WorkspaceAllocation.objects.launch_admitted().select_related("assignment__workspace_configuration"):
+            if wa.launch_admitted_at < reserved_after or not wa.workspace_configuration:
+                expired_ids.append(wa.id)
+            else:
+                ws_conf = wa.workspace_configuration
+                admitted[wa.id] = (Deployment.get_node_group(ws_conf), Deployment.get_resource_requests(ws_conf))
+
+        capacity = NodeGroupCapacity(api_client=get_k8s_api_client()).refresh(admitted=admitted)
+        # Launched workspaces are counted from their pods from now on.
+        released_ids = expired_ids + [wa_id for wa_id in admitted if wa_id in capacity.launched_allocation_ids]
+        WorkspaceAllocation.objects.filter(id__in=released_ids).update(launch_admitted_at=None)
+
+        admitted_ids = []
+        full_node_groups = set()
+        for wa in queue:
+            ws_conf = wa.workspace_configuration
+            if not ws_conf:
+                # Nothing to schedule, let the launch fail as it would without admission.
+                admitted_ids.append(wa.id)
+                continue
+            node_group = Deployment.get_node_group(ws_conf)
+            if node_group in full_node_groups:
+                continue
+            if not capacity.reserve(node_group, Deployment.get_resource_requests(ws_conf)):
+                full_node_groups.add(node_group)
+                continue
+            admitted_ids.append(wa.id)
+
+        WorkspaceAllocation.objects.filter(id__in=admitted_ids).update(
+            launch_priority=None, launch_queued_at=None, launch_admitted_at=timezone.now()
+        )
+        for wa_id in admitted_ids:
+            launch_workspace.apply_async(args=(wa_id,))
+        logger.info(
+            "Admitted %d/%d queued workspace launches, full node groups: %s",
+            len(admitted_ids),
+            len(queue),
+            full_node_groups,
+        )
+    finally:
+        lock.release()
+
+
+def stop_workspace(session):
+    """
+    Scale the workspace of an ended session down, then either hibernate it or drop its namespace.
+    """
+    scale_down_workspace.apply_async(args=(session.id,))
+
+
+@celery_app.task
+def sync_image_prepuller():
+    """
+    Keep the image pre-puller in sync with the images of the configured assignments.
+    """
+    if not settings.WORKSPACES_IMAGE_PREPULLER_ENABLED:
+        return
+
+    images_by_node_group = {}
+    ws_confs = WorkspaceConfiguration.objects.filter(assignment__isnull=False).only("docker_image", "number_gpus")
+    for ws_conf in ws_confs:
+        node_group = Deployment.get_node_group(ws_conf)
+        images_by_node_group.setdefault(node_group, {get_init_container_image()}).add(ws_conf.docker_image)
+
+    ImagePrePuller(api_client=get_k8s_api_client()).sync(images_by_node_group)
+
+
+@celery_app.task
+def refill_volume_pool():
+    """
+    Keep the pool of unattached EBS volumes filled for the storage sizes of the configured assignments.
+    """
+    if settings.APP_ENV == "DEV":
+        return
+
+    sizes = set(WorkspaceConfiguration.objects.filter(assignment__isnull=False).values_list("storage_size", flat=True))
+    return EBSVolumePool().refill(sizes, settings.DEFAULT_AWS_AVAILABILITY_ZONE, settings.EBS_VOLUME_POOL_SIZE)
+
+
+@celery_app.task
+def verify_volumes():
+    """
+    Refresh the volume records of workspace allocations from EC2, many volumes per `describe_volumes` call,
+    so that workspace launches can trust them instead of describing their volume.
+    """
+    if settings.APP_ENV == "DEV":
+        return
+
+    verified = missing = 0
+    allocations = WorkspaceAllocation.objects.filter(volume__isnull=False).only("id", "volume").order_by("id")
+    paginator = Paginator(allocations, settings.EBS_VOLUME_VERIFY_BATCH_SIZE)
+    for page_number in paginator.page_range:
+        batch = {}
+        for wa in paginator.page(page_number).object_list:
+            batch.setdefault(wa.volume.get("region", settings.DEFAULT_AWS_REGION), []).append(wa)
+
+        updated = []
+        for region, region_allocations in batch.items():
+            volumes = {
+                volume["VolumeId"]: volume
+                for volume in describe_volumes_by_id(
+                    get_ec2_client(region), [wa.volume["id"] for wa in region_allocations]
+                )
+            }
+            for wa in region_allocations:
+                if volume := volumes.get(wa.volume["id"]):
+                    wa.volume.update(get_volume_metadata(volume))
+                    verified += 1
+                else:
+                    logger.warning("Volume %s of wa-%d not found", wa.volume["id"], wa.id)
+                    wa.volume.update(state=VOLUME_STATE_MISSING, verified_at=timezone.now().isoformat())
+                    missing += 1
+                updated.append(wa)
+        WorkspaceAllocation.objects.bulk_update(updated, ["volume"])
+
+    logger.info("Verified %d workspace volumes, %d missing", verified, missing)
+    return {"verified": verified, "missing": missing}
+
+
+@celery_app.task
+def collect_orphaned_volumes():
+    """
+    Delete workspace volumes that no workspace allocation uses anymore.
+    """
+    if settings.APP_ENV == "DEV" or not settings.EBS_VOLUME_GC_ENABLED:
+        return
+
+    return OrphanedVolumeCollector(snapshot=settings.EBS_VOLUME_GC_SNAPSHOT).run()
+
+
+@celery_app.task
+def refresh_golden_snapshots(assignment_id=None):
+    """
+    Build golden snapshots for assignments whose code repo, ref, subdirectory or storage size changed
+    since their last one, and delete the ones outdated for WORKSPACES_GOLDEN_SNAPSHOT_RETENTION minutes.
+
+    A failed build is not retried until the assignment changes again, delete it to retry.
+    """
+    if not settings.WORKSPACES_GOLDEN_SNAPSHOTS_ENABLED:
+        return
+
+    outdated_before = timezone.now() - timezone.timedelta(minutes=settings.WORKSPACES_GOLDEN_SNAPSHOT_RETENTION)
+    deleted = delete_outdated_golden_snapshots(
+        GoldenSnapshot.objects.filter(status=GoldenSnapshot.Status.OUTDATED, updated_at__lt=outdated_before)
+    )
+    if deleted:
+        logger.info("Deleted %d outdated golden snapshots", deleted)
+
+    assignments = Assignment.objects.filter(workspace_configuration__isnull=False).select_related(
+        "workspace_configuration"
+    )
+    if assignment_id:
+        assignments = assignments.filter(id=assignment_id)
+    for assignment in assignments:
+        size = assignment.workspace_configuration.storage_size
+        checkout = {
+            "code_repo": assignment.code_repo,
+            "code_ref": assignment.code_ref,
+            "code_subdirectory": assignment.code_subdirectory,
+        }
+        if (
+            assignment.golden_snapshots.filter(**checkout, size=size)
+            .exclude(status=GoldenSnapshot.Status.OUTDATED)
+            .exists()
+        ):
+            continue
+        golden_snapshot = GoldenSnapshot.objects.create(assignment=assignment, **checkout, size=size)
+        build_golden_snapshot.apply_async(args=(golden_snapshot.id,))
+
+    stats = pop_stats("golden_snapshots:seeded", "golden_snapshots:fallbacks")
+    logger.info("Learner volumes seeded from golden snapshots since the last refresh: %s", stats)
+    return stats
+
+
+@celery_app.task
+def build_golden_snapshot(golden_snapshot_id):
+    golden_snapshot = GoldenSnapshot.objects.select_related("assignment__workspace_configuration").get(
+        id=golden_snapshot_id
+    )
+    GoldenSnapshotBuilder(golden_snapshot, api_client=get_k8s_api_client()).start()
+    track_golden_snapshot.apply_async(
+        args=(golden_snapshot.id,), countdown=settings.WORKSPACES_GOLDEN_SNAPSHOT_CHECK_DELAY
+    )
+
+
+@celery_app.task(bind=True, max_retries=settings.WORKSPACES_GOLDEN_SNAPSHOT_CHECK_MAX_RETRIES)
+def track_golden_snapshot(self, golden_snapshot_id):
+    """
+    Move a golden snapshot build forward, checking back later until it's over.
+    """
+    golden_snapshot = GoldenSnapshot.objects.select_related("assignment").filter(id=golden_snapshot_id).first()
+    if not golden_snapshot:
+        return
+
+    builder = GoldenSnapshotBuilder(golden_snapshot, api_client=get_k8s_api_client())
+    if builder.check():
+        return
+    if self.request.retries >= self.max_retries:
+        builder.fail()
+        return
+    raise self.retry(countdown=settings.WORKSPACES_GOLDEN_SNAPSHOT_CHECK_DELAY)
+
+
+@celery_app.task
+def refresh_assignment_artifacts(assignment_id=None):
+    """
+    Build artifacts for assignments whose code repo moved to another commit, or whose ref or
+    subdirectory changed, since their last one.
+
+    A failed build is not retried until the repo moves again, delete it to retry.
+    """
+    if not settings.WORKSPACES_ARTIFACTS_BUCKET:
+        return
+
+    assignments = Assignment.objects.all()
+    if assignment_id:
+        assignments = assignments.filter(id=assignment_id)
+    for assignment in assignments:
+        try:
+            commit = AssignmentArtifactBuilder.get_head_commit(assignment.code_repo, ref=assignment.code_ref)
+        except subprocess.CalledProcessError as exc:
+            logger.warning("Failed to resolve the code repo of assignment %s: %s", assignment.id, describe_error(exc))
+            continue
+        artifact, created = AssignmentArtifact.objects.get_or_create(
+            assignment=assignment,
+            code_repo=assignment.code_repo,
+            code_ref=assignment.code_ref,
+            code_subdirectory=assignment.code_subdirectory,
+            commit=commit,
+        )
+        if created:
+            build_assignment_artifact.apply_async(args=(artifact.id,))
+
+
+@celery_app.task
+def build_assignment_artifact(artifact_id):
+    artifact = AssignmentArtifact.objects.select_related("assignment").get(id=artifact_id)
+    AssignmentArtifactBuilder(artifact).build()
+
+
+@celery_app.task
+def reconcile_workspaces():
+    """
+    Fix drift between the workspaces cluster and workspace allocations and sessions.
+    """
+    return WorkspaceReconciler().run()
+
+
 @celery_app.task
 def scale_down_workspace(session_id):
+    """
+    Scale the workspace of an ended session down, then either hibernate it or drop its namespace.
+
+    Runs with the allocation locked, like `launch_workspace` reads it: a relaunch by the learner
+    either comes first, and the workspace is left running for the new session, or finds it
+    recorded as hibernated, or its namespace deletion requested, once the lock is released.
+    """
     session = WorkspaceSession.objects.get(id=session_id)
-    workspace = Workspace(session.workspace_allocation)
-    workspace.deployment.scale(replicas=0)
-    session.terminate()
-    return session.workspace_allocation.id
+    with transaction.atomic():
+        workspace_allocation = WorkspaceAllocation.objects.select_for_update().get(id=session.workspace_allocation_id)
+        relaunched = workspace_allocation.sessions.active().exclude(id=session.id).exists()
+        if relaunched:
+            logger.info("Workspace wa-%d was launched again, it is kept running", workspace_allocation.id)
+        else:
+            hibernate = workspace_allocation.hibernation_enabled
+            if hibernate:
+                workspace_allocation.mark_hibernated()
+            Workspace(workspace_allocation).deployment.scale(replicas=0)
+            if not hibernate:
+                start_namespace_deletion(workspace_allocation)
+
+    session.terminate(reset_workspace_status=not relaunched)
+    if not relaunched and hibernate:
+        logger.info("Hibernated workspace wa-%d", workspace_allocation.id)
+
+
+def get_hibernated_before():
+    return timezone.now() - timezone.timedelta(hours=settings.WORKSPACES_HIBERNATION_TTL)
+
+
+@celery_app.task
+def cleanup_hibernated_workspaces():
+    """
+    Drop namespaces of workspaces that have been hibernating longer than WORKSPACES_HIBERNATION_TTL.
+    """
+    hibernated_before = get_hibernated_before()
+    for wa_id in WorkspaceAllocation.objects.filter(hibernated_at__lte=hibernated_before).values_list("id", flat=True):
+        logger.info("Dropping workspace wa-%d after hibernation", wa_id)
+        delete_workspace_namespace.apply_async(args=(wa_id,))
+
+
+def start_namespace_deletion(workspace_allocation):
+    """
+    Start deleting the namespace of a workspace allocation locked by the caller's transaction,
+    completion is recorded by `track_namespace_deletion` once the transaction is committed.
+    """
+    namespace = Namespace(workspace_allocation=workspace_allocation, api_client=get_k8s_api_client())
+    if namespace.delete():
+        workspace_allocation.mark_namespace_deletion_requested()
+        transaction.on_commit(
+            lambda: track_namespace_deletion.apply_async(
+                args=(workspace_allocation.id,), countdown=settings.NAMESPACE_DELETION_CHECK_MIN_DELAY
+            )
+        )
+    else:
+        workspace_allocation.mark_namespace_deleted()
 
 
 @celery_app.task
 def delete_workspace_namespace(workspace_allocation_id):
-    workspace_allocation = WorkspaceAllocation.objects.get(id=workspace_allocation_id)
-    workspace = Workspace(workspace_allocation)
-    workspace.namespace.delete()
+    """
+    Start deleting the namespace of a workspace hibernating longer than WORKSPACES_HIBERNATION_TTL,
+    completion is recorded by `track_namespace_deletion`.
+
+    The allocation is checked again once locked: a workspace that was resumed, or is being
+    resumed for an active session, since it was picked for cleanup keeps its namespace.
+    """
+    with transaction.atomic():
+        workspace_allocation = (
+            WorkspaceAllocation.objects.select_for_update().filter(id=workspace_allocation_id).first()
+        )
+        if not workspace_allocation:
+            return
+        hibernated_at = workspace_allocation.hibernated_at
+        if not hibernated_at or hibernated_at > get_hibernated_before():
+            logger.info("Workspace wa-%d is no longer hibernating, its namespace is kept", workspace_allocation.id)
+            return
+        if workspace_allocation.sessions.active().exists():
+            logger.info("Workspace wa-%d is being resumed, its namespace is kept", workspace_allocation.id)
+            return
+        start_namespace_deletion(workspace_allocation)
+
+
+@celery_app.task(bind=True, max_retries=settings.NAMESPACE_DELETION_CHECK_MAX_RETRIES)
+def track_namespace_deletion(self, workspace_allocation_id):
+    """
+    Check whether the namespace of a workspace allocation is gone and record it,
+    checking back later with an exponential backoff while its finalizers run.
+    """
+    workspace_allocation = WorkspaceAllocation.get_or_none(id=workspace_allocation_id)
+    if not workspace_allocation:
+        return
+
+    namespace = Namespace(workspace_allocation=workspace_allocation, api_client=get_k8s_api_client())
+    if namespace.exists():
+        countdown = min(
+            settings.NAMESPACE_DELETION_CHECK_MIN_DELAY * 2**self.request.retries,
+            settings.NAMESPACE_DELETION_CHECK_MAX_DELAY,
+        )
+        logger.info("Namespace '%s' is still terminating, checking again in %ds.", namespace.namespace, countdown)
+        raise self.retry(countdown=countdown)
+
+    workspace_allocation.mark_namespace_deleted()
+    logger.info("Deleted '%s' successfully.", namespace.namespace)
 
 
 @celery_app.task
@@ -43,8 +550,7 @@ def cleanup_expired_sessions():
     This task cleans up workspace pods for expired workspace sessions.
     """
     for session in WorkspaceSession.objects.expired().with_launched_workspace():
-        # chain the tasks: scale_down_workspace -> delete_workspace_namespace
-        scale_down_workspace.apply_async(args=(session.id,), link=delete_workspace_namespace.s())
+        stop_workspace(session)
 
 
 @celery_app.task
@@ -61,17 +567,20 @@ def cleanup_sessions_older_than_max_duration_allowed():
             session.workspace_allocation.id,
         )
         session.expire()
-        # chain the tasks: scale_down_workspace -> delete_workspace_namespace
-        scale_down_workspace.apply_async(args=(session.id,), link=delete_workspace_namespace.s())
+        stop_workspace(session)
 
 
 @celery_app.task
 def start_workspace_session(**kwargs):
     wa = WorkspaceAllocation.get_or_none(id=kwargs.get("workspace_allocation_id"))
-    if wa and (session := wa.get_active_session()):
+    if wa and wa.is_standby:
+        # Standby workspaces have no session, they only become claimable once ready.
+        wa.update_from_cluster()
+        logger.info("Standby workspace is ready: %s", kwargs)
+    elif wa and (session := wa.get_active_session()):
         wa.update_from_cluster()
         logger.info("Starting workspace session: %s", kwargs)
-        session.start()
+        session.start(init_telemetry=kwargs.get("init_telemetry"))
     else:
         logger.info("Workspace session not found")
 
@@ -97,7 +606,7 @@ def terminate_workspace_session(**kwargs):
     if wa and (session := wa.get_active_session()):
         session.expire()
         logger.info("Terminating Workspace session: %s", session.id)
-        scale_down_workspace.apply_async(args=(session.id,), link=delete_workspace_namespace.s())
+        stop_workspace(session)
     else:
         logger.info("Workspace session not found")
 
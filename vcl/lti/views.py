@@ -193,15 +193,24 @@ def get_or_create_workspace_allocation(launch_user, student_id, assignment):
             return workspace_allocation, error
 
     else:
-        workspace_allocation, created = WorkspaceAllocation.objects.get_or_create(
-            assignment=assignment,
-            learner=launch_user,
-        )
-        if created:
-            logger.info(
-                f"Launching workspace: A workspace allocation for user {launch_user.id} "
-                f"assignment {assignment.id} didn't exist already. Created a new allocation."
+        workspace_allocation = WorkspaceAllocation.get_or_none(assignment=assignment, learner=launch_user)
+        if not workspace_allocation:
+            workspace_allocation = WorkspaceAllocation.claim_standby(assignment=assignment, learner=launch_user)
+            if workspace_allocation:
+                logger.info(
+                    f"Launching workspace: Claimed standby workspace allocation {workspace_allocation.id} "
+                    f"for user {launch_user.id} assignment {assignment.id}."
+                )
+        if not workspace_allocation:
+            workspace_allocation, created = WorkspaceAllocation.objects.get_or_create(
+                assignment=assignment,
+                learner=launch_user,
             )
+            if created:
+                logger.info(
+                    f"Launching workspace: A workspace allocation for user {launch_user.id} "
+                    f"assignment {assignment.id} didn't exist already. Created a new allocation."
+                )
     return workspace_allocation, None
 
 
@@ -45,6 +45,106 @@ app.conf.beat_schedule = (
                 month_of_year="*",
             ),
         },
+        "cleanup_hibernated_workspaces": {
+            "task": "assignment.tasks.cleanup_hibernated_workspaces",
+            "schedule": crontab(
+                minute=30,
+                hour="*",
+                day_of_week="*",
+                day_of_month="*",
+                month_of_year="*",
+            ),
+        },
+        "sync_image_prepuller": {
+            "task": "assignment.tasks.sync_image_prepuller",
+            "schedule": crontab(
+                minute=15,
+                hour="*",
+                day_of_week="*",
+                day_of_month="*",
+                month_of_year="*",
+            ),
+        },
+        "reconcile_workspaces": {
+            "task": "assignment.tasks.reconcile_workspaces",
+            "schedule": crontab(
+                minute="*/10",
+                hour="*",
+                day_of_week="*",
+                day_of_month="*",
+                month_of_year="*",
+            ),
+        },
+        "refill_warm_pools": {
+            "task": "assignment.tasks.refill_warm_pools",
+            "schedule": crontab(
+                minute="*/5",
+                hour="*",
+                day_of_week="*",
+                day_of_month="*",
+                month_of_year="*",
+            ),
+        },
+        "refill_volume_pool": {
+            "task": "assignment.tasks.refill_volume_pool",
+            "schedule": crontab(
+                minute="*/5",
+                hour="*",
+                day_of_week="*",
+                day_of_month="*",
+                month_of_year="*",
+            ),
+        },
+        "verify_volumes": {
+            "task": "assignment.tasks.verify_volumes",
+            "schedule": crontab(
+                minute=45,
+                hour="*",
+                day_of_week="*",
+                day_of_month="*",
+                month_of_year="*",
+            ),
+        },
+        "refresh_golden_snapshots": {
+            "task": "assignment.tasks.refresh_golden_snapshots",
+            "schedule": crontab(
+                minute=5,
+                hour="*",
+                day_of_week="*",
+                day_of_month="*",
+                month_of_year="*",
+            ),
+        },
+        "collect_orphaned_volumes": {
+            "task": "assignment.tasks.collect_orphaned_volumes",
+            "schedule": crontab(
+                minute=0,
+                hour=3,
+                day_of_week="*",
+                day_of_month="*",
+                month_of_year="*",
+            ),
+        },
+        "refresh_assignment_artifacts": {
+            "task": "assignment.tasks.refresh_assignment_artifacts",
+            "schedule": crontab(
+                minute="*/15",
+                hour="*",
+                day_of_week="*",
+                day_of_month="*",
+                month_of_year="*",
+            ),
+        },
+        "admit_queued_launches": {
+            "task": "assignment.tasks.admit_queued_launches",
+            "schedule": crontab(
+                minute="*",
+                hour="*",
+                day_of_week="*",
+                day_of_month="*",
+                month_of_year="*",
+            ),
+        },
     }
     if settings.ENABLE_CELERY_PERIODIC_TASKS
     else {}
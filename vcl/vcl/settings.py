@@ -50,9 +50,84 @@ WORKSPACES_CLUSTER_TRAEFIK_NAMESPACE = env.str("WORKSPACES_CLUSTER_TRAEFIK_NAMES
 WORKSPACES_CLUSTER_TRAEFIK_LABEL_VALUE = env.str("WORKSPACES_CLUSTER_TRAEFIK_LABEL_VALUE", default=None)
 WORKSPACES_SESSION_EXTENSION_PERIOD = env.int("WORKSPACES_SESSION_EXTENSION_PERIOD", default=1)
 WORKSPACES_MAX_SESSION_DURATION = env.int("WORKSPACES_MAX_SESSION_DURATION", default=6)
+# Hours a hibernated workspace keeps its namespace before being dropped.
+WORKSPACES_HIBERNATION_TTL = env.int("WORKSPACES_HIBERNATION_TTL", default=72)
 GITHUB_ACCESS_TOKEN = env.str("GITHUB_ACCESS_TOKEN", default=None)
 USER_ASSIGNMENT_FOLDER = env.str("USER_ASSIGNMENT_FOLDER", default="/home/coder/assignment")
 CODER_CONFIG_FOLDER = env.str("CODER_CONFIG_FOLDER", default="/home/coder/.config")
+# Create workspace resources in parallel once the namespace exists.
+WORKSPACES_CONCURRENT_LAUNCH = env.bool("WORKSPACES_CONCURRENT_LAUNCH", default=True)
+# Shards the workspace pods are labelled with, split between the k8s-watcher replicas.
+# Has to match WORKSPACES_SHARDS of the k8s-watcher.
+WORKSPACES_SHARDS = env.int("WORKSPACES_SHARDS", default=32)
+# Seconds to wait for a workspace pod to become ready.
+WORKSPACE_READINESS_TIMEOUT = env.int("WORKSPACE_READINESS_TIMEOUT", default=30)
+# Backoff (in seconds) of the deferred checks that record when a workspace namespace is gone.
+NAMESPACE_DELETION_CHECK_MIN_DELAY = env.int("NAMESPACE_DELETION_CHECK_MIN_DELAY", default=2)
+NAMESPACE_DELETION_CHECK_MAX_DELAY = env.int("NAMESPACE_DELETION_CHECK_MAX_DELAY", default=60)
+NAMESPACE_DELETION_CHECK_MAX_RETRIES = env.int("NAMESPACE_DELETION_CHECK_MAX_RETRIES", default=20)
+
+# Periodic cluster vs database reconciliation, changes younger than the grace period (minutes) are skipped.
+# Fixes are applied in batches of WORKSPACES_RECONCILER_BATCH_SIZE, 0 for a single batch.
+WORKSPACES_RECONCILER_GRACE_PERIOD = env.int("WORKSPACES_RECONCILER_GRACE_PERIOD", default=10)
+WORKSPACES_RECONCILER_BATCH_SIZE = env.int("WORKSPACES_RECONCILER_BATCH_SIZE", default=100)
+
+# Keep workspace images pulled on workspace nodes ahead of launches.
+WORKSPACES_IMAGE_PREPULLER_ENABLED = env.bool("WORKSPACES_IMAGE_PREPULLER_ENABLED", default=APP_ENV != "DEV")
+WORKSPACES_IMAGE_PREPULLER_NAMESPACE = env.str("WORKSPACES_IMAGE_PREPULLER_NAMESPACE", default="vcl-image-prepuller")
+WORKSPACES_IMAGE_PREPULLER_PAUSE_IMAGE = env.str(
+    "WORKSPACES_IMAGE_PREPULLER_PAUSE_IMAGE", default="registry.k8s.io/pause:3.6"
+)
+
+# Queue workspace launches until their node group has free capacity for them.
+WORKSPACES_LAUNCH_ADMISSION_ENABLED = env.bool("WORKSPACES_LAUNCH_ADMISSION_ENABLED", default=False)
+# Launches admitted beyond free capacity per node group, so that the cluster autoscaler adds nodes.
+WORKSPACES_LAUNCH_ADMISSION_SURGE = env.int("WORKSPACES_LAUNCH_ADMISSION_SURGE", default=1)
+# Minutes an admitted launch keeps its capacity reserved while its pod doesn't exist, e.g. if the launch failed.
+WORKSPACES_LAUNCH_ADMISSION_RESERVATION_TIMEOUT = env.int(
+    "WORKSPACES_LAUNCH_ADMISSION_RESERVATION_TIMEOUT", default=10
+)
+
+# Unattached EBS volumes kept ready per storage size for first workspace launches, 0 disables the pool.
+EBS_VOLUME_POOL_SIZE = env.int("EBS_VOLUME_POOL_SIZE", default=0)
+# Volumes described per EC2 call when verifying the volume records of workspace allocations.
+EBS_VOLUME_VERIFY_BATCH_SIZE = env.int("EBS_VOLUME_VERIFY_BATCH_SIZE", default=200)
+
+# Attempts of AWS API calls, retried with the adaptive mode which also rate limits calls on throttling.
+EC2_CLIENT_MAX_ATTEMPTS = env.int("EC2_CLIENT_MAX_ATTEMPTS", default=5)
+
+# Periodic deletion of workspace volumes no allocation uses anymore, optionally snapshotting them first.
+# Volumes are deleted in batches spaced by EBS_VOLUME_GC_BATCH_DELAY seconds, younger ones (hours) are kept.
+EBS_VOLUME_GC_ENABLED = env.bool("EBS_VOLUME_GC_ENABLED", default=False)
+EBS_VOLUME_GC_SNAPSHOT = env.bool("EBS_VOLUME_GC_SNAPSHOT", default=True)
+EBS_VOLUME_GC_BATCH_SIZE = env.int("EBS_VOLUME_GC_BATCH_SIZE", default=20)
+EBS_VOLUME_GC_BATCH_DELAY = env.float("EBS_VOLUME_GC_BATCH_DELAY", default=1.0)
+EBS_VOLUME_GC_GRACE_PERIOD = env.int("EBS_VOLUME_GC_GRACE_PERIOD", default=24)
+
+# Create learner volumes from per assignment snapshots with the code already checked out.
+WORKSPACES_GOLDEN_SNAPSHOTS_ENABLED = env.bool("WORKSPACES_GOLDEN_SNAPSHOTS_ENABLED", default=False)
+WORKSPACES_GOLDEN_SNAPSHOT_NAMESPACE = env.str("WORKSPACES_GOLDEN_SNAPSHOT_NAMESPACE", default="vcl-golden-snapshots")
+# Seconds between checks of a golden snapshot build, and number of checks before giving up.
+WORKSPACES_GOLDEN_SNAPSHOT_CHECK_DELAY = env.int("WORKSPACES_GOLDEN_SNAPSHOT_CHECK_DELAY", default=30)
+WORKSPACES_GOLDEN_SNAPSHOT_CHECK_MAX_RETRIES = env.int("WORKSPACES_GOLDEN_SNAPSHOT_CHECK_MAX_RETRIES", default=60)
+# Minutes an outdated golden snapshot is kept, longer than a launch takes to create its volume from it.
+WORKSPACES_GOLDEN_SNAPSHOT_RETENTION = env.int("WORKSPACES_GOLDEN_SNAPSHOT_RETENTION", default=30)
+
+# Node folder in which init containers keep mirrors of assignment repos, fetched again after
+# WORKSPACES_GIT_MIRROR_MAX_AGE seconds. Repos are cloned from GitHub for each workspace when not set.
+WORKSPACES_GIT_MIRROR_HOST_PATH = env.str("WORKSPACES_GIT_MIRROR_HOST_PATH", default="")
+WORKSPACES_GIT_MIRROR_MAX_AGE = env.int("WORKSPACES_GIT_MIRROR_MAX_AGE", default=300)
+
+# Partial clone filter of assignment repos, e.g. "blob:limit=1m" to fetch big files lazily. Clones are
+# shallow unless disabled per assignment.
+WORKSPACES_CLONE_BLOB_FILTER = env.str("WORKSPACES_CLONE_BLOB_FILTER", default="")
+
+# Bucket of the S3 compatible storage (AWS S3 when no endpoint is set) in which a tarball of the code of
+# each assignment is kept, ready to be extracted by init containers. Repos are cloned when not set.
+WORKSPACES_ARTIFACTS_BUCKET = env.str("WORKSPACES_ARTIFACTS_BUCKET", default="")
+WORKSPACES_ARTIFACTS_ENDPOINT_URL = env.str("WORKSPACES_ARTIFACTS_ENDPOINT_URL", default="")
+# Lifetime of the artifact download URLs given to init containers, in seconds.
+WORKSPACES_ARTIFACTS_URL_EXPIRY = env.int("WORKSPACES_ARTIFACTS_URL_EXPIRY", default=86400)
 
 # Student workspace configuration
 # We know workspaces will not run at their max and nodes will have resources
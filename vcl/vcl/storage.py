@@ -1,10 +1,114 @@
 import json
+import os
+import threading
+import time
 import boto3
 import logging
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+VOLUME_TYPE_TAG = "WorkspaceAssignmentStorage"
+POOL_TAG = "Pool"
+
+
+VOLUME_STATE_MISSING = "missing"
+
+_aws_clients = {}
+_aws_clients_lock = threading.Lock()
+# Clients hold connection pools, which can't be shared with forked (celery) worker processes.
+os.register_at_fork(after_in_child=_aws_clients.clear)
+
+
+def get_aws_client(service, region=settings.DEFAULT_AWS_REGION, endpoint_url=None):
+    """
+    AWS client of a service and region shared by the whole process, with adaptive retries.
+
+    Building a session and a client takes tens of milliseconds (credentials, endpoints
+    and service models are loaded each time). Clients are thread safe, sessions are not,
+    so clients are built once under a lock and reused.
+    """
+    key = (service, region, endpoint_url)
+    if client := _aws_clients.get(key):
+        return client
+
+    with _aws_clients_lock:
+        if key not in _aws_clients:
+            _aws_clients[key] = boto3.Session().client(
+                service,
+                region_name=region,
+                endpoint_url=endpoint_url,
+                config=Config(retries={"mode": "adaptive", "max_attempts": settings.EC2_CLIENT_MAX_ATTEMPTS}),
+            )
+        return _aws_clients[key]
+
+
+def get_ec2_client(region=settings.DEFAULT_AWS_REGION):
+    return get_aws_client("ec2", region)
+
+
+def get_artifacts_client():
+    """
+    Client of the S3 compatible storage assignment artifacts are kept in.
+    """
+    return get_aws_client("s3", endpoint_url=settings.WORKSPACES_ARTIFACTS_ENDPOINT_URL or None)
+
+
+def get_volume_metadata(volume):
+    """
+    Volume metadata kept in `WorkspaceAllocation.volume`, from a `describe_volumes` or `create_volume` volume.
+    """
+    return {
+        "size": volume["Size"],
+        "state": volume["State"],
+        "verified_at": timezone.now().isoformat(),
+    }
+
+
+def describe_volumes_by_id(ec2_client, volume_ids):
+    """
+    Describe many volumes at once, volumes that don't exist anymore are left out instead of failing the call.
+    """
+    paginator = ec2_client.get_paginator("describe_volumes")
+    for page in paginator.paginate(Filters=[{"Name": "volume-id", "Values": list(volume_ids)}]):
+        yield from page["Volumes"]
+
+
+def incr_stat(name, delta=1):
+    """
+    Count storage events between two reports, e.g. pooled volume claims.
+    """
+    key = f"storage:{name}"
+    cache.add(key, 0, timeout=None)
+    cache.incr(key, delta)
+
+
+def pop_stats(*names):
+    """
+    Get the given counters and reset them.
+    """
+    keys = [f"storage:{name}" for name in names]
+    values = cache.get_many(keys)
+    cache.delete_many(keys)
+    return {name: values.get(key, 0) for name, key in zip(names, keys)}
+
+
+def get_volume_tags(name, **extra_tags):
+    tags = {
+        "Name": name,
+        "Type": VOLUME_TYPE_TAG,
+        "Env": settings.APP_ENV_SHORT,
+        "Cleanup": json.dumps(settings.APP_ENV_SHORT == "test"),
+        **extra_tags,
+    }
+    return [{"Key": key, "Value": value} for key, value in tags.items()]
+
 
 class EBSVolume:
     """
@@ -24,24 +128,47 @@ class EBSVolume:
         self.volume_id = None
         self.volume_size_gb = self.workspace_allocation.workspace_configuration.storage_size
 
-        session = boto3.Session()
-        self._ec2_client = session.client("ec2", region_name=aws_region)
+        self._ec2_client = get_ec2_client(aws_region)
 
         return self._get_or_create_volume()
 
     def _get_or_create_volume(self):
         if not self.workspace_allocation.volume:
-            volume = self._create_volume()
+            volume = golden_snapshot = None
+            if settings.WORKSPACES_GOLDEN_SNAPSHOTS_ENABLED:
+                golden_snapshot = self.workspace_allocation.assignment.get_golden_snapshot(self.volume_size_gb)
+                # Without a golden snapshot, the init container falls back to cloning the assignment repo.
+                incr_stat("golden_snapshots:seeded" if golden_snapshot else "golden_snapshots:fallbacks")
+
+            if golden_snapshot:
+                volume = self._create_volume(snapshot_id=golden_snapshot.snapshot_id)
+            elif settings.EBS_VOLUME_POOL_SIZE:
+                volume = EBSVolumePool(aws_region=self.aws_region, ec2_client=self._ec2_client).claim(
+                    self.volume_size_gb, self.aws_availability_zone, self.workspace_allocation
+                )
+            if not volume:
+                volume = self._create_volume()
 
             self.workspace_allocation.volume = {
                 "id": volume["VolumeId"],
                 "region": self.aws_region,
                 "availability_zone": self.aws_availability_zone,
+                **get_volume_metadata(volume),
             }
             self.workspace_allocation.save(update_fields=["volume"])
 
-            logger.info(f"Created volume {volume['VolumeId']} for workspace {self.workspace_allocation.id}")
+            logger.info(f"Allocated volume {volume['VolumeId']} for workspace {self.workspace_allocation.id}")
+        elif "size" in self.workspace_allocation.volume:
+            # The volume record is kept up to date by `verify_volumes`, no need to ask EC2.
+            if self.workspace_allocation.volume["state"] == VOLUME_STATE_MISSING:
+                raise Exception("Workspace allocation volume not found.")
+            volume = {
+                "VolumeId": self.workspace_allocation.volume["id"],
+                "Size": self.workspace_allocation.volume["size"],
+            }
+            logger.info(f"Using existing volume {volume['VolumeId']} for workspace {self.workspace_allocation.id}")
         else:
+            # Volume records from before volume metadata was stored, read it once from EC2.
             # TODO: Handle volume not found and other ClientError Exceptions
             volumes = self._ec2_client.describe_volumes(
                 VolumeIds=[self.workspace_allocation.volume["id"]],
@@ -58,15 +185,19 @@ class EBSVolume:
             if not volumes["Volumes"]:
                 raise Exception("Workspace allocation volume not found.")
             volume = volumes["Volumes"][0]
+            self.workspace_allocation.volume.update(get_volume_metadata(volume))
+            self.workspace_allocation.save(update_fields=["volume"])
             logger.info(f"Using existing volume {volume['VolumeId']} for workspace {self.workspace_allocation.id}")
         self.volume_id = volume["VolumeId"]
         self.volume_size_gb = volume["Size"]
 
-    def _create_volume(self, volume_name=None):
+    def _create_volume(self, volume_name=None, snapshot_id=None):
         if volume_name is None:
             volume_name = f"vcl-wa-{self.workspace_allocation.id}"
 
+        extra_kwargs = {"SnapshotId": snapshot_id} if snapshot_id else {}
         new_volume = self._ec2_client.create_volume(
+            **extra_kwargs,
             AvailabilityZone=self.aws_availability_zone,
             Size=self.volume_size_gb,
             VolumeType="gp3",
@@ -74,27 +205,269 @@ class EBSVolume:
                 {
                     "ResourceType": "volume",
                     # TODO: Add proper tags for student, assignment and workspace alloc.
-                    "Tags": [
-                        {"Key": "Name", "Value": volume_name},
-                        {
-                            "Key": "WorkspaceAllocation",
-                            "Value": str(self.workspace_allocation.id),
-                        },
-                        {
-                            "Key": "Type",
-                            "Value": "WorkspaceAssignmentStorage",
-                        },
-                        {
-                            "Key": "Env",
-                            "Value": settings.APP_ENV_SHORT,
-                        },
-                        {
-                            "Key": "Cleanup",
-                            "Value": json.dumps(settings.APP_ENV_SHORT == "test"),
-                        },
-                    ],
+                    "Tags": get_volume_tags(volume_name, WorkspaceAllocation=str(self.workspace_allocation.id)),
                 }
             ],
         )
 
         return new_volume
+
+
+class EBSVolumePool:
+    """
+    Pool of pre-created, unattached EBS volumes per size and availability zone.
+
+    Creating a volume on the first launch of a workspace is slow, so first launches
+    claim a volume from the pool instead. Pooled volumes are tracked by `PooledVolume`
+    rows and carry a `Pool=available` tag, which is switched to `Pool=claimed` together
+    with the workspace allocation tags when a volume is claimed.
+    """
+
+    STATS_KEYS = ("claims", "claim_latency_ms", "misses")
+
+    def __init__(self, aws_region=settings.DEFAULT_AWS_REGION, ec2_client=None):
+        self.aws_region = aws_region
+        self._ec2_client = ec2_client or get_ec2_client(aws_region)
+
+    @classmethod
+    def pop_stats(cls):
+        """
+        Get the claim statistics gathered since the last call and reset them.
+        """
+        stats = pop_stats(*(f"volume_pool:{name}" for name in cls.STATS_KEYS))
+        return {name: stats[f"volume_pool:{name}"] for name in cls.STATS_KEYS}
+
+    def claim(self, size, availability_zone, workspace_allocation):
+        """
+        Hand a pooled volume over to the workspace allocation.
+
+        Returns:
+          the claimed volume as `{"VolumeId": ..., "Size": ...}`, or `None` if the pool is empty.
+        """
+        from assignment.models import PooledVolume
+
+        started_at = time.monotonic()
+        with transaction.atomic():
+            pooled_volume = (
+                PooledVolume.objects.select_for_update(skip_locked=True)
+                .filter(size=size, availability_zone=availability_zone)
+                .order_by("created_at")
+                .first()
+            )
+            if pooled_volume:
+                try:
+                    self._ec2_client.create_tags(
+                        Resources=[pooled_volume.volume_id],
+                        Tags=get_volume_tags(
+                            f"vcl-wa-{workspace_allocation.id}",
+                            WorkspaceAllocation=str(workspace_allocation.id),
+                            **{POOL_TAG: "claimed"},
+                        ),
+                    )
+                except ClientError as exc:
+                    # E.g. the volume was deleted out of band, drop it from the pool.
+                    logger.warning(f"Failed to claim pooled volume {pooled_volume.volume_id}: {exc}")
+                    pooled_volume.delete()
+                    pooled_volume = None
+                else:
+                    pooled_volume.delete()
+
+        if not pooled_volume:
+            logger.info(f"Volume pool {size}GiB/{availability_zone} is empty for workspace {workspace_allocation.id}")
+            incr_stat("volume_pool:misses")
+            return None
+
+        claim_latency_ms = int((time.monotonic() - started_at) * 1000)
+        incr_stat("volume_pool:claims")
+        incr_stat("volume_pool:claim_latency_ms", claim_latency_ms)
+        logger.info(
+            f"Claimed pooled volume {pooled_volume.volume_id} for workspace {workspace_allocation.id} "
+            f"in {claim_latency_ms}ms"
+        )
+        return {"VolumeId": pooled_volume.volume_id, "Size": pooled_volume.size, "State": "available"}
+
+    def _create_volumes(self, size, availability_zone, count):
+        volume_ids = []
+        for _ in range(count):
+            volume = self._ec2_client.create_volume(
+                AvailabilityZone=availability_zone,
+                Size=size,
+                VolumeType="gp3",
+                TagSpecifications=[
+                    {
+                        "ResourceType": "volume",
+                        "Tags": get_volume_tags(f"vcl-pool-{size}g", **{POOL_TAG: "available"}),
+                    }
+                ],
+            )
+            volume_ids.append(volume["VolumeId"])
+        if volume_ids:
+            # Only hand out volumes that can be attached right away.
+            self._ec2_client.get_waiter("volume_available").wait(VolumeIds=volume_ids)
+        return volume_ids
+
+    def refill(self, sizes, availability_zone, pool_size):
+        """
+        Keep `pool_size` volumes for each of the given sizes, and none for other sizes.
+
+        Returns:
+          a report with the pool depth per size, the volumes created and deleted
+          and the claim statistics since the last refill.
+        """
+        from assignment.models import PooledVolume
+
+        depths = dict(
+            PooledVolume.objects.filter(availability_zone=availability_zone)
+            .values("size")
+            .annotate(depth=Count("id"))
+            .values_list("size", "depth")
+        )
+        created = deleted = 0
+        for size in sorted(set(sizes) | set(depths)):
+            missing = (pool_size if size in sizes else 0) - depths.get(size, 0)
+            if missing > 0:
+                volume_ids = self._create_volumes(size, availability_zone, missing)
+                PooledVolume.objects.bulk_create(
+                    PooledVolume(volume_id=volume_id, size=size, availability_zone=availability_zone)
+                    for volume_id in volume_ids
+                )
+                depths[size] = depths.get(size, 0) + len(volume_ids)
+                created += len(volume_ids)
+            elif missing < 0:
+                with transaction.atomic():
+                    excess = list(
+                        PooledVolume.objects.select_for_update(skip_locked=True)
+                        .filter(size=size, availability_zone=availability_zone)
+                        .order_by("-created_at")[:-missing]
+                    )
+                    PooledVolume.objects.filter(id__in=[volume.id for volume in excess]).delete()
+                for volume in excess:
+                    self._ec2_client.delete_volume(VolumeId=volume.volume_id)
+                depths[size] -= len(excess)
+                deleted += len(excess)
+
+        stats = self.pop_stats()
+        report = {
+            "depth": {size: depth for size, depth in depths.items() if depth},
+            "created": created,
+            "deleted": deleted,
+            "claims": stats["claims"],
+            "misses": stats["misses"],
+            "avg_claim_latency_ms": stats["claim_latency_ms"] // stats["claims"] if stats["claims"] else None,
+        }
+        logger.info(f"Volume pool {availability_zone}: {report}")
+        return report
+
+
+class OrphanedVolumeCollector:
+    """
+    Deletes workspace volumes that no workspace allocation uses anymore.
+
+    Our volumes are scanned one `describe_volumes` page at a time and each page is
+    matched against workspace allocations and the volume pool in one query, so memory
+    doesn't grow with the number of volumes. Orphans are deleted, or snapshotted then
+    deleted, in batches spaced out to stay under the EC2 API rate limits.
+    """
+
+    def __init__(
+        self,
+        dry_run=False,
+        snapshot=False,
+        batch_size=None,
+        batch_delay=None,
+        grace_period=None,
+        aws_region=settings.DEFAULT_AWS_REGION,
+        ec2_client=None,
+    ):
+        self.dry_run = dry_run
+        self.snapshot = snapshot
+        self.batch_size = batch_size or settings.EBS_VOLUME_GC_BATCH_SIZE
+        self.batch_delay = settings.EBS_VOLUME_GC_BATCH_DELAY if batch_delay is None else batch_delay
+        self.grace_period = settings.EBS_VOLUME_GC_GRACE_PERIOD if grace_period is None else grace_period
+        self._ec2_client = ec2_client or get_ec2_client(aws_region)
+
+    def _pages(self):
+        paginator = self._ec2_client.get_paginator("describe_volumes")
+        pages = paginator.paginate(
+            Filters=[
+                {"Name": "tag:Type", "Values": [VOLUME_TYPE_TAG]},
+                {"Name": "tag:Env", "Values": [settings.APP_ENV_SHORT]},
+                # Attached volumes are in use, whatever the database says.
+                {"Name": "status", "Values": ["available"]},
+            ],
+            PaginationConfig={"PageSize": 500},
+        )
+        for page in pages:
+            yield page["Volumes"]
+
+    def _get_orphans(self, volumes):
+        from assignment.models import PooledVolume, WorkspaceAllocation
+
+        volume_ids = [volume["VolumeId"] for volume in volumes]
+        used_ids = set(
+            WorkspaceAllocation.objects.filter(volume__id__in=volume_ids).values_list("volume__id", flat=True)
+        )
+        used_ids.update(PooledVolume.objects.filter(volume_id__in=volume_ids).values_list("volume_id", flat=True))
+        # Volumes are created before being recorded, leave recent ones alone.
+        created_before = timezone.now() - timezone.timedelta(hours=self.grace_period)
+        return [
+            volume for volume in volumes if volume["VolumeId"] not in used_ids and volume["CreateTime"] < created_before
+        ]
+
+    def _collect(self, volume):
+        if self.snapshot:
+            tags = {tag["Key"]: tag["Value"] for tag in volume.get("Tags", [])}
+            self._ec2_client.create_snapshot(
+                VolumeId=volume["VolumeId"],
+                Description=f"Backup of orphaned workspace volume {volume['VolumeId']}",
+                TagSpecifications=[
+                    {
+                        "ResourceType": "snapshot",
+                        "Tags": get_volume_tags(tags.get("Name", volume["VolumeId"]), Type=f"{VOLUME_TYPE_TAG}Backup"),
+                    }
+                ],
+            )
+        self._ec2_client.delete_volume(VolumeId=volume["VolumeId"])
+
+    def run(self, on_orphan=None):
+        """
+        Collect orphaned volumes, only report them in dry runs.
+
+        Arguments:
+          on_orphan: called with each orphaned volume, e.g. to report it.
+
+        Returns:
+          the number of volumes scanned, orphaned (with their total size), collected and failed.
+        """
+        report = {"scanned": 0, "orphaned": 0, "orphaned_gb": 0, "collected": 0, "failed": 0}
+        batch = []
+
+        def collect_batch():
+            for volume in batch:
+                try:
+                    self._collect(volume)
+                except ClientError as exc:
+                    logger.warning(f"Failed to collect orphaned volume {volume['VolumeId']}: {exc}")
+                    report["failed"] += 1
+                else:
+                    report["collected"] += 1
+            batch.clear()
+            time.sleep(self.batch_delay)
+
+        for volumes in self._pages():
+            report["scanned"] += len(volumes)
+            for volume in self._get_orphans(volumes):
+                report["orphaned"] += 1
+                report["orphaned_gb"] += volume["Size"]
+                if on_orphan:
+                    on_orphan(volume)
+                if self.dry_run:
+                    continue
+                batch.append(volume)
+                if len(batch) >= self.batch_size:
+                    collect_batch()
+        if batch:
+            collect_batch()
+
+        logger.info(f"Orphaned volumes{' (dry run)' if self.dry_run else ''}: {report}")
+        return report
@@ -0,0 +1,131 @@
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from urllib.parse import urlparse
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+from vcl.storage import get_artifacts_client
+
+from .resources import Deployment
+
+logger = logging.getLogger(__name__)
+
+
+def git(*args, cwd=None):
+    # Fail instead of prompting for credentials when a repo is private.
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    return subprocess.run(["git", *args], cwd=cwd, env=env, check=True, capture_output=True, text=True).stdout
+
+
+def get_private_repo_url(url):
+    # Same URL format as the init container: 'https://<access_token>:x-oauth-basic@github.com/username/project'
+    url_params = urlparse(url)
+    return url_params._replace(netloc=f"{settings.GITHUB_ACCESS_TOKEN}:x-oauth-basic@{url_params.netloc}").geturl()
+
+
+def describe_error(exc):
+    """
+    Error message safe to log, failing git commands may show the private repo URL.
+    """
+    message = (exc.stderr or str(exc)) if isinstance(exc, subprocess.CalledProcessError) else str(exc)
+    if settings.GITHUB_ACCESS_TOKEN:
+        message = message.replace(settings.GITHUB_ACCESS_TOKEN, "***")
+    return message.strip()
+
+
+class AssignmentArtifactBuilder:
+    """
+    Builds the tarball of an assignment artifact: the code repo at the artifact commit,
+    with its history replaced by a single commit and owned by the workspace user, the
+    way the init container leaves the assignment folder after cloning the repo.
+    """
+
+    def __init__(self, artifact):
+        self.artifact = artifact
+        self._s3_client = get_artifacts_client()
+
+    @staticmethod
+    def _with_private_url(func, code_repo):
+        try:
+            return func(code_repo)
+        except subprocess.CalledProcessError:
+            # Might be a private repo
+            if not settings.GITHUB_ACCESS_TOKEN:
+                raise
+            return func(get_private_repo_url(code_repo))
+
+    @classmethod
+    def get_head_commit(cls, code_repo, ref=None):
+        """
+        Commit a branch or tag of the code repo points to, its default branch by default.
+        """
+        refs = cls._with_private_url(lambda url: git("ls-remote", "--exit-code", url, ref or "HEAD"), code_repo)
+        commits = [line.split() for line in refs.splitlines()]
+        # Annotated tags are listed twice, the commit they point to is the "^{}" one.
+        for commit, name in commits:
+            if name.endswith("^{}"):
+                return commit
+        return commits[0][0]
+
+    def _checkout(self, folder):
+        """
+        Checkout the artifact commit in the folder, returns the folder of the code learners get.
+        """
+        git("init", "--quiet", folder)
+        self._with_private_url(
+            lambda url: git("fetch", "--quiet", "--depth", "1", url, self.artifact.commit, cwd=folder),
+            self.artifact.code_repo,
+        )
+        git("checkout", "--quiet", "FETCH_HEAD", cwd=folder)
+
+        # Sharing .git folder would share the git auth token, see `reset_repo` of the init container.
+        shutil.rmtree(os.path.join(folder, ".git"))
+        content = os.path.join(folder, self.artifact.code_subdirectory.strip("/"))
+        if not os.path.isdir(content):
+            raise FileNotFoundError(f"No folder '{self.artifact.code_subdirectory}' in the code repo")
+        git("init", "--quiet", content)
+        git("config", "user.name", "Workspace Committer", cwd=content)
+        git("config", "user.email", "wokspace@container.init", cwd=content)
+        git("add", "--all", cwd=content)
+        git("commit", "--quiet", "-m", "Happy coding!", cwd=content)
+        return content
+
+    @staticmethod
+    def _set_owner(tarinfo):
+        tarinfo.uid, tarinfo.gid = Deployment.WS_PUID, Deployment.WS_PGID
+        tarinfo.uname = tarinfo.gname = ""
+        return tarinfo
+
+    def build(self):
+        """
+        Build the tarball and upload it, older artifacts of the assignment are dropped once it's ready.
+        """
+        logger.info("Building artifact of assignment %s at %s", self.artifact.assignment_id, self.artifact.commit)
+        try:
+            with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryFile() as tarball:
+                content = self._checkout(os.path.join(tmp, "assignment"))
+                with tarfile.open(fileobj=tarball, mode="w:gz") as tar:
+                    tar.add(content, arcname=".", filter=self._set_owner)
+                size = tarball.tell()
+                tarball.seek(0)
+                self._s3_client.upload_fileobj(tarball, settings.WORKSPACES_ARTIFACTS_BUCKET, self.artifact.key)
+        except (subprocess.CalledProcessError, OSError, ClientError) as exc:
+            logger.warning("Failed to build artifact %s: %s", self.artifact.id, describe_error(exc))
+            self.artifact.update_status(self.artifact.Status.FAILED)
+            return
+
+        self.artifact.update_status(self.artifact.Status.READY, size=size)
+        logger.info("Artifact %s is ready (%s bytes)", self.artifact.key, size)
+
+        # Workspaces launched with an older artifact URL fall back to cloning the repo.
+        outdated = self.artifact.assignment.artifacts.filter(
+            status=self.artifact.Status.READY, created_at__lt=self.artifact.created_at
+        )
+        for artifact in outdated:
+            self._s3_client.delete_object(Bucket=settings.WORKSPACES_ARTIFACTS_BUCKET, Key=artifact.key)
+            artifact.delete()
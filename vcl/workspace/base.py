@@ -1,10 +1,10 @@
-import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
 
 from django.utils import timezone
 from django.conf import settings
-from kubernetes import config, client
+from kubernetes import config, client, watch
 
 from .resources import (
     Namespace,
@@ -15,10 +15,22 @@ from .resources import (
     ForwardAuthMiddleware,
     StripPrefixMiddleware,
 )
+from .exceptions import WorkspaceLaunchError
 from .utils import get_k8s_api_client
 
 logger = logging.getLogger(__name__)
 
+# Container waiting reasons after which a workspace won't become ready on its own.
+CONTAINER_FAILURE_REASONS = {
+    "CrashLoopBackOff",
+    "CreateContainerConfigError",
+    "CreateContainerError",
+    "ErrImagePull",
+    "ImagePullBackOff",
+    "InvalidImageName",
+    "RunContainerError",
+}
+
 if settings.APP_ENV == "DEV":
     config.load_incluster_config()
 
@@ -73,7 +85,7 @@ class Workspace:
     @property
     def status(self):
         namespace_name = self.namespace.namespace
-        pods = self._k8s_core_v1.list_namespaced_pod(namespace=namespace_name).items
+        pods = self._k8s_core_v1.list_namespaced_pod(namespace=namespace_name, label_selector="pod=workspace").items
         if pods:
             pod_status = pods[0].status
             if pod_status.container_statuses[0].ready:
@@ -85,66 +97,155 @@ class Workspace:
             f"workspace/{self.workspace_allocation.workspace_url_slug}/",
         )
 
+    @staticmethod
+    def _get_pod_failure_reason(pod):
+        """
+        Get the reason why a workspace pod can't become ready, if any.
+        """
+        if pod.status.phase == "Failed":
+            return pod.status.reason or "Failed"
+
+        for container_status in (pod.status.init_container_statuses or []) + (pod.status.container_statuses or []):
+            state = container_status.state
+            if state.waiting and state.waiting.reason in CONTAINER_FAILURE_REASONS:
+                return state.waiting.reason
+            if state.terminated and state.terminated.exit_code != 0:
+                return state.terminated.reason or "Error"
+
+    @staticmethod
+    def _is_pod_ready(pod):
+        return any(
+            condition.type == "Ready" and condition.status == "True" for condition in pod.status.conditions or []
+        )
+
+    def wait_for_readiness(self, timeout=settings.WORKSPACE_READINESS_TIMEOUT):
+        """
+        Watch the workspace pod until it's ready, fails or the timeout is reached.
+
+        Arguments:
+          timeout: deadline in seconds.
+
+        Returns:
+          "Running" as soon as the pod is ready, "Failed" otherwise.
+        """
+        namespace_name = self.namespace.namespace
+        watch_obj = watch.Watch()
+        # A watch without resourceVersion starts with the current pods, so a pod that
+        # is already ready is reported right away.
+        for event in watch_obj.stream(
+            self._k8s_core_v1.list_namespaced_pod,
+            namespace=namespace_name,
+            label_selector="pod=workspace",
+            timeout_seconds=timeout,
+            _request_timeout=timeout + 5,
+        ):
+            pod = event["object"]
+            if event["type"] == "DELETED":
+                continue
+
+            if self._is_pod_ready(pod):
+                watch_obj.stop()
+                return "Running"
+
+            if failure_reason := self._get_pod_failure_reason(pod):
+                logger.info("Workspace '%s' failed to start: %s", namespace_name, failure_reason)
+                watch_obj.stop()
+                return "Failed"
+
+        logger.info("Workspace '%s' was not ready within %d seconds.", namespace_name, timeout)
+        return "Failed"
+
     def update_ws_details_from_cluster(self, wait_for_readiness=False):
         """
         Update workspace details from the cluster.
 
         Arguments:
-          wait_for_readiness: Wait until the workspace is ready in 7 retries.
+          wait_for_readiness: Wait until the workspace is ready, see `wait_for_readiness`.
         """
 
-        def wait_for_workload_to_be_ready():
-            retries = 7
-            non_ready_statuses = [None, "Pending"]
-            ws_status = self.status
-            workspace_name = self.namespace.namespace
-            while ws_status in non_ready_statuses and retries > 0:
-                retries -= 1
-                retry_in = 0.3 * (7 - retries)
-                logger.info(
-                    "Attempt#%d: Waiting for '%s' to be ready.. Retrying in %d ms",
-                    7 - retries,
-                    workspace_name,
-                    retry_in,
-                )
-                time.sleep(retry_in)
-                ws_status = self.status
-
-                if retries == 0 and ws_status in non_ready_statuses:
-                    ws_status = "Failed"
-
-            return ws_status
-
         ws_status = None
         if wait_for_readiness:
-            ws_status = wait_for_workload_to_be_ready()
+            ws_status = self.wait_for_readiness()
 
         self._ws_details["status"] = ws_status
         self._ws_details["ws_url"] = self.get_ws_url()
         self._ws_details["last_checked_at"] = timezone.now()
         return self._ws_details
 
-    def launch(self, wait_for_readiness=False):
+    def _create_resources_concurrently(self, resources):
+        """
+        Create the given resources at the same time and report the
+        resources that failed all together.
+
+        Arguments:
+          resources: list of (resource, create kwargs) tuples.
+        """
+        # Manifests read the allocation, its relations and artifacts from the database: they are
+        # built here so that the pool threads, whose connections Django never closes, only call the API.
+        manifests = [(resource, resource._manifest, kwargs) for resource, kwargs in resources]
+        errors = {}
+        with ThreadPoolExecutor(max_workers=len(resources)) as executor:
+            futures = {
+                type(resource).__name__: executor.submit(resource.create, body=manifest, **kwargs)
+                for resource, manifest, kwargs in manifests
+            }
+            for resource_name, future in futures.items():
+                if exc := future.exception():
+                    logger.error("Failed to create %s for '%s': %s", resource_name, self.namespace.namespace, exc)
+                    errors[resource_name] = exc
+
+        if errors:
+            raise WorkspaceLaunchError(errors)
+
+    def launch(self, wait_for_readiness=False, concurrent=settings.WORKSPACES_CONCURRENT_LAUNCH):
+        """
+        Create workspace resources in the cluster.
 
+        Arguments:
+          wait_for_readiness: Wait until the workspace is ready.
+          concurrent: Create the namespace first and then all the resources
+            inside it at the same time instead of one after another.
+        """
+        middlewares_api = {"group": "traefik.containo.us", "version": "v1alpha1", "plural": "middlewares"}
+        ingress_routes_api = {"group": "traefik.containo.us", "version": "v1alpha1", "plural": "ingressroutes"}
+        resources = [
+            (self.secret, {}),
+            (self.service, {}),
+            (self.deployment, {}),
+            (self.strip_prefix_mw, middlewares_api),
+            (self.forward_auth_mw, middlewares_api),
+            (self.ingress_route, ingress_routes_api),
+        ]
+
+        # Everything else lives inside the namespace, so it has to exist first.
         self.namespace.create()
-        self.secret.create()
-        self.service.create()
-        self.deployment.create()
-        self.strip_prefix_mw.create(group="traefik.containo.us", version="v1alpha1", plural="middlewares")
-        self.forward_auth_mw.create(group="traefik.containo.us", version="v1alpha1", plural="middlewares")
-        self.ingress_route.create(group="traefik.containo.us", version="v1alpha1", plural="ingressroutes")
+        if concurrent:
+            self._create_resources_concurrently(resources)
+        else:
+            for resource, kwargs in resources:
+                resource.create(**kwargs)
 
         self.update_ws_details_from_cluster(wait_for_readiness=wait_for_readiness)
 
+    def resume(self):
+        """
+        Resume a hibernated workspace, i.e. one whose deployment was scaled
+        down to 0 replicas while keeping the rest of its resources.
+
+        Returns:
+          `False` if the workspace is gone and has to be launched again.
+        """
+        return self.deployment.resume()
+
     def delete(self, drop_namespace=False):
         """
         Delete workspace pod.
 
         Arguments:
-            drop_namespace: if set, drops the whole namespace and waits
-            until namespace deletion is done and if its not set then, this
-            just scales the workspace deployment down to 0 replicas.
+            drop_namespace: if set, starts dropping the whole namespace without
+            waiting for it to be gone and if its not set then, this just scales
+            the workspace deployment down to 0 replicas.
         """
         self.deployment.scale(replicas=0)
         if drop_namespace:
-            self.namespace.delete(wait_until_deleted=True)
+            self.namespace.delete()
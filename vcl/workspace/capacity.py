@@ -0,0 +1,160 @@
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from kubernetes import client
+from kubernetes.utils import parse_quantity
+
+logger = logging.getLogger(__name__)
+
+GiB = Decimal(2**30)
+
+
+class NodeGroupCapacity:
+    """
+    Snapshot of the free CPU, memory and GPU of the workspace node groups.
+
+    Free capacity is tracked per node, since a workspace pod has to fit on a single
+    node: allocatable resources minus the effective requests of the pods bound to it.
+    Pods that are not scheduled yet are placed on the first node of their node group
+    they fit on, like the scheduler would.
+
+    Each node group also gets `surge` extra launches that don't fit anywhere, so that
+    the cluster autoscaler sees Pending pods and adds nodes. Unscheduled pods that fit
+    nowhere use that budget up first.
+
+    Launches already admitted whose pod doesn't exist yet are placed too, so that
+    admitting launches again before their pods are created doesn't count the same free
+    capacity twice.
+    """
+
+    NODE_GROUP_LABEL = "eks.amazonaws.com/nodegroup"
+    GPU_RESOURCE = "nvidia.com/gpu"
+
+    def __init__(self, api_client=None, surge=None):
+        self._k8s_core_v1 = client.CoreV1Api(api_client=api_client)
+        self.surge = settings.WORKSPACES_LAUNCH_ADMISSION_SURGE if surge is None else surge
+        self._free = {}
+        self._surge_left = {}
+        # Workspace allocations that have a pod, as of the last refresh.
+        self.launched_allocation_ids = set()
+
+    @classmethod
+    def _to_resources(cls, quantities):
+        quantities = quantities or {}
+        return {
+            "cpu": parse_quantity(quantities.get("cpu", 0)),
+            "memory": parse_quantity(quantities.get("memory", 0)) / GiB,
+            "gpu": parse_quantity(quantities.get(cls.GPU_RESOURCE, 0)),
+        }
+
+    @classmethod
+    def _get_container_requests(cls, container):
+        resources = container.resources
+        if not resources:
+            return cls._to_resources(None)
+
+        requests = cls._to_resources(resources.requests)
+        if not requests["gpu"]:
+            # Extended resources like GPUs may only be set as limits.
+            requests["gpu"] = cls._to_resources(resources.limits)["gpu"]
+        return requests
+
+    @classmethod
+    def _get_pod_requests(cls, pod):
+        """
+        Effective requests of a pod: the highest between the sum of its containers
+        requests and the requests of any of its init containers.
+        """
+        requests = cls._to_resources(None)
+        for container in pod.spec.containers:
+            for resource, value in cls._get_container_requests(container).items():
+                requests[resource] += value
+        for container in pod.spec.init_containers or []:
+            for resource, value in cls._get_container_requests(container).items():
+                requests[resource] = max(requests[resource], value)
+        return requests
+
+    @staticmethod
+    def _is_node_schedulable(node):
+        if node.spec.unschedulable:
+            return False
+        return any(
+            condition.type == "Ready" and condition.status == "True" for condition in node.status.conditions or []
+        )
+
+    @staticmethod
+    def _fits(free, requests):
+        return all(free[resource] >= value for resource, value in requests.items())
+
+    def _place(self, node_group, requests):
+        for free in self._free.get(node_group, {}).values():
+            if self._fits(free, requests):
+                for resource, value in requests.items():
+                    free[resource] -= value
+                return True
+
+        if self._surge_left.get(node_group, self.surge) > 0:
+            self._surge_left[node_group] = self._surge_left.get(node_group, self.surge) - 1
+            return True
+        return False
+
+    def refresh(self, admitted=None):
+        """
+        Take a new snapshot of the free capacity from the cluster.
+
+        Arguments:
+          admitted: {workspace allocation id: (node group, requests)} of the admitted launches.
+        """
+        self._free = {}
+        self._surge_left = {}
+        self.launched_allocation_ids = set()
+
+        node_groups = {}
+        for node in self._k8s_core_v1.list_node().items:
+            if not self._is_node_schedulable(node):
+                continue
+            node_group = (node.metadata.labels or {}).get(self.NODE_GROUP_LABEL)
+            node_groups[node.metadata.name] = node_group
+            self._free.setdefault(node_group, {})[node.metadata.name] = self._to_resources(node.status.allocatable)
+
+        pods = self._k8s_core_v1.list_pod_for_all_namespaces(
+            field_selector="status.phase!=Succeeded,status.phase!=Failed"
+        ).items
+        pending = []
+        for pod in pods:
+            if allocation_id := (pod.metadata.labels or {}).get("workspace_allocation"):
+                self.launched_allocation_ids.add(int(allocation_id))
+            if not pod.spec.node_name:
+                pending.append(pod)
+                continue
+            if pod.spec.node_name not in node_groups:
+                continue
+            free = self._free[node_groups[pod.spec.node_name]][pod.spec.node_name]
+            for resource, value in self._get_pod_requests(pod).items():
+                free[resource] -= value
+
+        for pod in pending:
+            node_group = (pod.spec.node_selector or {}).get(self.NODE_GROUP_LABEL)
+            self._place(node_group, self._get_pod_requests(pod))
+
+        for allocation_id, (node_group, requests) in (admitted or {}).items():
+            if allocation_id not in self.launched_allocation_ids:
+                self.reserve(node_group, requests)
+
+        logger.info(
+            "Node group capacity: %s, surge left: %s",
+            {
+                node_group: {node: {r: str(v) for r, v in free.items()} for node, free in nodes.items()}
+                for node_group, nodes in self._free.items()
+            },
+            self._surge_left,
+        )
+        return self
+
+    def reserve(self, node_group, requests):
+        """
+        Reserve capacity for a workspace pod, returns False if the node group has no room for it.
+        """
+        requests = {resource: Decimal(value) for resource, value in requests.items()}
+        return self._place(node_group, requests)
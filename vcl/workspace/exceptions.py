@@ -4,3 +4,17 @@ class AppConfigError(Exception):
 
 class ManifestNotFound(AppConfigError):
     pass
+
+
+class WorkspaceLaunchError(Exception):
+    """
+    Raised when one or more workspace resources could not be created.
+
+    Attributes:
+      errors: mapping of resource name to the exception raised while creating it.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        details = ", ".join(f"{resource_name}: {exc}" for resource_name, exc in errors.items())
+        super().__init__(f"Failed to create workspace resources ({details})")
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from kubernetes import client
+
+from .resources import get_init_container_image, get_init_container_image_pull_policy
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePrePuller:
+    """
+    Keeps one DaemonSet per workspace node group that pulls the workspace images
+    onto every node of the group, so the first learner landing on a fresh node
+    doesn't wait for a multi-GB image pull.
+
+    Each image is pulled by an init container that exits right away, the pod
+    then idles on a pause container. Images that are no longer used are simply
+    left out of the DaemonSet and get garbage collected by the kubelet.
+    """
+
+    APP_LABEL = "image-prepuller"
+    IMAGES_HASH_ANNOTATION = "vcl/images-hash"
+
+    def __init__(self, namespace=None, api_client=None):
+        self.namespace = namespace or settings.WORKSPACES_IMAGE_PREPULLER_NAMESPACE
+        self._k8s_core_v1 = client.CoreV1Api(api_client=api_client)
+        self._k8s_apps_v1 = client.AppsV1Api(api_client=api_client)
+
+    @staticmethod
+    def _get_name(node_group):
+        return f"{ImagePrePuller.APP_LABEL}-{node_group}" if node_group else ImagePrePuller.APP_LABEL
+
+    @staticmethod
+    def _get_images_hash(images):
+        return hashlib.sha1(json.dumps(images).encode("utf-8")).hexdigest()
+
+    def _manifest(self, node_group, images):
+        name = self._get_name(node_group)
+        init_container_image = get_init_container_image()
+        init_containers = [
+            {
+                "name": f"prepull-{idx}",
+                "image": image,
+                "imagePullPolicy": (
+                    get_init_container_image_pull_policy() if image == init_container_image else "IfNotPresent"
+                ),
+                "command": ["sh", "-c", "exit 0"],
+                "resources": {"requests": {"cpu": "10m", "memory": "16Mi"}},
+            }
+            for idx, image in enumerate(images)
+        ]
+        pod_spec = {
+            "automountServiceAccountToken": False,
+            "initContainers": init_containers,
+            "containers": [
+                {
+                    "name": "pause",
+                    "image": settings.WORKSPACES_IMAGE_PREPULLER_PAUSE_IMAGE,
+                    "resources": {"requests": {"cpu": "1m", "memory": "8Mi"}, "limits": {"memory": "16Mi"}},
+                }
+            ],
+            # Workspace node groups, GPU ones in particular, might be tainted.
+            "tolerations": [{"operator": "Exists"}],
+        }
+        if node_group:
+            pod_spec["nodeSelector"] = {"eks.amazonaws.com/nodegroup": node_group}
+
+        return {
+            "apiVersion": "apps/v1",
+            "kind": "DaemonSet",
+            "metadata": {
+                "name": name,
+                "labels": {"app": self.APP_LABEL},
+                "annotations": {self.IMAGES_HASH_ANNOTATION: self._get_images_hash(images)},
+            },
+            "spec": {
+                "selector": {"matchLabels": {"app": name}},
+                "updateStrategy": {"type": "RollingUpdate", "rollingUpdate": {"maxUnavailable": "100%"}},
+                "template": {"metadata": {"labels": {"app": name}}, "spec": pod_spec},
+            },
+        }
+
+    def _ensure_namespace(self):
+        try:
+            self._k8s_core_v1.create_namespace(body={"metadata": {"name": self.namespace}})
+        except client.ApiException as exc:
+            if exc.status != 409:
+                raise
+
+    def sync(self, images_by_node_group):
+        """
+        Bring the pre-puller DaemonSets in line with the images used by each node group.
+
+        Arguments:
+          images_by_node_group: mapping of node group name (`None` when not targeting a
+            node group) to the images that its workspaces run.
+        """
+        self._ensure_namespace()
+        existing = {
+            daemon_set.metadata.name: daemon_set
+            for daemon_set in self._k8s_apps_v1.list_namespaced_daemon_set(
+                namespace=self.namespace, label_selector=f"app={self.APP_LABEL}"
+            ).items
+        }
+
+        for node_group, images in images_by_node_group.items():
+            images = sorted(images)
+            name = self._get_name(node_group)
+            manifest = self._manifest(node_group, images)
+            if not (daemon_set := existing.pop(name, None)):
+                logger.info("Creating image pre-puller '%s' for %d images", name, len(images))
+                self._k8s_apps_v1.create_namespaced_daemon_set(namespace=self.namespace, body=manifest)
+            elif (daemon_set.metadata.annotations or {}).get(self.IMAGES_HASH_ANNOTATION) != self._get_images_hash(
+                images
+            ):
+                logger.info("Updating image pre-puller '%s' with %d images", name, len(images))
+                self._k8s_apps_v1.replace_namespaced_daemon_set(name=name, namespace=self.namespace, body=manifest)
+
+        # Node groups without workspace images anymore.
+        for name in existing:
+            logger.info("Deleting unused image pre-puller '%s'", name)
+            self._k8s_apps_v1.delete_namespaced_daemon_set(name=name, namespace=self.namespace)
@@ -1,13 +1,13 @@
 import abc
 import json
 import logging
-import time
 from urllib.parse import urljoin
 from decimal import Decimal
 
 from django.conf import settings
 from django.urls import reverse
 from kubernetes import config, client
+from vcl_utils.sharding import SHARD_LABEL, get_shard
 
 from vcl.storage import EBSVolume
 
@@ -19,6 +19,28 @@ if settings.APP_ENV == "DEV":
     config.load_incluster_config()
 
 
+def get_init_container_image():
+    return f"{settings.DOCKER_REGISTRY}vcl_init_container:{settings.INIT_CONTAINER_TAG}"
+
+
+def get_init_container_image_pull_policy():
+    return "Never" if settings.APP_ENV == "DEV" else "Always"
+
+
+def get_init_container_command(assignment, debug=False):
+    command = ["python", "init-container.py", "--repo", str(assignment.code_repo)]
+    if assignment.code_ref:
+        command += ["--ref", assignment.code_ref]
+    if assignment.code_subdirectory:
+        command += ["--subdirectory", assignment.code_subdirectory]
+    if not assignment.shallow_clone:
+        command.append("--no-shallow")
+    if settings.WORKSPACES_CLONE_BLOB_FILTER:
+        command += ["--blob-filter", settings.WORKSPACES_CLONE_BLOB_FILTER]
+    command.append("--debug" if debug else "--no-debug")
+    return command
+
+
 class WorkspaceResource(abc.ABC):
     workspace_allocation = None
     namespace = None
@@ -37,6 +59,13 @@ class WorkspaceResource(abc.ABC):
 
         self._initialize_api_clients(api_client=api_client)
 
+    @property
+    def shard(self):
+        """
+        Shard of the workspace, telling which k8s-watcher replica watches it.
+        """
+        return str(get_shard(self.workspace_allocation.id, settings.WORKSPACES_SHARDS))
+
     def _initialize_api_clients(self, api_client):
         self._k8s_core_v1 = client.CoreV1Api(api_client=api_client)
         self._k8s_apps_v1 = client.AppsV1Api(api_client=api_client)
@@ -70,13 +99,17 @@ class WorkspaceResource(abc.ABC):
         except client.ApiException as exc:
             return __check_for_reraise(exc)
 
-    def create(self, **kwargs):
-        # create resource
-        logger.debug(f"Creating resource {type(self).__name__} with manifest {self._manifest}")
+    def create(self, body=None, **kwargs):
+        """
+        Create the resource, from `body` when its manifest is already built.
+        """
+        if body is None:
+            body = self._manifest
+        logger.debug(f"Creating resource {type(self).__name__} with manifest {body}")
         if self.namespaced:
             kwargs["namespace"] = self.namespace
 
-        result = self._skip_if_already_exists(body=self._manifest, **kwargs)
+        result = self._skip_if_already_exists(body=body, **kwargs)
         return result
 
 
@@ -90,8 +123,12 @@ class Namespace(WorkspaceResource):
             "apiVersion": "v1",
             "kind": "Namespace",
             "metadata": {
-                "label": self.namespace,
                 "name": self.namespace,
+                "labels": {
+                    "namespace": "workspace",
+                    "workspace_allocation": str(self.workspace_allocation.id),
+                    SHARD_LABEL: self.shard,
+                },
             },
         }
 
@@ -99,10 +136,14 @@ class Namespace(WorkspaceResource):
     def _api_handler(self):
         return self._k8s_core_v1.create_namespace
 
-    def delete(self, wait_until_deleted=True):
+    def delete(self):
         """
-        Delete this resource with all the resources inside
-        the namespace.
+        Start deleting this resource with all the resources inside
+        the namespace. This doesn't wait for the finalizers to complete,
+        use `exists` to find out when the namespace is gone.
+
+        Returns:
+          `False` if there is no such namespace, `True` otherwise.
         """
         try:
             self._k8s_core_v1.delete_namespace(name=self.namespace)
@@ -110,20 +151,23 @@ class Namespace(WorkspaceResource):
             exc_info = json.loads(exc.body)
             if exc_info["reason"] == "NotFound":
                 logger.info("No such workspace: '%s'", self.namespace)
-                return
+                return False
+            raise
 
-        if wait_until_deleted:
-            while True:
-                try:
-                    self._k8s_core_v1.read_namespace(name=self.namespace)
-                    logger.info("Waiting for namespace %s to terminate..", self.namespace)
-                    time.sleep(1)
-                except client.ApiException:
-                    break
+        logger.info("Removal has been started for '%s'.", self.namespace)
+        return True
 
-            logger.info("Deleted '%s' successfully.", self.namespace)
-        else:
-            logger.info("Removal has been started for '%s'.", self.namespace)
+    def exists(self):
+        """
+        Check whether the namespace is still in the cluster, terminating or not.
+        """
+        try:
+            self._k8s_core_v1.read_namespace(name=self.namespace)
+        except client.ApiException as exc:
+            if exc.status == 404:
+                return False
+            raise
+        return True
 
 
 class Secret(WorkspaceResource):
@@ -171,23 +215,42 @@ class Deployment(WorkspaceResource):
         if settings.APP_ENV != "DEV":
             self.ebs_volume = EBSVolume(workspace_allocation=kwargs["workspace_allocation"])
 
+    @staticmethod
+    def get_node_group(ws_conf):
+        """
+        Name of the node group workspaces of the given configuration are scheduled on, `None` in DEV.
+        """
+        if settings.APP_ENV == "DEV":
+            return None
+        return settings.GPU_NODE_GROUP_NAME if ws_conf.number_gpus > 0 else settings.CPU_NODE_GROUP_NAME
+
+    @staticmethod
+    def get_resource_requests(ws_conf):
+        """
+        Resources requested by the workspace pod: cpu (cores), memory (GiB) and gpu.
+        """
+        return {
+            "cpu": ws_conf.number_cpus * Decimal(settings.CPU_REQUEST_MULTIPLIER),
+            "memory": ws_conf.amount_ram * Decimal(settings.MEMORY_REQUEST_MULTIPLIER),
+            "gpu": ws_conf.number_gpus,
+        }
+
     @property
     def _manifest(self):
         ws_conf = self.workspace_allocation.workspace_configuration
         image_name = ws_conf.docker_image
 
-        num_gpus = ws_conf.number_gpus
-        cpu_request = ws_conf.number_cpus * Decimal(settings.CPU_REQUEST_MULTIPLIER)
+        requests = self.get_resource_requests(ws_conf)
+        num_gpus = requests["gpu"]
+        cpu_request = requests["cpu"]
         cpu_limit = ws_conf.number_cpus * Decimal(settings.CPU_BURST_MULTIPLIER)
-        memory_request = ws_conf.amount_ram * Decimal(settings.MEMORY_REQUEST_MULTIPLIER)
+        memory_request = requests["memory"]
         memory_limit = memory_request * Decimal(settings.MEMORY_BURST_MULTIPLIER)
 
         wa_id = str(self.workspace_allocation.id)
-        learner_id = str(self.workspace_allocation.learner.id)
+        learner_id = self.workspace_allocation.learner_label
         assignment_id = str(self.workspace_allocation.assignment.id.hex)
 
-        code_repo = str(self.workspace_allocation.assignment.code_repo)
-
         manifest = {
             "apiVersion": "apps/v1",
             "kind": "Deployment",
@@ -215,6 +278,7 @@ class Deployment(WorkspaceResource):
                             "student": learner_id,
                             "assignment": assignment_id,
                             "workspace_allocation": wa_id,
+                            SHARD_LABEL: self.shard,
                         }
                     },
                     "spec": {
@@ -274,19 +338,15 @@ class Deployment(WorkspaceResource):
                                     {"name": "WS_PGID", "value": str(self.WS_PGID)},
                                     {"name": "GH_ACCESS_TOKEN", "value": settings.GITHUB_ACCESS_TOKEN},
                                 ],
-                                "image": f"{settings.DOCKER_REGISTRY}vcl_init_container:{settings.INIT_CONTAINER_TAG}",
-                                "imagePullPolicy": "Never" if settings.APP_ENV == "DEV" else "Always",
+                                "image": get_init_container_image(),
+                                "imagePullPolicy": get_init_container_image_pull_policy(),
                                 "resources": {
                                     "requests": {"cpu": str(cpu_request), "memory": f"{memory_request}Gi"},
                                     "limits": {"cpu": str(cpu_limit), "memory": f"{memory_limit}Gi"},
                                 },
-                                "command": [
-                                    "python",
-                                    "init-container.py",
-                                    "--repo",
-                                    code_repo,
-                                    "--debug" if self.workspace_allocation.debug else "--no-debug",
-                                ],
+                                "command": get_init_container_command(
+                                    self.workspace_allocation.assignment, debug=self.workspace_allocation.debug
+                                ),
                                 "volumeMounts": [
                                     {
                                         "name": f"user-volume-{self.namespace}",
@@ -304,21 +364,34 @@ class Deployment(WorkspaceResource):
             },
         }
 
-        if settings.APP_ENV != "DEV":
-            # Target CPU node groups by default
-            manifest["spec"]["template"]["spec"]["nodeSelector"] = {
-                "eks.amazonaws.com/nodegroup": settings.CPU_NODE_GROUP_NAME
-            }
+        if node_group := self.get_node_group(ws_conf):
+            # Target the CPU or GPU node group
+            manifest["spec"]["template"]["spec"]["nodeSelector"] = {"eks.amazonaws.com/nodegroup": node_group}
             if num_gpus > 0:
-                # Target GPU node groups
-                manifest["spec"]["template"]["spec"]["nodeSelector"] = {
-                    "eks.amazonaws.com/nodegroup": settings.GPU_NODE_GROUP_NAME
-                }
                 # Add GPU resource request
                 manifest["spec"]["template"]["spec"]["containers"][0]["resources"]["limits"] = {
                     "nvidia.com/gpu": num_gpus
                 }
 
+        if artifact_env := self._get_artifact_env():
+            # Extracted instead of cloning the repo, which stays the fallback.
+            manifest["spec"]["template"]["spec"]["initContainers"][0]["env"].append(artifact_env)
+
+        if settings.WORKSPACES_GIT_MIRROR_HOST_PATH:
+            # Repo mirrors shared by the init containers of the node, workspace containers don't see them.
+            init_container = manifest["spec"]["template"]["spec"]["initContainers"][0]
+            init_container["env"] += [
+                {"name": "GIT_MIRROR_CACHE", "value": "/git-mirrors"},
+                {"name": "GIT_MIRROR_MAX_AGE", "value": str(settings.WORKSPACES_GIT_MIRROR_MAX_AGE)},
+            ]
+            init_container["volumeMounts"].append({"name": "git-mirrors", "mountPath": "/git-mirrors"})
+            manifest["spec"]["template"]["spec"]["volumes"].append(
+                {
+                    "name": "git-mirrors",
+                    "hostPath": {"path": settings.WORKSPACES_GIT_MIRROR_HOST_PATH, "type": "DirectoryOrCreate"},
+                }
+            )
+
         if self.ebs_volume:
             manifest["spec"]["template"]["spec"]["volumes"][0]["awsElasticBlockStore"] = {
                 "fsType": "ext4",
@@ -332,18 +405,75 @@ class Deployment(WorkspaceResource):
     def _api_handler(self):
         return self._k8s_apps_v1.create_namespaced_deployment
 
+    def _get_artifact_env(self):
+        """
+        Init container env var with a newly presigned URL of the assignment artifact, `None` without one.
+        """
+        if settings.WORKSPACES_ARTIFACTS_BUCKET and (artifact := self.workspace_allocation.assignment.get_artifact()):
+            return {"name": "ASSIGNMENT_ARTIFACT_URL", "value": artifact.download_url}
+
+    def relabel(self):
+        """
+        Update the learner label of the deployment and its running pods, e.g. once a
+        standby workspace is handed over to a learner. The pod template is left as is
+        since changing it would restart the workspace: a restarted pod is labelled
+        `student=standby` again, which is why messages about workspaces only identify
+        them by `workspace_allocation`.
+        """
+        labels = {"metadata": {"labels": {"student": self.workspace_allocation.learner_label}}}
+        self._k8s_apps_v1.patch_namespaced_deployment(name=self.namespace, namespace=self.namespace, body=labels)
+        pods = self._k8s_core_v1.list_namespaced_pod(
+            namespace=self.namespace, label_selector=f"workspace_allocation={self.workspace_allocation.id}"
+        ).items
+        for pod in pods:
+            self._k8s_core_v1.patch_namespaced_pod(name=pod.metadata.name, namespace=self.namespace, body=labels)
+
+    def resume(self):
+        """
+        Scale a hibernated workspace deployment back to one replica. The learner and shard
+        labels of the pod template are refreshed on the way, there is no pod to restart yet,
+        and so is the artifact URL of the init container: the one presigned at launch may
+        have expired since.
+
+        Returns:
+          `False` if the deployment is gone, `True` otherwise.
+        """
+        learner_labels = {"labels": {"student": self.workspace_allocation.learner_label}}
+        template = {"metadata": {"labels": {**learner_labels["labels"], SHARD_LABEL: self.shard}}}
+        if settings.WORKSPACES_ARTIFACTS_BUCKET:
+            # Strategic merge patch: only this env var of the init container changes.
+            artifact_env = self._get_artifact_env() or {"name": "ASSIGNMENT_ARTIFACT_URL", "$patch": "delete"}
+            template["spec"] = {"initContainers": [{"name": "init-workspace", "env": [artifact_env]}]}
+        try:
+            self._k8s_apps_v1.patch_namespaced_deployment(
+                name=self.namespace,
+                namespace=self.namespace,
+                body={"metadata": learner_labels, "spec": {"replicas": 1, "template": template}},
+            )
+        except client.ApiException as exc:
+            if exc.status == 404:
+                logger.info("No such workspace: '%s'", self.namespace)
+                return False
+            raise
+        return True
+
     def scale(self, replicas):
         """
         Scale the Workspace deployment to the specified number of replicas.
+
+        Returns:
+          `True` if the deployment was scaled, `False` if there is no such deployment.
         """
         try:
             self._k8s_apps_v1.patch_namespaced_deployment_scale(
                 name=self.namespace, namespace=self.namespace, body={"spec": {"replicas": replicas}}
             )
         except client.ApiException as exc:
-            exc_info = json.loads(exc.body)
-            if exc_info["reason"] == "NotFound":
-                logger.info("No such workspace: '%s'", self.namespace)
+            if exc.status != 404:
+                raise
+            logger.info("No such workspace: '%s'", self.namespace)
+            return False
+        return True
 
 
 class Service(WorkspaceResource):
@@ -0,0 +1,110 @@
+import logging
+
+from django.conf import settings
+from kubernetes import client
+from vcl_utils.sharding import SHARD_LABEL, get_shard
+
+logger = logging.getLogger(__name__)
+
+
+class ShardLabelBackfill:
+    """
+    Adds the shard label to the workspaces created before workspaces were sharded, which the
+    k8s-watcher replicas would not watch otherwise.
+
+    Namespaces and pods are labelled in place. The pod template of a deployment can't change
+    without restarting its pod, so only the templates of hibernated deployments are labelled,
+    unless `restart_running` is set: a running workspace whose pod is recreated, e.g. when
+    evicted, would have no shard label otherwise. Resuming a hibernated workspace labels its
+    template too.
+    """
+
+    WORKSPACE_ALLOCATION_LABEL = "workspace_allocation"
+
+    def __init__(self, api_client=None, dry_run=False, restart_running=False, shards=None):
+        self._k8s_core_v1 = client.CoreV1Api(api_client=api_client)
+        self._k8s_apps_v1 = client.AppsV1Api(api_client=api_client)
+        self.dry_run = dry_run
+        self.restart_running = restart_running
+        self.shards = settings.WORKSPACES_SHARDS if shards is None else shards
+
+    def _get_missing_shard(self, labels):
+        """
+        Shard label the resource should have, `None` if it has it already or isn't a workspace resource.
+        """
+        workspace_allocation_id = (labels or {}).get(self.WORKSPACE_ALLOCATION_LABEL)
+        if workspace_allocation_id is None:
+            return None
+        shard = str(get_shard(workspace_allocation_id, self.shards))
+        return shard if labels.get(SHARD_LABEL) != shard else None
+
+    @staticmethod
+    def _labels(shard):
+        return {"metadata": {"labels": {SHARD_LABEL: shard}}}
+
+    def _label(self, kind, resource, shard, on_label, patch, **kwargs):
+        on_label(kind, resource.metadata.namespace or resource.metadata.name, shard)
+        if self.dry_run:
+            return True
+        try:
+            patch(name=resource.metadata.name, **kwargs)
+        except client.ApiException as exc:
+            if exc.status != 404:
+                raise
+            logger.info("No such %s: '%s'", kind, resource.metadata.name)
+            return False
+        return True
+
+    def run(self, on_label=lambda kind, namespace, shard: None):
+        """
+        Label the workspace namespaces, pods and deployments missing the shard label.
+
+        Arguments:
+          on_label: `(kind, namespace, shard)` callable, called for every resource to label.
+
+        Returns:
+          A report dict with the number of resources labelled, by kind, and of running
+          deployments whose pod template was left unlabelled.
+        """
+        report = {"namespaces": 0, "pods": 0, "deployments": 0, "running": 0}
+
+        for namespace in self._k8s_core_v1.list_namespace(label_selector="namespace=workspace").items:
+            if (shard := self._get_missing_shard(namespace.metadata.labels)) is None:
+                continue
+            report["namespaces"] += self._label(
+                "namespace", namespace, shard, on_label, self._k8s_core_v1.patch_namespace, body=self._labels(shard)
+            )
+
+        for pod in self._k8s_core_v1.list_pod_for_all_namespaces(label_selector="pod=workspace").items:
+            if (shard := self._get_missing_shard(pod.metadata.labels)) is None:
+                continue
+            report["pods"] += self._label(
+                "pod",
+                pod,
+                shard,
+                on_label,
+                self._k8s_core_v1.patch_namespaced_pod,
+                namespace=pod.metadata.namespace,
+                body=self._labels(shard),
+            )
+
+        deployments = self._k8s_apps_v1.list_deployment_for_all_namespaces(
+            label_selector=self.WORKSPACE_ALLOCATION_LABEL
+        ).items
+        for deployment in deployments:
+            if (shard := self._get_missing_shard(deployment.spec.template.metadata.labels)) is None:
+                continue
+            if deployment.spec.replicas != 0 and not self.restart_running:
+                report["running"] += 1
+                continue
+            report["deployments"] += self._label(
+                "deployment",
+                deployment,
+                shard,
+                on_label,
+                self._k8s_apps_v1.patch_namespaced_deployment,
+                namespace=deployment.metadata.namespace,
+                body={"spec": {"template": self._labels(shard)}},
+            )
+
+        return report
@@ -0,0 +1,234 @@
+import logging
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.utils import timezone
+from kubernetes import client
+
+from vcl.storage import get_ec2_client, get_volume_tags
+
+from .resources import (
+    Deployment,
+    get_init_container_command,
+    get_init_container_image,
+    get_init_container_image_pull_policy,
+)
+
+logger = logging.getLogger(__name__)
+
+GOLDEN_SNAPSHOT_TYPE_TAG = "WorkspaceGoldenSnapshot"
+
+
+class GoldenSnapshotBuilder:
+    """
+    Builds the golden snapshot of an assignment, in steps so that no worker waits on it:
+
+    1. `start` creates an empty volume and a Job running the init container on it,
+       which checks the assignment code out exactly like a first launch does.
+    2. `check`, called until it returns True, snapshots the volume once the Job is
+       complete and the volume detached, then drops the build volume once the
+       snapshot is completed.
+    """
+
+    APP_LABEL = "golden-snapshot"
+
+    def __init__(
+        self,
+        golden_snapshot,
+        namespace=None,
+        api_client=None,
+        aws_region=settings.DEFAULT_AWS_REGION,
+        aws_availability_zone=settings.DEFAULT_AWS_AVAILABILITY_ZONE,
+    ):
+        self.golden_snapshot = golden_snapshot
+        self.namespace = namespace or settings.WORKSPACES_GOLDEN_SNAPSHOT_NAMESPACE
+        self.aws_availability_zone = aws_availability_zone
+        self._k8s_core_v1 = client.CoreV1Api(api_client=api_client)
+        self._k8s_batch_v1 = client.BatchV1Api(api_client=api_client)
+        self._ec2_client = get_ec2_client(aws_region)
+
+    @property
+    def _tags(self):
+        assignment_id = str(self.golden_snapshot.assignment.id)
+        return get_volume_tags(f"vcl-golden-{assignment_id}", Type=GOLDEN_SNAPSHOT_TYPE_TAG, Assignment=assignment_id)
+
+    @property
+    def _manifest(self):
+        ws_conf = self.golden_snapshot.assignment.workspace_configuration
+        node_selector = {"topology.kubernetes.io/zone": self.aws_availability_zone}
+        if node_group := Deployment.get_node_group(ws_conf):
+            node_selector["eks.amazonaws.com/nodegroup"] = node_group
+
+        return {
+            "apiVersion": "batch/v1",
+            "kind": "Job",
+            "metadata": {
+                "name": self.golden_snapshot.job_name,
+                "labels": {"app": self.APP_LABEL, "assignment": str(self.golden_snapshot.assignment.id.hex)},
+            },
+            "spec": {
+                "backoffLimit": 2,
+                "template": {
+                    "metadata": {"labels": {"app": self.APP_LABEL}},
+                    "spec": {
+                        "automountServiceAccountToken": False,
+                        "restartPolicy": "Never",
+                        "nodeSelector": node_selector,
+                        "containers": [
+                            {
+                                "name": "init-workspace",
+                                "env": [
+                                    {"name": "WS_PUID", "value": str(Deployment.WS_PUID)},
+                                    {"name": "WS_PGID", "value": str(Deployment.WS_PGID)},
+                                    {"name": "GH_ACCESS_TOKEN", "value": settings.GITHUB_ACCESS_TOKEN},
+                                ],
+                                "image": get_init_container_image(),
+                                "imagePullPolicy": get_init_container_image_pull_policy(),
+                                "command": get_init_container_command(self.golden_snapshot.assignment),
+                                # Same layout as workspace volumes.
+                                "volumeMounts": [
+                                    {"name": "golden-volume", "mountPath": "/home/coder", "subPath": "user-home"}
+                                ],
+                            }
+                        ],
+                        "volumes": [
+                            {
+                                "name": "golden-volume",
+                                "awsElasticBlockStore": {
+                                    "fsType": "ext4",
+                                    "volumeID": self.golden_snapshot.volume_id,
+                                },
+                            }
+                        ],
+                    },
+                },
+            },
+        }
+
+    def _ensure_namespace(self):
+        try:
+            self._k8s_core_v1.create_namespace(body={"metadata": {"name": self.namespace}})
+        except client.ApiException as exc:
+            if exc.status != 409:
+                raise
+
+    def _delete_job(self):
+        try:
+            self._k8s_batch_v1.delete_namespaced_job(
+                name=self.golden_snapshot.job_name, namespace=self.namespace, propagation_policy="Foreground"
+            )
+        except client.ApiException as exc:
+            if exc.status != 404:
+                raise
+
+    def start(self):
+        """
+        Create the build volume and the Job checking the assignment code out on it.
+        """
+        volume = self._ec2_client.create_volume(
+            AvailabilityZone=self.aws_availability_zone,
+            Size=self.golden_snapshot.size,
+            VolumeType="gp3",
+            TagSpecifications=[{"ResourceType": "volume", "Tags": self._tags}],
+        )
+        self.golden_snapshot.volume_id = volume["VolumeId"]
+        self.golden_snapshot.save(update_fields=["volume_id", "updated_at"])
+        self._ec2_client.get_waiter("volume_available").wait(VolumeIds=[volume["VolumeId"]])
+
+        self._ensure_namespace()
+        self._k8s_batch_v1.create_namespaced_job(namespace=self.namespace, body=self._manifest)
+        logger.info("Building golden snapshot %s on volume %s", self.golden_snapshot.id, volume["VolumeId"])
+
+    def fail(self):
+        """
+        Give the build up and drop what it created.
+        """
+        logger.warning("Golden snapshot %s failed", self.golden_snapshot.id)
+        self._delete_job()
+        if self.golden_snapshot.volume_id:
+            try:
+                self._ec2_client.delete_volume(VolumeId=self.golden_snapshot.volume_id)
+            except ClientError as exc:
+                logger.warning("Failed to delete volume %s: %s", self.golden_snapshot.volume_id, exc)
+        self.golden_snapshot.update_status(self.golden_snapshot.Status.FAILED)
+
+    def _check_job(self):
+        try:
+            job = self._k8s_batch_v1.read_namespaced_job(name=self.golden_snapshot.job_name, namespace=self.namespace)
+        except client.ApiException as exc:
+            if exc.status != 404:
+                raise
+            # Already deleted once complete, waiting for the volume to be detached.
+            job = None
+
+        if job:
+            conditions = {condition.type: condition.status for condition in job.status.conditions or []}
+            if conditions.get("Failed") == "True":
+                self.fail()
+                return True
+            if conditions.get("Complete") != "True":
+                return False
+            self._delete_job()
+
+        volume = self._ec2_client.describe_volumes(VolumeIds=[self.golden_snapshot.volume_id])["Volumes"][0]
+        if volume["State"] != "available":
+            return False
+
+        snapshot = self._ec2_client.create_snapshot(
+            VolumeId=self.golden_snapshot.volume_id,
+            Description=f"Golden snapshot of assignment {self.golden_snapshot.assignment.id}",
+            TagSpecifications=[{"ResourceType": "snapshot", "Tags": self._tags}],
+        )
+        self.golden_snapshot.update_status(self.golden_snapshot.Status.SNAPSHOTTING, snapshot_id=snapshot["SnapshotId"])
+        return False
+
+    def _check_snapshot(self):
+        snapshot = self._ec2_client.describe_snapshots(SnapshotIds=[self.golden_snapshot.snapshot_id])["Snapshots"][0]
+        if snapshot["State"] == "pending":
+            return False
+        if snapshot["State"] == "error":
+            self.fail()
+            return True
+
+        self._ec2_client.delete_volume(VolumeId=self.golden_snapshot.volume_id)
+        self.golden_snapshot.update_status(self.golden_snapshot.Status.READY)
+        logger.info("Golden snapshot %s is ready", self.golden_snapshot.snapshot_id)
+
+        # New launches stop using older snapshots right away, but a launch may have picked one
+        # already: they are only deleted by `delete_outdated_golden_snapshots` later on.
+        self.golden_snapshot.assignment.golden_snapshots.filter(
+            status=self.golden_snapshot.Status.READY, created_at__lt=self.golden_snapshot.created_at
+        ).update(status=self.golden_snapshot.Status.OUTDATED, updated_at=timezone.now())
+        return True
+
+    def check(self):
+        """
+        Move the build forward, returns True once it's over.
+        """
+        status = self.golden_snapshot.status
+        if status == self.golden_snapshot.Status.BUILDING:
+            return self._check_job()
+        if status == self.golden_snapshot.Status.SNAPSHOTTING:
+            return self._check_snapshot()
+        return True
+
+
+def delete_outdated_golden_snapshots(golden_snapshots, aws_region=settings.DEFAULT_AWS_REGION):
+    """
+    Delete the given outdated golden snapshots, and their EBS snapshot.
+
+    Returns:
+      the number of golden snapshots deleted.
+    """
+    ec2_client = get_ec2_client(aws_region)
+    deleted = 0
+    for golden_snapshot in golden_snapshots:
+        try:
+            ec2_client.delete_snapshot(SnapshotId=golden_snapshot.snapshot_id)
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] != "InvalidSnapshot.NotFound":
+                logger.warning("Failed to delete snapshot %s: %s", golden_snapshot.snapshot_id, exc)
+                continue
+        golden_snapshot.delete()
+        deleted += 1
+    return deleted
@@ -1,7 +1,7 @@
 import base64
 
 from django.conf import settings
-from vcl_utils.eks import EKSAPIClient
+from vcl_utils.eks import get_shared_eks_api_client
 
 __all__ = ["base64_encode", "get_k8s_api_client"]
 
@@ -11,8 +11,11 @@ def base64_encode(secret: str):
 
 
 def get_k8s_api_client():
+    """
+    Get the api client for the workspaces cluster, shared by all workspace code
+    in this process. In DEV, `None` makes kubernetes use the in-cluster config.
+    """
     api_client = None
     if settings.APP_ENV != "DEV":
-        eks = EKSAPIClient(settings.WORKSPACES_CLUSTER_NAME)
-        api_client = eks.api_client
+        api_client = get_shared_eks_api_client(settings.WORKSPACES_CLUSTER_NAME)
     return api_client
@@ -98,7 +98,6 @@ def check_workspaces_activity():
                 workspace_status = ws_statuses[idx]
                 workspace_meta = {
                     "assignment_id": workspace["labels"]["assignment"],
-                    "student_id": workspace["labels"]["student"],
                     "workspace_allocation_id": workspace["labels"]["workspace_allocation"],
                 }
                 if workspace_status["status"] == "alive":